@@ -0,0 +1,143 @@
+# largest overlap join of annotation text boxes to unit polygons, pure numpy
+# candidate (annotation, unit) pairs come from an STR-tree over the unit bounds; the overlap of a box with a
+# polygon is the boundary integral of x dy over the polygon edges clipped to the box, plus the two vertical box
+# sides weighted by how much of them lies inside the polygon, so every pair is evaluated without clipping rings
+
+import numpy as np
+
+import spatial_index
+import unit_filter
+
+# a runner-up unit overlapping at least this share of the best overlap makes the match ambiguous
+AMBIGUOUS_SHARE = 0.5
+# text boxes are never smaller than this, so zero-height text still lands in the unit it sits in
+MIN_TEXT_SIZE = 0.05
+
+def text_boxes(xy, heights, widths=None, n_chars=None):
+    # boxes [xmin, ymin, xmax, ymax] centered on the annotation points; the width is the text height times
+    # the width factor times the number of characters when they are known, else a square of the text height
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    height = np.maximum(np.nan_to_num(np.asarray(heights, dtype=float)), MIN_TEXT_SIZE)
+    width = height.copy()
+    if widths is not None and n_chars is not None:
+        factor = np.nan_to_num(np.asarray(widths, dtype=float), nan=1.0)
+        width = np.maximum(height * np.where(factor > 0, factor, 1.0) * np.maximum(np.asarray(n_chars), 1), MIN_TEXT_SIZE)
+    return np.column_stack((xy[:, 0] - width / 2, xy[:, 1] - height / 2, xy[:, 0] + width / 2, xy[:, 1] + height / 2))
+
+def polygon_bounds(xy, ring_offsets, ring_polygon, n_polygons):
+    vertex_polygon = np.repeat(ring_polygon, np.diff(ring_offsets))
+    bounds = np.tile([np.inf, np.inf, -np.inf, -np.inf], (n_polygons, 1))
+    for column, reduce, coordinate in ((0, np.minimum, 0), (1, np.minimum, 1), (2, np.maximum, 0), (3, np.maximum, 1)):
+        reduce.at(bounds[:, column], vertex_polygon, xy[:, coordinate])
+    return bounds
+
+def _clip_to_boxes(a, b, boxes):
+    # Liang-Barsky clipping of segments a -> b to the box on the same row, returns the clipped end points
+    d = b - a
+    t0 = np.zeros(len(a))
+    t1 = np.ones(len(a))
+    for p, q in ((-d[:, 0], a[:, 0] - boxes[:, 0]), (d[:, 0], boxes[:, 2] - a[:, 0]),
+                 (-d[:, 1], a[:, 1] - boxes[:, 1]), (d[:, 1], boxes[:, 3] - a[:, 1])):
+        parallel = p == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = q / np.where(parallel, 1.0, p)
+        t0 = np.where(~parallel & (p < 0), np.maximum(t0, r), t0)
+        t1 = np.where(~parallel & (p > 0), np.minimum(t1, r), t1)
+        # parallel and outside the slab
+        t1 = np.where(parallel & (q < 0), -1.0, t1)
+    t1 = np.maximum(t1, t0)
+    return a + t0[:, None] * d, a + t1[:, None] * d
+
+def _inside_length(a, b, x, ymin, ymax):
+    # signed length of the vertical box side x, ymin..ymax covered by the polygon, from the edges crossing it;
+    # vertices on the side count as right of it (half-open), as if the side lay just left of x
+    crosses = (a[:, 0] < x) != (b[:, 0] < x)
+    dx = np.where(crosses, b[:, 0] - a[:, 0], 1.0)
+    y_cross = a[:, 1] + (x - a[:, 0]) * (b[:, 1] - a[:, 1]) / dx
+    return np.where(crosses, np.sign(b[:, 0] - a[:, 0]) * (ymax - np.clip(y_cross, ymin, ymax)), 0.0)
+
+def ring_signs(xy, ring_offsets, ring_polygon):
+    # 1 for exterior rings and -1 for holes, from the nesting alone: a ring inside an odd number of the other
+    # rings of its polygon is a hole however it is wound
+    n_rings = len(ring_polygon)
+    ring_sizes = np.diff(ring_offsets)
+    # every (inner, outer) pair of two different rings of one polygon
+    by_polygon = np.argsort(ring_polygon, kind='stable')
+    group_start = np.searchsorted(ring_polygon[by_polygon], ring_polygon, 'left')
+    group_size = np.bincount(ring_polygon, minlength=int(ring_polygon.max(initial=-1)) + 1)[ring_polygon]
+    inner = np.repeat(np.arange(n_rings), group_size)
+    outer = by_polygon[spatial_index.expand_ranges(group_start, group_size)]
+    other = (inner != outer) & (ring_sizes[inner] > 0)
+    inner, outer = inner[other], outer[other]
+
+    # even-odd test of the first vertex of the inner ring against the edges of the outer ring
+    a, b, _ = unit_filter.ring_edges(xy, ring_offsets)
+    pair = np.repeat(np.arange(len(inner)), ring_sizes[outer])
+    edge = spatial_index.expand_ranges(ring_offsets[outer], ring_sizes[outer])
+    p = xy[ring_offsets[inner]][pair]
+    straddles = (a[edge, 1] > p[:, 1]) != (b[edge, 1] > p[:, 1])
+    dy = np.where(straddles, b[edge, 1] - a[edge, 1], 1.0)
+    x_cross = a[edge, 0] + (p[:, 1] - a[edge, 1]) * (b[edge, 0] - a[edge, 0]) / dy
+    inside = np.bincount(pair, straddles & (p[:, 0] < x_cross), minlength=len(inner)) % 2 == 1
+    depth = np.bincount(inner[inside], minlength=n_rings)
+    return np.where(depth % 2 == 0, 1.0, -1.0)
+
+def overlap_areas(boxes, box_ids, polygon_ids, xy, ring_offsets, ring_polygon):
+    # area of box box_ids[i] inside polygon polygon_ids[i], holes subtracted, any ring orientation
+    a, b, edge_ring = unit_filter.ring_edges(xy, ring_offsets)
+    # every ring counted counter-clockwise, then added as exterior or subtracted as hole
+    cross = a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1]
+    ring_orientation = np.sign(np.bincount(edge_ring, cross, minlength=len(ring_polygon)))
+    edge_weight = (ring_orientation * ring_signs(xy, ring_offsets, ring_polygon))[edge_ring]
+    edge_polygon = ring_polygon[edge_ring]
+    edge_order = np.argsort(edge_polygon, kind='stable')
+    a, b, edge_polygon, edge_weight = a[edge_order], b[edge_order], edge_polygon[edge_order], edge_weight[edge_order]
+    n_polygons = int(ring_polygon.max()) + 1 if len(ring_polygon) else 0
+    edge_start = np.searchsorted(edge_polygon, np.arange(n_polygons), 'left')
+    edge_count = np.bincount(edge_polygon, minlength=n_polygons)
+
+    counts = edge_count[polygon_ids]
+    pair = np.repeat(np.arange(len(box_ids)), counts)
+    edge = spatial_index.expand_ranges(edge_start[polygon_ids], counts)
+    box = boxes[box_ids][pair]
+    ca, cb = _clip_to_boxes(a[edge], b[edge], box)
+    # _inside_length takes points on a box side as lying right of it, so a polygon edge along the right side is
+    # already counted by that side and one along the left side is not; only the latter is integrated here
+    on_right_side = (a[edge, 0] == box[:, 2]) & (b[edge, 0] == box[:, 2])
+    integral = np.where(on_right_side, 0.0, (ca[:, 0] + cb[:, 0]) / 2 * (cb[:, 1] - ca[:, 1]))
+    integral += box[:, 2] * _inside_length(a[edge], b[edge], box[:, 2], box[:, 1], box[:, 3])
+    integral -= box[:, 0] * _inside_length(a[edge], b[edge], box[:, 0], box[:, 1], box[:, 3])
+    return np.maximum(np.bincount(pair, integral * edge_weight[edge], minlength=len(box_ids)), 0.0)
+
+def join_annotations(boxes, xy, ring_offsets, ring_polygon, n_polygons=None, ambiguous_share=AMBIGUOUS_SHARE):
+    # unit of largest overlap for every annotation box, returns a dict with
+    #   unit (-1 when the box overlaps no unit), overlap, share (of the box area), ambiguous (a close runner-up)
+    #   and unit_count (annotations matched per unit, more than one usually means duplicate labels)
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    n_polygons = int(ring_polygon.max()) + 1 if n_polygons is None and len(ring_polygon) else (n_polygons or 0)
+    unit = np.full(len(boxes), -1, dtype=np.int64)
+    overlap = np.zeros(len(boxes))
+    ambiguous = np.zeros(len(boxes), dtype=bool)
+    if len(boxes) and n_polygons:
+        tree = spatial_index.STRTree(polygon_bounds(xy, ring_offsets, ring_polygon, n_polygons))
+        box_ids, polygon_ids = tree.query(boxes)
+        area = overlap_areas(boxes, box_ids, polygon_ids, xy, ring_offsets, ring_polygon)
+
+        # largest overlap first within every box, the second row of a box is its runner-up
+        order = np.lexsort((polygon_ids, -area, box_ids))
+        box_ids, polygon_ids, area = box_ids[order], polygon_ids[order], area[order]
+        rank = np.arange(len(box_ids)) - np.searchsorted(box_ids, box_ids, 'left')
+        best = (rank == 0) & (area > 0)
+        unit[box_ids[best]] = polygon_ids[best]
+        overlap[box_ids[best]] = area[best]
+        runner_up = (rank == 1) & (area > 0)
+        ambiguous[box_ids[runner_up]] = area[runner_up] >= ambiguous_share * overlap[box_ids[runner_up]]
+
+    box_area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return {
+        'unit': unit,
+        'overlap': overlap,
+        'share': np.divide(overlap, box_area, out=np.zeros(len(boxes)), where=box_area > 0),
+        'ambiguous': ambiguous,
+        'unit_count': np.bincount(unit[unit >= 0], minlength=n_polygons),
+    }
@@ -0,0 +1,57 @@
+# declarative field rules for the feature classes derived from a floor's adjusted Annotation
+# every output copies the source rows and overrides the fields listed here; all outputs are written in the
+# same read of the source, so another annotation kind is one more entry in ANNOTATION_OUTPUTS, not another scan
+
+def constant(value):
+    def rule(row):
+        return value
+    rule.fields = ()
+    return rule
+
+def copy(field):
+    def rule(row):
+        return row[field]
+    rule.fields = (field,)
+    return rule
+
+def scale(field, factor):
+    # CAD text sizes are stored in drawing units, None stays None
+    def rule(row):
+        return None if row[field] is None else row[field] * factor
+    rule.fields = (field,)
+    return rule
+
+TEXT_SIZE_RULES = {
+    'Height': scale('Height', 1 / 1000),
+    'TxtWidth': scale('TxtWidth', 1 / 10),
+}
+
+# output name suffix -> {field: rule}
+ANNOTATION_OUTPUTS = {
+    'Annotation_Type': {
+        'Layer': constant('Annotation_Type'),
+        'TxtMemo': copy('ROOMNAME'),
+        **TEXT_SIZE_RULES,
+    },
+    'Annotation_Number': {
+        'Layer': constant('Annotation_Number'),
+        'TxtMemo': copy('RMNUMBER'),
+        **TEXT_SIZE_RULES,
+    },
+}
+
+def source_fields(outputs=ANNOTATION_OUTPUTS):
+    # fields the rules read or write, they all have to exist on the source
+    fields = set()
+    for rules in outputs.values():
+        for field, rule in rules.items():
+            fields.add(field)
+            fields.update(rule.fields)
+    return sorted(fields)
+
+def apply_rules(row, rules):
+    # derived copy of one source row (a dict of field values)
+    derived = dict(row)
+    for field, rule in rules.items():
+        derived[field] = rule(row)
+    return derived
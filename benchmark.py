@@ -0,0 +1,282 @@
+# benchmark the pure python stages on synthetic floors, no arcpy needed
+#   python benchmark.py --sizes 100 1000 10000 --save-baseline benchmark_baseline.json
+#   python benchmark.py --sizes 100 1000 10000 --baseline benchmark_baseline.json
+# a stage is reported as a regression when it is more than --tolerance times slower than the baseline
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import annotation_join
+import door_connector
+import door_openings
+import dxf_reader
+import gap_repair
+import indoors_loader
+import intermediate_store
+import level_footprint
+import noding
+import polygonize
+import routing
+import spatial_index
+import synthetic_floor
+import tiling
+import unit_filter
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+# stage name -> setup(floor), setup returns (run, item_count) and only run() is timed
+STAGES = {}
+
+def stage(name):
+    def register(setup):
+        STAGES[name] = setup
+        return setup
+    return register
+
+@stage('near_query')
+def near_query(floor):
+    line_ids, xy = synthetic_floor.floor_vertices(floor)
+    segments, segment_ids = spatial_index.polyline_segments(line_ids, xy)
+    def run():
+        return spatial_index.SegmentGrid(segments, ids=segment_ids).nearest(xy, radius=0.2, k=5)
+    return run, len(xy)
+
+@stage('gap_repair')
+def gap_repair_stage(floor):
+    near_pairs = near_query(floor)[0]()
+    from_xy = np.column_stack((near_pairs['FROM_X'], near_pairs['FROM_Y']))
+    near_xy = np.column_stack((near_pairs['NEAR_X'], near_pairs['NEAR_Y']))
+    def run():
+        return gap_repair.repair_gaps(from_xy, near_xy, near_pairs['NEAR_DIST'], near_pairs['NEAR_ANGLE'])
+    return run, len(near_pairs)
+
+@stage('dxf_read')
+def dxf_read(floor):
+    # streaming parse of the base drawing with three dropped lines per cleaning layer line
+    path = os.path.join(tempfile.mkdtemp(), 'base.dxf')
+    synthetic_floor.write_dxf(floor, path)
+    def run():
+        return dxf_reader.read_line_layers(path)
+    return run, 4 * len(floor['segments'])
+
+@stage('columnar_store')
+def columnar_store(floor):
+    # hand-off of the noded linework and its faces through memory mapped columns on disk
+    noded = noding.clean_linework(floor['segments'], floor['layers'])
+    faces = polygonize.polygonize(noded)
+    store = intermediate_store.ColumnarStore(tempfile.mkdtemp())
+    def run():
+        store.put('Noded', {'segments': noded})
+        store.put('Faces', faces)
+        return float(store.get('Noded')['segments'].sum() + store.get('Faces')['xy'].sum())
+    return run, len(noded) * 2 + len(faces['xy'])
+
+@stage('noding')
+def noding_stage(floor):
+    # raw CAD lines: snapped, deduplicated and split at every crossing and T junction
+    def run():
+        return noding.node_segments(floor['segments'])
+    return run, len(floor['segments'])
+
+@stage('clean_linework')
+def clean_linework_stage(floor):
+    def run():
+        return noding.clean_linework(floor['segments'], floor['layers'])
+    return run, len(floor['segments'])
+
+@stage('polygonize')
+def polygonize_stage(floor):
+    # closed rooms without gaps, doors or columns, which is already noded linework
+    closed = synthetic_floor.generate_floor(len(floor['rooms']), gap_fraction=0, door_fraction=0, column_fraction=0)
+    def run():
+        return polygonize.polygonize(closed['segments'])
+    return run, len(closed['segments'])
+
+@stage('tiled_units')
+def tiled_units(floor):
+    # linework, polygon and filter stages in 30 m tiles, compare with noding + polygonize + polygon_filter
+    def run():
+        return tiling.tiled_units(floor['segments'], floor['layers'], 30.0, workers=2)
+    return run, len(floor['segments'])
+
+@stage('polygon_filter')
+def polygon_filter(floor):
+    # room boxes as clockwise rings, as FeatureToPolygon writes them
+    xmin, ymin, xmax, ymax = floor['rooms'].T
+    rings = np.stack((
+        np.column_stack((xmin, ymin)), np.column_stack((xmin, ymax)),
+        np.column_stack((xmax, ymax)), np.column_stack((xmax, ymin)),
+    ), axis=1)
+    xy = rings.reshape(-1, 2)
+    ring_offsets = np.arange(len(rings) + 1) * 4
+    ring_polygon = np.arange(len(rings))
+    def run():
+        return unit_filter.classify_units(xy, ring_offsets, ring_polygon, len(rings))
+    return run, len(rings)
+
+@stage('door_pairing')
+def door_pairing(floor):
+    # pathway vertices on the 1 m lattice of GenerateIndoorPathways over the whole floor
+    xmin, ymin = floor['rooms'][:, :2].min(axis=0)
+    xmax, ymax = floor['rooms'][:, 2:].max(axis=0)
+    grid_x, grid_y = np.meshgrid(np.arange(xmin + 0.5, xmax, 1.0), np.arange(ymin + 0.5, ymax, 1.0))
+    vertices = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+    def run():
+        return door_connector.door_connectors(vertices, floor['doors'])
+    return run, len(vertices)
+
+@stage('wall_crossing')
+def wall_crossing(floor):
+    connectors = door_pairing(floor)[0]()
+    def run():
+        return door_connector.crosses_walls(connectors, floor['segments'])
+    return run, len(connectors)
+
+@stage('door_openings')
+def door_openings_stage(floor):
+    # door openings cut out of the room outlines
+    xmin, ymin, xmax, ymax = floor['rooms'].T
+    rings = np.stack((
+        np.column_stack((xmin, ymin)), np.column_stack((xmax, ymin)),
+        np.column_stack((xmax, ymax)), np.column_stack((xmin, ymax)),
+    ), axis=1)
+    xy = rings.reshape(-1, 2)
+    ring_offsets = np.arange(len(rings) + 1) * 4
+    ring_polygon = np.arange(len(rings))
+    def run():
+        return door_openings.cut_openings(xy, ring_offsets, ring_polygon, floor['doors'], len(rings))
+    return run, len(xy) + len(floor['doors'])
+
+@stage('level_footprint')
+def level_footprint_stage(floor):
+    # room boxes pulled in by up to 0.02 m on every side, united across the gaps into the level footprint
+    inset = np.random.default_rng(0).uniform(0.005, 0.02, floor['rooms'].shape) * [1, 1, -1, -1]
+    polygons = [[[(x0, y0), (x1, y0), (x1, y1), (x0, y1)]] for x0, y0, x1, y1 in (floor['rooms'] + inset).tolist()]
+    def run():
+        return level_footprint.level_footprint(polygons)
+    return run, len(polygons)
+
+@stage('routing')
+def routing_stage(floor):
+    # pathways on the 1 m lattice, one-to-many distances from 10 rooms to all rooms
+    xmin, ymin = floor['rooms'][:, :2].min(axis=0)
+    xmax, ymax = floor['rooms'][:, 2:].max(axis=0)
+    grid_x, grid_y = np.meshgrid(np.arange(xmin + 0.5, xmax, 1.0), np.arange(ymin + 0.5, ymax, 1.0))
+    ends = np.concatenate((
+        np.stack((grid_x[:, :-1], grid_y[:, :-1], grid_x[:, 1:], grid_y[:, 1:]), axis=-1).reshape(-1, 4),
+        np.stack((grid_x[:-1], grid_y[:-1], grid_x[1:], grid_y[1:]), axis=-1).reshape(-1, 4),
+    ))
+    xyz = np.column_stack((ends.reshape(-1, 2), np.zeros(2 * len(ends))))
+    graph = routing.RoutingGraph.from_pathways(np.repeat(np.arange(len(ends)), 2), xyz, np.full(len(xyz), 'L1'))
+    room_nodes = graph.nearest_nodes((floor['rooms'][:, :2] + floor['rooms'][:, 2:]) / 2)
+    def run():
+        return graph.shortest_paths(room_nodes[:10], room_nodes)
+    return run, 10 * len(room_nodes)
+
+@stage('annotation_join')
+def annotation_join_stage(floor):
+    # one room number label near the middle of every room
+    xmin, ymin, xmax, ymax = floor['rooms'].T
+    rings = np.stack((
+        np.column_stack((xmin, ymin)), np.column_stack((xmax, ymin)),
+        np.column_stack((xmax, ymax)), np.column_stack((xmin, ymax)),
+    ), axis=1)
+    centers = (floor['rooms'][:, :2] + floor['rooms'][:, 2:]) / 2
+    offsets = np.random.default_rng(0).normal(0, 0.5, centers.shape)
+    boxes = annotation_join.text_boxes(centers + offsets, np.full(len(centers), 0.3), np.ones(len(centers)), np.full(len(centers), 5))
+    xy = rings.reshape(-1, 2)
+    ring_offsets = np.arange(len(rings) + 1) * 4
+    ring_polygon = np.arange(len(rings))
+    def run():
+        return annotation_join.join_annotations(boxes, xy, ring_offsets, ring_polygon, len(rings))
+    return run, len(boxes)
+
+@stage('indoors_load')
+def indoors_load(floor):
+    # units, walls as details and a bounding level written to the file based Indoors stand-in
+    xmin, ymin, xmax, ymax = floor['rooms'].T
+    unit_polygons = [[[(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]] for x0, y0, x1, y1 in floor['rooms'].tolist()]
+    level_polygons = [[[(xmin.min(), ymin.min()), (xmax.max(), ymin.min()), (xmax.max(), ymax.max()), (xmin.min(), ymax.max()), (xmin.min(), ymin.min())]]]
+    detail_paths = [[[(x0, y0), (x1, y1)]] for x0, y0, x1, y1 in floor['segments'].tolist()]
+    names = [str(i) for i in range(len(unit_polygons))]
+    writer = indoors_loader.FileIndoorsWriter(tempfile.mkdtemp())
+    def run():
+        records = indoors_loader.floor_records('N01', level_polygons, unit_polygons, names, ['Office'] * len(names), detail_paths)
+        indoors_loader.load_floor(writer, records)
+    return run, len(unit_polygons) + len(detail_paths)
+
+def time_stage(run, repeat):
+    # best of repeat runs, then one more run under tracemalloc for the peak memory
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def run_benchmarks(sizes=DEFAULT_SIZES, stages=None, repeat=3, seed=0):
+    results = []
+    for size in sizes:
+        floor = synthetic_floor.generate_floor(size, seed=seed)
+        for name in stages or STAGES:
+            run, item_count = STAGES[name](floor)
+            seconds, peak = time_stage(run, repeat)
+            result = {
+                'stage': name,
+                'rooms': size,
+                'items': item_count,
+                'seconds': seconds,
+                'items_per_second': item_count / seconds if seconds > 0 else None,
+                'peak_memory_mb': peak / 2 ** 20,
+            }
+            print(f"{name:<20} {size:>8} rooms {item_count:>10} items {seconds:>10.4f}s "
+                  f"{result['items_per_second'] or 0:>14.0f} items/s {result['peak_memory_mb']:>9.1f} MB")
+            results.append(result)
+    return results
+
+def compare(results, baseline, tolerance=1.2):
+    # stages that got slower than tolerance times their baseline time
+    previous = {(result['stage'], result['rooms']): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['stage'], result['rooms']))
+        if before and result['seconds'] > before['seconds'] * tolerance:
+            regressions.append((result, before))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the CAD cleaning and pathway stages on synthetic floors')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='number of rooms per floor')
+    parser.add_argument('--stages', nargs='+', choices=sorted(STAGES), help='stages to run, all by default')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against a saved JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=1.2)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.stages, args.repeat, args.seed)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for result, before in regressions:
+            print(f"REGRESSION {result['stage']} at {result['rooms']} rooms: "
+                  f"{before['seconds']:.4f}s -> {result['seconds']:.4f}s")
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+# CAD layers kept by the cleaning stage, shared by clean_cad and the pure python tools
+
+# N0P not included, need to delete 'A-Roof-Otln' for higher floors
+CLEANING_LAYERS = [
+    'A-Door', 'A-Door-Head-New', 'A-Door-Jamb', 'A-Door-Jamb-New', 'A-Door-New',
+    'A-Flor-Ovhd', 'A-Flor-Wdwk-New',
+    'A-Glaz', 'A-Glaz-Jamb', 'A-Glaz-Jamb-New', 'A-Glaz-New',
+    'A-Wall', 'A-Wall-DIRTT', 'A-Wall-New', 'A-Wall-New 2', 'A-Wall-Prht', 'A-Wall-Sys-Glaz',
+    'L-Walk', 'S-Cols',
+]
+
+def layer_where_clause(layers=CLEANING_LAYERS):
+    return "Layer IN (" + ", ".join(f"'{layer}'" for layer in layers) + ")"
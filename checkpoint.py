@@ -0,0 +1,111 @@
+# content-hash checkpoints so stages whose inputs and parameters did not change are skipped on re-run
+# every floor has its own manifest file, so parallel workers never write the same file
+
+import hashlib
+import inspect
+import json
+import os
+
+def fingerprint(*parts):
+    # stable hash of strings, numbers, lists/dicts of them and numpy arrays
+    digest = hashlib.sha256()
+    for part in parts:
+        if hasattr(part, 'tobytes'):
+            digest.update(str(part.dtype).encode())
+            digest.update(part.tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+def code_fingerprint(*objects):
+    # thresholds and tool parameters are written inline in the stage functions and engine modules,
+    # so their source is part of the key and editing them reruns the stage
+    return fingerprint(*[inspect.getsource(obj) for obj in objects])
+
+def dataset_fingerprint(dataset, fields=()):
+    # order independent checksum over attribute values (e.g. the CAD Handle) and geometry of every feature
+    import arcpy
+    if not arcpy.Exists(dataset):
+        return None
+    # CAD derived feature classes do not all carry the same fields
+    available = {field.name for field in arcpy.ListFields(dataset)}
+    fields = [field for field in fields if field in available]
+    row_digests = []
+    with arcpy.da.SearchCursor(dataset, fields + ['SHAPE@WKB']) as cursor:
+        for row in cursor:
+            row_digest = hashlib.sha256()
+            for value in row:
+                row_digest.update(value if isinstance(value, (bytes, bytearray)) else str(value).encode())
+                row_digest.update(b'|')
+            row_digests.append(row_digest.digest())
+    return fingerprint(sorted(digest.hex() for digest in row_digests))
+
+def file_fingerprint(path, block_size=1 << 20):
+    # checksum of a file's bytes, read in blocks so large drawings are not loaded at once
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class TableRows:
+    # the rows one floor's stage writes into a shared table, e.g. its Levels row in the Indoors schema;
+    # the output exists while at least one row matches, so an emptied or recreated database reruns the stage
+
+    def __init__(self, table, where_clause):
+        self.table = table
+        self.where_clause = where_clause
+
+    def exists(self):
+        import arcpy
+        if not arcpy.Exists(self.table):
+            return False
+        with arcpy.da.SearchCursor(self.table, ['OID@'], where_clause=self.where_clause) as cursor:
+            return next(iter(cursor), None) is not None
+
+def output_exists(path):
+    import arcpy
+    if isinstance(path, TableRows):
+        return path.exists()
+    return os.path.exists(path) or arcpy.Exists(path)
+
+class Checkpoints:
+
+    def __init__(self, checkpoint_dir, CAD_prefix):
+        self.path = os.path.join(checkpoint_dir, f'{CAD_prefix}.json')
+        self.stages = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def is_current(self, stage, stage_fingerprint, outputs=()):
+        # skip only if the fingerprint matches and nothing the stage wrote has been deleted since
+        if self.stages.get(stage) != stage_fingerprint:
+            return False
+        return all(output_exists(output) for output in outputs)
+
+    def record(self, stage, stage_fingerprint):
+        # re-read first, another script may have recorded its own stages for this floor in the meantime
+        self.stages = self._load()
+        self.stages[stage] = stage_fingerprint
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.stages, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def invalidate(self, stage=None):
+        self.stages = self._load()
+        if stage is None:
+            self.stages.clear()
+        else:
+            self.stages.pop(stage, None)
+        if os.path.exists(self.path):
+            with open(self.path, 'w') as f:
+                json.dump(self.stages, f, indent=2, sort_keys=True)
@@ -1,264 +1,415 @@
 # create indoor dataset for Senator Burns Layer 01
 
-import arcpy
+import argparse
 import datetime
+import os
+import numpy as np
 
-# set the workspace to the default geodatabase
-default_gdb = arcpy.mp.ArcGISProject("CURRENT").defaultGeodatabase
+import cad_layers
+import checkpoint
+import dxf_reader
+import feature_io
+import floor_pool
+import gap_repair
+import instrumentation
+import intermediate_store
+import level_footprint
+import noding
+import polygonize
+import session
+import spatial_index
+import tiling
+import unit_filter
 
-# disable adding outputs to the map
-arcpy.env.addOutputsToMap = False
+# arcpy is only started by the first geoprocessing call, importing this script does not need a Pro session
+arcpy = session.LazyModule('arcpy')
+
+# the default geodatabase and the run folders next to it are set by configure() when the run starts
+current_session = None
+default_gdb = scratch_dir = checkpoint_dir = trace_dir = None
+
+# timed spans of every floor, exported as JSON and Chrome trace at the end of the run
+tracer = instrumentation.Tracer()
 
 # N0P not included
 # CAD_prefixs = ['N0b', 'N01', 'N02', 'N03', 'N04', 'N05', 'N06', 'N07', 'N08', 'N09', 'N10', 'N11', 'Nsb']
 CAD_prefixs = ['N01']
 
-# set the coordinate system to WGS_1984_Web_Mercator_Auxiliary_Sphere
-coor_system = arcpy.SpatialReference(3857)
+# keep intermediates (Lines, Lines_Dissolve, Lines_Extra, Polygons, ...) in the workspace for debugging,
+# otherwise they stay in memory and only the final Units are written
+keep_intermediates = False
+
+# clean the linework in process: noding, deduplication, gap repair and polygonization of the exported lines
+# replace Dissolve, GenerateNearTable, XYToLine, Merge, Dissolve and FeatureToPolygon
+native_linework = False
+
+# with native_linework, read the cleaning layers straight from {CAD_prefix}base.dxf in this folder (the base drawing
+# converted to DXF) instead of the imported base-Polyline feature class; None keeps the CAD import
+dxf_dir = None
+
+# with native_linework, clean and classify the linework in squares of this size (m) with an overlap of
+# tiling.TILE_MARGIN and stitch the faces crossing the seams, so memory stays bounded on podium floors and campus
+# wide base drawings; tile_workers tiles are processed side by side, None cleans the floor as one unit
+tile_size = None
+tile_workers = 4
+
+# peak python memory of every span through tracemalloc, slows the whole run down, so only for profiling
+trace_memory = False
+
+# set the coordinate system to WGS_1984_Web_Mercator_Auxiliary_Sphere, by configure()
+coor_system = None
+
+# switches above that worker processes need, they import this script with its defaults
+SETTINGS = ('keep_intermediates', 'native_linework', 'dxf_dir', 'tile_size', 'tile_workers', 'trace_memory')
+
+def current_settings():
+    return {name: globals()[name] for name in SETTINGS}
+
+def apply_settings(settings):
+    # set the switches of the run, in the parent from its arguments and in every worker before its first floor
+    unknown = sorted(set(settings) - set(SETTINGS))
+    if unknown:
+        raise ValueError(f"unknown settings: {', '.join(unknown)}")
+    globals().update(settings)
+
+def configure(gdb=None):
+    # set the workspace to the given geodatabase, INDOOR_DEFAULT_GDB (worker processes and command line runs)
+    # or the default geodatabase of the Pro project; later calls without a geodatabase keep the current one
+    global current_session, default_gdb, scratch_dir, checkpoint_dir, trace_dir, coor_system
+    if trace_memory:
+        tracer.start_memory_tracing()
+    if current_session is not None and gdb is None:
+        return current_session
+    current_session = session.Session.for_default_gdb(gdb)
+    default_gdb = current_session.default_gdb
+    scratch_dir = current_session.folder('Scratch')
+    checkpoint_dir = current_session.folder('Checkpoints')
+    trace_dir = current_session.folder('Logs')
+    # disable adding outputs to the map
+    arcpy.env.addOutputsToMap = False
+    coor_system = arcpy.SpatialReference(3857)
+    return current_session
 
 def get_current_time():
     return datetime.datetime.now().strftime('%H:%M:%S')
 
-def create_unit():
-    for CAD_prefix in CAD_prefixs:
-        CAD_polyline = CAD_prefix + 'base-Polyline'
+def base_dxf(CAD_prefix):
+    return os.path.join(dxf_dir, f'{CAD_prefix}base.dxf') if native_linework and dxf_dir else None
 
-        
-        print('***' * 30)
-        print(get_current_time(), 'file geodatabase is set to', default_gdb, ', CAD file', CAD_polyline, 'is imported.')
+def native_units(CAD_prefix, line_segments, line_layers, units, array_store, handoff=None):
+    # node and deduplicate the lines, close the gaps and node again in one in-process step, then trace
+    # the faces; the snapping to the XY resolution replaces both dissolves
+    # every stage reads its input back from the array store, memory mapped columns when they are kept on disk
+    # with a handoff store the kept units are put there instead of into units, and the column path is returned
+    array_store.put(f"{CAD_prefix}_Linework", {'segments': line_segments, 'layer': line_layers})
+    linework = array_store.get(f"{CAD_prefix}_Linework")
+    if tile_size:
+        print(get_current_time(), f'noding, repairing gaps, outputing and classifying polygons in {tile_size} m tiles')
+        faces, keep = tiling.tiled_units(linework['segments'], linework['layer'], tile_size, workers=tile_workers)
+    else:
+        print(get_current_time(), 'noding lines and repairing gaps between CAD lines')
+        array_store.put(f"{CAD_prefix}_Noded", {'segments': noding.clean_linework(linework['segments'], linework['layer'])})
 
-        # define projection
+        print(get_current_time(), 'outputing polygons from the noded lines')
+        array_store.put(f"{CAD_prefix}_Faces", polygonize.polygonize(array_store.get(f"{CAD_prefix}_Noded")['segments']))
 
-        print(get_current_time(), 'Defining the projection for the CAD line feature class as WGS_1984_Web_Mercator and WGS_1984(Z)')
-        arcpy.management.DefineProjection(
-            in_dataset=CAD_polyline,
-            coor_system=coor_system
-        )
+        print(get_current_time(), 'classifying polygons into units')
+        faces = array_store.get(f"{CAD_prefix}_Faces")
+        faces['n_polygons'] = int(faces['n_polygons'])
+        keep, _ = unit_filter.classify_units(faces['xy'], faces['ring_offsets'], faces['ring_polygon'], faces['n_polygons'])
 
-        # export selected layers into line featureclass
-        print('Exporting necessary CAD layers to line feature class: Lines')
-        arcpy.conversion.ExportFeatures(
-            in_features=CAD_polyline,
-            out_features=rf"{default_gdb}\Lines",
-            # where_clause="Layer IN ('A-Door', 'A-Door-Head-New', 'A-Door-Jamb', 'A-Door-Jamb-New', 'A-Door-New', 'A-Glaz', 'A-Glaz-Jamb', 'A-Glaz-Jamb-New', 'A-Glaz-New', 'A-Wall', 'A-Wall-DIRTT', 'A-Wall-New', 'A-Wall-New 2', 'A-Wall-Prht', 'A-Wall-Sys-Glaz', 'L-Site-Patt', 'L-Walk')",
-            where_clause="Layer IN ('A-Door', 'A-Door-Head-New', 'A-Door-Jamb', 'A-Door-Jamb-New', 'A-Door-New', 'A-Flor-Ovhd', 'A-Flor-Wdwk-New', 'A-Glaz', 'A-Glaz-Jamb', 'A-Glaz-Jamb-New', 'A-Glaz-New', 'A-Wall', 'A-Wall-DIRTT', 'A-Wall-New', 'A-Wall-New 2', 'A-Wall-Prht', 'A-Wall-Sys-Glaz', 'L-Walk', 'S-Cols')", # need to delete 'A-Roof-Otln' for higher floors 
-            
-            use_field_alias_as_name="NOT_USE_ALIAS",
-            field_mapping=f'Entity "Entity" true true false 16 Text 0 0,First,#,{CAD_polyline},Entity,0,15;Handle "Handle" true true false 16 Text 0 0,First,#,{CAD_polyline},Handle,0,15;Layer "Layer" true true false 255 Text 0 0,First,#,{CAD_polyline},Layer,0,254;LyrFrzn "LyrFrzn" true true false 2 Short 0 0,First,#,{CAD_polyline},LyrFrzn,-1,-1;LyrOn "LyrOn" true true false 2 Short 0 0,First,#,{CAD_polyline},LyrOn,-1,-1;Color "Color" true true false 2 Short 0 0,First,#,{CAD_polyline},Color,-1,-1;Linetype "Linetype" true true false 255 Text 0 0,First,#,{CAD_polyline},Linetype,0,254;Elevation "Elevation" true true false 8 Double 0 0,First,#,{CAD_polyline},Elevation,-1,-1;LineWt "LineWt" true true false 2 Short 0 0,First,#,{CAD_polyline},LineWt,-1,-1;RefName "RefName" true true false 255 Text 0 0,First,#,{CAD_polyline},RefName,0,254;DocUpdate "DocUpdate" true true false 255 Date 0 0,First,#,{CAD_polyline},DocUpdate,-1,-1;DocId "DocId" true true false 8 Double 0 0,First,#,{CAD_polyline},DocId,-1,-1;GlobalWidth "GlobalWidth" true true false 8 Double 0 0,First,#,{CAD_polyline},GlobalWidth,-1,-1;t_ "t_" true true false 255 Text 0 0,First,#,{CAD_polyline},t_,0,254;RMNUMBER "RMNUMBER" true true false 255 Text 0 0,First,#,{CAD_polyline},RMNUMBER,0,254;ROOMNAME "ROOMNAME" true true false 255 Text 0 0,First,#,{CAD_polyline},ROOMNAME,0,254',
-            sort_field=None
-        )
+    if handoff is not None:
+        print(get_current_time(), 'handing off final selected units as columns')
+        return handoff.put(f"{CAD_prefix}_Units", tiling.select_polygons(faces, np.flatnonzero(keep)))
 
-        # dissolve lines
-        
-        print(get_current_time(), 'Dissolving line feature class for better results')
-        arcpy.management.Dissolve(
-            in_features="Lines",
-            out_feature_class=rf"{default_gdb}\Lines_Dissolve",
-            dissolve_field="Layer",
-            statistics_fields=None,
-            multi_part="SINGLE_PART",
-            #unsplit_lines="UNSPLIT_LINES",
-            concatenation_separator=""
-        )
+    # enable adding outputs to the map
+    arcpy.env.addOutputsToMap = True
 
-        # dissolved lines feature vertices to points
-        
-        print(get_current_time(), 'Creating point feature class from the dissolved line feature class')
-        
-        arcpy.management.FeatureVerticesToPoints(
-            in_features="Lines_Dissolve",
-            out_feature_class=rf"{default_gdb}\Lines_Dissolve_AllPoints",
-            point_location="ALL"
-        )
+    print(get_current_time(), 'writing final selected units')
+    feature_io.write_polygons(units, polygonize.iter_polygons(faces, np.flatnonzero(keep)), coor_system)
 
-        # use Generate Near Table tool to generate nearest lines to all vertices
-        
-        print(get_current_time(), 'Generating nearest lines to all vertices')
-        arcpy.analysis.GenerateNearTable(
-            in_features="Lines_Dissolve_AllPoints",
-            near_features="Lines_Dissolve",
-            out_table=rf"{default_gdb}\Vertice_Nearest_Line_Pairs",
-            search_radius="0.2 Meters",
-            location="LOCATION",
-            angle="ANGLE",
-            closest="ALL",
-            closest_count=5,
-            method="PLANAR",
-            distance_unit="Meters"
-        )
+def create_unit(CAD_prefix, workspace=None, store=None, handoff=None, span=None):
+    CAD_polyline = rf"{default_gdb}\{CAD_prefix}base-Polyline"
 
-        # export points with distance to nearest points between 0 and 0.2m, split one point pairs to two rectangular pairs
-        print(get_current_time(), 'splitting point pairs to rectangular pairs')
-        input_table = rf"{default_gdb}\Vertice_Nearest_Line_Pairs"
-        
-        # Create a new table to store the split results
-        output_table = rf"{default_gdb}\Vertice_Nearest_Line_Pairs_Straight"
-        arcpy.management.CreateTable(out_path=rf"{default_gdb}", out_name="Vertice_Nearest_Line_Pairs_Straight")
-        
-        # Add necessary fields to the new table (same as the input table)
-        arcpy.management.AddField(output_table, "FROM_X", "DOUBLE")
-        arcpy.management.AddField(output_table, "FROM_Y", "DOUBLE")
-        arcpy.management.AddField(output_table, "NEAR_X", "DOUBLE")
-        arcpy.management.AddField(output_table, "NEAR_Y", "DOUBLE")
-        
-        # Open a search cursor to read the input table
-        with arcpy.da.SearchCursor(input_table, ['IN_FID', 'NEAR_FID', 'NEAR_DIST', 'NEAR_RANK', 'FROM_X', 'FROM_Y', 'NEAR_X', 'NEAR_Y', 'NEAR_ANGLE']) as search_cursor:
-            with arcpy.da.InsertCursor(output_table, ['FROM_X', 'FROM_Y', 'NEAR_X', 'NEAR_Y']) as insert_cursor:
-                for row in search_cursor:
-                    IN_FID, NEAR_FID, dist, rank, x1, y1, x2, y2, angle = row
-                    
-                    if dist > 0.001 and dist < 0.2:
-                        if angle in (0, 90, 180, -90, -180):
-                            insert_cursor.insertRow((x1, y1, x2, y2))
-                        else:
-                            insert_cursor.insertRow((x1, y1, x2, y1))
-                            insert_cursor.insertRow((x2, y1, x2, y2))
-        
-        # create extra lines from point pairs to repair gaps between CAD lines
-        
-        print(get_current_time(), 'creating extra lines from point pairs to repair gaps between CAD lines')
-        arcpy.management.XYToLine(
-            in_table="Vertice_Nearest_Line_Pairs_Straight",
-            out_featureclass=rf"{default_gdb}\Lines_Extra",
-            startx_field="FROM_X",
-            starty_field="FROM_Y",
-            endx_field="NEAR_X",
-            endy_field="NEAR_Y",
-            line_type="PLANAR",
-            id_field=None,
-            spatial_reference='PROJCS["WGS_1984_Web_Mercator_Auxiliary_Sphere",GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],PROJECTION["Mercator_Auxiliary_Sphere"],PARAMETER["False_Easting",0.0],PARAMETER["False_Northing",0.0],PARAMETER["Central_Meridian",0.0],PARAMETER["Standard_Parallel_1",0.0],PARAMETER["Auxiliary_Sphere_Type",0.0],UNIT["Meter",1.0]],VERTCS["WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PARAMETER["Vertical_Shift",0.0],PARAMETER["Direction",1.0],UNIT["Meter",1.0]];-20037700 -30241100 10000;-100000 10000;-100000 10000;0.001;0.001;0.001;IsHighPrecision',
-            attributes="NO_ATTRIBUTES"
-        )
+    # final units go to the given workspace (the floor's scratch gdb in parallel mode),
+    # intermediates are prefixed by floor and kept in the store
+    workspace = workspace or default_gdb
+    store = store or intermediate_store.make_store(workspace, keep_intermediates)
+    # arrays of the native linework stages, as columnar folders next to the scratch geodatabases when kept
+    array_store = intermediate_store.make_array_store(os.path.join(scratch_dir, 'Columns'), keep_intermediates)
+    lines = store.path(f"{CAD_prefix}_Lines")
+    lines_dissolve = store.path(f"{CAD_prefix}_Lines_Dissolve")
+    lines_extra = store.path(f"{CAD_prefix}_Lines_Extra")
+    lines_merge = store.path(f"{CAD_prefix}_Lines_Merge")
+    lines_merge_dissolve = store.path(f"{CAD_prefix}_Lines_Merge_Dissolve")
+    polygons = store.path(f"{CAD_prefix}_Polygons")
 
-        # merge the extra line to the original selected CAD polylines
-        
-        print(get_current_time(), 'merging the extra line to the original selected CAD polylines')
-        arcpy.management.Merge(
-            inputs="Lines;Lines_Extra",
-            output=rf"{default_gdb}\Lines_Merge",
-            field_mappings='Entity "Entity" true true false 16 Text 0 0,First,#,Lines,Entity,0,15;Handle "Handle" true true false 16 Text 0 0,First,#,Lines,Handle,0,15;Layer "Layer" true true false 255 Text 0 0,First,#,Lines,Layer,0,254;LyrFrzn "LyrFrzn" true true false 2 Short 0 0,First,#,Lines,LyrFrzn,-1,-1;LyrOn "LyrOn" true true false 2 Short 0 0,First,#,Lines,LyrOn,-1,-1;Color "Color" true true false 2 Short 0 0,First,#,Lines,Color,-1,-1;Linetype "Linetype" true true false 255 Text 0 0,First,#,Lines,Linetype,0,254;Elevation "Elevation" true true false 8 Double 0 0,First,#,Lines,Elevation,-1,-1;LineWt "LineWt" true true false 2 Short 0 0,First,#,Lines,LineWt,-1,-1;RefName "RefName" true true false 255 Text 0 0,First,#,Lines,RefName,0,254;DocUpdate "DocUpdate" true true false 8 Date 0 0,First,#,Lines,DocUpdate,-1,-1;DocId "DocId" true true false 8 Double 0 0,First,#,Lines,DocId,-1,-1;GlobalWidth "GlobalWidth" true true false 8 Double 0 0,First,#,Lines,GlobalWidth,-1,-1;t_ "t_" true true false 255 Text 0 0,First,#,Lines,t_,0,254;RMNUMBER "RMNUMBER" true true false 255 Text 0 0,First,#,Lines,RMNUMBER,0,254;ROOMNAME "ROOMNAME" true true false 255 Text 0 0,First,#,Lines,ROOMNAME,0,254;Shape_Length "Shape_Length" false true true 8 Double 0 0,First,#,Lines,Shape_Length,-1,-1,Lines_Extra,Shape_Length,-1,-1;X "X" true true false 8 Double 0 0,First,#,Lines_Extra,X,-1,-1;Y "Y" true true false 8 Double 0 0,First,#,Lines_Extra,Y,-1,-1;X_1 "X" true true false 8 Double 0 0,First,#,Lines_Extra,X_1,-1,-1;Y_1 "Y" true true false 8 Double 0 0,First,#,Lines_Extra,Y_1,-1,-1',
-            add_source="NO_SOURCE_INFO"
-        )
+    units = rf"{workspace}\{CAD_prefix}_Units"
+    print('***' * 30)
+    if base_dxf(CAD_prefix):
+        # the layer filter is applied while the drawing is parsed, no CAD import, projection or export needed
+        print(get_current_time(), 'file geodatabase is set to', workspace, ', reading CAD layers from', base_dxf(CAD_prefix))
+        line_segments, line_layers = dxf_reader.read_line_layers(base_dxf(CAD_prefix))
+        if span is not None:
+            span.set(input_count=len(line_segments))
+        units_columns = native_units(CAD_prefix, line_segments, line_layers, units, array_store, handoff)
+        array_store.clear()
+        return units_columns
 
-        # further dissolve merged lines, otherwise "invalid topology" error will occur
-        
-        print(get_current_time(), 'dissolving merged lines')
-        arcpy.management.Dissolve(
-            in_features="Lines_Merge",
-            out_feature_class=rf"{default_gdb}\{CAD_prefix}_Lines_Merge_Dissolve",
-            dissolve_field=None,
-            statistics_fields=None,
-            multi_part="SINGLE_PART",
-            unsplit_lines="UNSPLIT_LINES",
-            concatenation_separator=""
-        )
+    print(get_current_time(), 'file geodatabase is set to', workspace, ', CAD file', CAD_polyline, 'is imported.')
 
-        # output polygons from the merged lines
-        
-        print(get_current_time(), 'outputing polygons from the merged lines')
-        arcpy.management.FeatureToPolygon(
-            in_features=f"{CAD_prefix}_Lines_Merge_Dissolve",
-            out_feature_class=rf"{default_gdb}\Polygons",
-            cluster_tolerance=None,
-            attributes="ATTRIBUTES",
-            label_features=None
-        )
-        
-        # add x-extent, y-extent, and area length ratio to filter out slim polygons, set the x and y-extent thresh to 0.8m, the area length ratio thresh to 0.2
-        polygon_fc=rf"{default_gdb}\Polygons"
-        arcpy.management.AddField(polygon_fc, 'X_EXTENT', 'DOUBLE')
-        arcpy.management.AddField(polygon_fc, 'Y_EXTENT', 'DOUBLE')
-        arcpy.management.AddField(polygon_fc, "AREA_LENGTH_RATIO", "FLOAT")
+    # define projection
+
+    print(get_current_time(), 'Defining the projection for the CAD line feature class as WGS_1984_Web_Mercator and WGS_1984(Z)')
+    arcpy.management.DefineProjection(
+        in_dataset=CAD_polyline,
+        coor_system=coor_system
+    )
+
+    # export selected layers into line featureclass
+    print('Exporting necessary CAD layers to line feature class: Lines')
+    arcpy.conversion.ExportFeatures(
+        in_features=CAD_polyline,
+        out_features=lines,
+        # where_clause="Layer IN ('A-Door', 'A-Door-Head-New', 'A-Door-Jamb', 'A-Door-Jamb-New', 'A-Door-New', 'A-Glaz', 'A-Glaz-Jamb', 'A-Glaz-Jamb-New', 'A-Glaz-New', 'A-Wall', 'A-Wall-DIRTT', 'A-Wall-New', 'A-Wall-New 2', 'A-Wall-Prht', 'A-Wall-Sys-Glaz', 'L-Site-Patt', 'L-Walk')",
+        where_clause=cad_layers.layer_where_clause(), # need to delete 'A-Roof-Otln' for higher floors 
         
-        with arcpy.da.UpdateCursor(polygon_fc, ["SHAPE@", "AREA_LENGTH_RATIO", "X_EXTENT", "Y_EXTENT"]) as cursor:
-            for row in cursor:
-                # Calculate area/length and assign to the 'alr' field
-                area = row[0].area  # Area of the polygon
-                length = row[0].length  # Perimeter of the polygon
-                if length > 0:  # To avoid division by zero
-                    row[1] = area / length
-                else:
-                    row[1] = None  # Handle cases where length is zero
-                
-                # Get the extent of the polygon
-                extent = row[0].extent
-                
-                # Calculate x_extent (width) and y_extent (height)
-                x_extent = extent.width
-                y_extent = extent.height
-                
-                # Update the fields with calculated values
-                row[2] = x_extent
-                row[3] = y_extent
-                cursor.updateRow(row)
-
-        # filter polygons with area larger than 1.8 square meters, for further adjustment, as final units
-        print(get_current_time(), 'filtering polygons with area larger than 1.8 square meters into Units')
-        arcpy.conversion.ExportFeatures(
-            in_features="Polygons",
-            out_features=rf"{default_gdb}\{CAD_prefix}_Unfiltered_Units",
-            where_clause="Shape_Area > 1.8 And X_EXTENT > 0.8 And Y_EXTENT > 0.8 And AREA_LENGTH_RATIO > 0.2",
-            use_field_alias_as_name="NOT_USE_ALIAS",
-            field_mapping=r'Shape_Length "Shape_Length" false true true 8 Double 0 0,First,#,C:\GIS\Capstone\SAIT_0918_RectangleExtra\SAIT_0918_RectangleExtra.gdb\Polygons,Shape_Length,-1,-1;Shape_Area "Shape_Area" false true true 8 Double 0 0,First,#,C:\GIS\Capstone\SAIT_0918_RectangleExtra\SAIT_0918_RectangleExtra.gdb\Polygons,Shape_Area,-1,-1;X_EXTENT "X_EXTENT" true true false 8 Double 0 0,First,#,C:\GIS\Capstone\SAIT_0918_RectangleExtra\SAIT_0918_RectangleExtra.gdb\Polygons,X_EXTENT,-1,-1;Y_EXTENT "Y_EXTENT" true true false 8 Double 0 0,First,#,C:\GIS\Capstone\SAIT_0918_RectangleExtra\SAIT_0918_RectangleExtra.gdb\Polygons,Y_EXTENT,-1,-1;AREA_LENGTH_RATIO "AREA_LENGTH_RATIO" true true false 4 Float 0 0,First,#,C:\GIS\Capstone\SAIT_0918_RectangleExtra\SAIT_0918_RectangleExtra.gdb\Polygons,AREA_LENGTH_RATIO,-1,-1',
-            sort_field=None
-        )
+        use_field_alias_as_name="NOT_USE_ALIAS",
+        field_mapping=f'Entity "Entity" true true false 16 Text 0 0,First,#,{CAD_polyline},Entity,0,15;Handle "Handle" true true false 16 Text 0 0,First,#,{CAD_polyline},Handle,0,15;Layer "Layer" true true false 255 Text 0 0,First,#,{CAD_polyline},Layer,0,254;LyrFrzn "LyrFrzn" true true false 2 Short 0 0,First,#,{CAD_polyline},LyrFrzn,-1,-1;LyrOn "LyrOn" true true false 2 Short 0 0,First,#,{CAD_polyline},LyrOn,-1,-1;Color "Color" true true false 2 Short 0 0,First,#,{CAD_polyline},Color,-1,-1;Linetype "Linetype" true true false 255 Text 0 0,First,#,{CAD_polyline},Linetype,0,254;Elevation "Elevation" true true false 8 Double 0 0,First,#,{CAD_polyline},Elevation,-1,-1;LineWt "LineWt" true true false 2 Short 0 0,First,#,{CAD_polyline},LineWt,-1,-1;RefName "RefName" true true false 255 Text 0 0,First,#,{CAD_polyline},RefName,0,254;DocUpdate "DocUpdate" true true false 255 Date 0 0,First,#,{CAD_polyline},DocUpdate,-1,-1;DocId "DocId" true true false 8 Double 0 0,First,#,{CAD_polyline},DocId,-1,-1;GlobalWidth "GlobalWidth" true true false 8 Double 0 0,First,#,{CAD_polyline},GlobalWidth,-1,-1;t_ "t_" true true false 255 Text 0 0,First,#,{CAD_polyline},t_,0,254;RMNUMBER "RMNUMBER" true true false 255 Text 0 0,First,#,{CAD_polyline},RMNUMBER,0,254;ROOMNAME "ROOMNAME" true true false 255 Text 0 0,First,#,{CAD_polyline},ROOMNAME,0,254',
+        sort_field=None
+    )
 
-        print(get_current_time(), 'creating central point from Unfiltered_Units')
-        arcpy.management.FeatureToPoint(
-            in_features=rf"{default_gdb}\{CAD_prefix}_Unfiltered_Units",
-            out_feature_class=rf"{default_gdb}\{CAD_prefix}_Central_Point"
-        )
+    if native_linework:
+        line_segments, line_layers = feature_io.read_line_layers(lines)
+        units_columns = native_units(CAD_prefix, line_segments, line_layers, units, array_store, handoff)
+        array_store.clear()
+        store.clear()
+        return units_columns
 
-        print(get_current_time(), 'selecting polygons that contain their own central point')
-        arcpy.management.SelectLayerByLocation(
-            in_layer=rf"{default_gdb}\{CAD_prefix}_Unfiltered_Units",
-            overlap_type="CONTAINS",
-            select_features=rf"{default_gdb}\{CAD_prefix}_Central_Point",
-            search_distance=None,
-            selection_type="NEW_SELECTION"
-        )
+    # dissolve lines
+    
+    print(get_current_time(), 'Dissolving line feature class for better results')
+    arcpy.management.Dissolve(
+        in_features=lines,
+        out_feature_class=lines_dissolve,
+        dissolve_field="Layer",
+        statistics_fields=None,
+        multi_part="SINGLE_PART",
+        #unsplit_lines="UNSPLIT_LINES",
+        concatenation_separator=""
+    )
 
-        
-        print(get_current_time(), 'creating feature layer for Unfiltered_Units')
-        arcpy.management.MakeFeatureLayer(
-            in_features=rf"{default_gdb}\{CAD_prefix}_Unfiltered_Units",
-            out_layer="Unfiltered_Units_Layer"
-        )
+    # dissolved lines feature vertices and segments, read in one pass
+    
+    print(get_current_time(), 'Reading vertices and segments of the dissolved line feature class')
+    line_xy, line_segments, line_ids = feature_io.read_line_segments(lines_dissolve)
 
-        print(get_current_time(), 'selecting polygons that contain their own central point')
-        arcpy.management.SelectLayerByLocation(
-            in_layer="Unfiltered_Units_Layer",
-            overlap_type="CONTAINS",
-            select_features=rf"{default_gdb}\{CAD_prefix}_Central_Point",
-            search_distance=None,
-            selection_type="NEW_SELECTION"
-        )
+    # query nearest lines to all vertices from an in-process grid index instead of GenerateNearTable
+    
+    print(get_current_time(), 'Generating nearest lines to all vertices')
+    near_pairs = spatial_index.SegmentGrid(line_segments, ids=line_ids).nearest(
+        line_xy,
+        radius=0.2,
+        k=5
+    )
 
-        print(get_current_time(), 'Selecting polygons with area greater than 20 square meters and AREA_LENGTH_RATIO greather than 0.3')
-        arcpy.management.SelectLayerByAttribute(
-            in_layer_or_view="Unfiltered_Units_Layer",
-            selection_type="ADD_TO_SELECTION",
-            where_clause="Shape_Area > 20 And AREA_LENGTH_RATIO > 0.3"
-        )
+    # export points with distance to nearest points between 0 and 0.2m, split one point pairs to two rectangular pairs
+    print(get_current_time(), 'splitting point pairs to rectangular pairs')
+    extra_segments = gap_repair.repair_gaps(
+        from_xy=np.column_stack((near_pairs['FROM_X'], near_pairs['FROM_Y'])),
+        near_xy=np.column_stack((near_pairs['NEAR_X'], near_pairs['NEAR_Y'])),
+        near_dist=near_pairs['NEAR_DIST'],
+        near_angle=near_pairs['NEAR_ANGLE']
+    )
+    
+    # write all split pairs in one go instead of one InsertCursor row at a time
+    straight_pairs = store.put(f"{CAD_prefix}_Vertice_Nearest_Line_Pairs_Straight", gap_repair.to_xy_table(extra_segments))
+    
+    # create extra lines from point pairs to repair gaps between CAD lines
+    
+    print(get_current_time(), 'creating extra lines from point pairs to repair gaps between CAD lines')
+    arcpy.management.XYToLine(
+        in_table=straight_pairs,
+        out_featureclass=lines_extra,
+        startx_field="FROM_X",
+        starty_field="FROM_Y",
+        endx_field="NEAR_X",
+        endy_field="NEAR_Y",
+        line_type="PLANAR",
+        id_field=None,
+        spatial_reference='PROJCS["WGS_1984_Web_Mercator_Auxiliary_Sphere",GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],PROJECTION["Mercator_Auxiliary_Sphere"],PARAMETER["False_Easting",0.0],PARAMETER["False_Northing",0.0],PARAMETER["Central_Meridian",0.0],PARAMETER["Standard_Parallel_1",0.0],PARAMETER["Auxiliary_Sphere_Type",0.0],UNIT["Meter",1.0]],VERTCS["WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PARAMETER["Vertical_Shift",0.0],PARAMETER["Direction",1.0],UNIT["Meter",1.0]];-20037700 -30241100 10000;-100000 10000;-100000 10000;0.001;0.001;0.001;IsHighPrecision',
+        attributes="NO_ATTRIBUTES"
+    )
 
-        # enable adding outputs to the map
-        arcpy.env.addOutputsToMap = True
+    # merge the extra line to the original selected CAD polylines
+    
+    print(get_current_time(), 'merging the extra line to the original selected CAD polylines')
+    arcpy.management.Merge(
+        inputs=f"{lines};{lines_extra}",
+        output=lines_merge,
+        field_mappings=f'Entity "Entity" true true false 16 Text 0 0,First,#,{lines},Entity,0,15;Handle "Handle" true true false 16 Text 0 0,First,#,{lines},Handle,0,15;Layer "Layer" true true false 255 Text 0 0,First,#,{lines},Layer,0,254;LyrFrzn "LyrFrzn" true true false 2 Short 0 0,First,#,{lines},LyrFrzn,-1,-1;LyrOn "LyrOn" true true false 2 Short 0 0,First,#,{lines},LyrOn,-1,-1;Color "Color" true true false 2 Short 0 0,First,#,{lines},Color,-1,-1;Linetype "Linetype" true true false 255 Text 0 0,First,#,{lines},Linetype,0,254;Elevation "Elevation" true true false 8 Double 0 0,First,#,{lines},Elevation,-1,-1;LineWt "LineWt" true true false 2 Short 0 0,First,#,{lines},LineWt,-1,-1;RefName "RefName" true true false 255 Text 0 0,First,#,{lines},RefName,0,254;DocUpdate "DocUpdate" true true false 8 Date 0 0,First,#,{lines},DocUpdate,-1,-1;DocId "DocId" true true false 8 Double 0 0,First,#,{lines},DocId,-1,-1;GlobalWidth "GlobalWidth" true true false 8 Double 0 0,First,#,{lines},GlobalWidth,-1,-1;t_ "t_" true true false 255 Text 0 0,First,#,{lines},t_,0,254;RMNUMBER "RMNUMBER" true true false 255 Text 0 0,First,#,{lines},RMNUMBER,0,254;ROOMNAME "ROOMNAME" true true false 255 Text 0 0,First,#,{lines},ROOMNAME,0,254;Shape_Length "Shape_Length" false true true 8 Double 0 0,First,#,{lines},Shape_Length,-1,-1,{lines_extra},Shape_Length,-1,-1;X "X" true true false 8 Double 0 0,First,#,{lines_extra},X,-1,-1;Y "Y" true true false 8 Double 0 0,First,#,{lines_extra},Y,-1,-1;X_1 "X" true true false 8 Double 0 0,First,#,{lines_extra},X_1,-1,-1;Y_1 "Y" true true false 8 Double 0 0,First,#,{lines_extra},Y_1,-1,-1',
+        add_source="NO_SOURCE_INFO"
+    )
 
-        print(get_current_time(), 'exporting final selected units')
-        arcpy.conversion.ExportFeatures(
-            in_features="Unfiltered_Units_Layer",
-            out_features=rf"{default_gdb}\{CAD_prefix}_Units",
-            use_field_alias_as_name="NOT_USE_ALIAS",
-            field_mapping='Shape_Length "Shape_Length" false true true 8 Double 0 0,First,#,Unfiltered_Units_Layer,Shape_Length,-1,-1;Shape_Area "Shape_Area" false true true 8 Double 0 0,First,#,Unfiltered_Units_Layer,Shape_Area,-1,-1;UniqueID "UniqueID" true true false 4 Long 0 0,First,#,Unfiltered_Units_Layer,UniqueID,-1,-1',
-            sort_field=None
-        )
+    # further dissolve merged lines, otherwise "invalid topology" error will occur
+    
+    print(get_current_time(), 'dissolving merged lines')
+    arcpy.management.Dissolve(
+        in_features=lines_merge,
+        out_feature_class=lines_merge_dissolve,
+        dissolve_field=None,
+        statistics_fields=None,
+        multi_part="SINGLE_PART",
+        unsplit_lines="UNSPLIT_LINES",
+        concatenation_separator=""
+    )
+
+    # output polygons from the merged lines
+    
+    print(get_current_time(), 'outputing polygons from the merged lines')
+    arcpy.management.FeatureToPolygon(
+        in_features=lines_merge_dissolve,
+        out_feature_class=polygons,
+        cluster_tolerance=None,
+        attributes="ATTRIBUTES",
+        label_features=None
+    )
+    
+    # area, perimeter, x/y extent, area length ratio and the own-centroid test for all polygons in one pass,
+    # keep polygons over 1.8 square meters, 0.8m extents and 0.2 area length ratio that contain their own centroid,
+    # or that are larger than 20 square meters with an area length ratio over 0.3
+    print(get_current_time(), 'classifying polygons into units')
+    polygon_oids, polygon_rings = feature_io.read_polygon_rings(polygons)
+    keep, _ = unit_filter.classify_units(*unit_filter.pack_polygons(polygon_rings), n_polygons=len(polygon_oids))
+
+    # enable adding outputs to the map
+    arcpy.env.addOutputsToMap = True
+
+    # the kept rings are written as they were read, no selection query over every kept OID
+    print(get_current_time(), 'writing final selected units')
+    feature_io.write_polygons(units, [polygon_rings[i] for i in np.flatnonzero(keep)], coor_system)
+    store.clear()
+
+# outputs merged back from the floor's scratch workspace, intermediates only exist there with keep_intermediates
+FLOOR_OUTPUTS = ['Lines_Merge_Dissolve', 'Polygons', 'Units']
 
-def main():
-    create_unit()
+def unit_fingerprint(CAD_prefix):
+    # CAD handles and geometry of the base polylines, plus the cleaning code, its thresholds and the switches
+    # choosing the native stages, their drawing folder and tiling
+    if base_dxf(CAD_prefix):
+        source = checkpoint.file_fingerprint(base_dxf(CAD_prefix))
+    else:
+        source = checkpoint.dataset_fingerprint(rf"{default_gdb}\{CAD_prefix}base-Polyline", ['Handle', 'Layer'])
+    return checkpoint.fingerprint(
+        source,
+        {'native_linework': native_linework, 'dxf_dir': dxf_dir, 'tile_size': tile_size},
+        checkpoint.code_fingerprint(create_unit, native_units, cad_layers, dxf_reader, gap_repair, level_footprint, noding, polygonize, spatial_index, tiling, unit_filter)
+    )
+
+def is_unit_current(CAD_prefix, fingerprint):
+    checkpoints = checkpoint.Checkpoints(checkpoint_dir, CAD_prefix)
+    if checkpoints.is_current('create_unit', fingerprint, [rf"{default_gdb}\{CAD_prefix}_Units"]):
+        print(get_current_time(), f'skipping {CAD_prefix}, CAD lines and cleaning parameters unchanged since the last run')
+        return True
+    return False
+
+def traced_create_unit(CAD_prefix, workspace=None, handoff=None):
+    workspace = workspace or default_gdb
+    # the CAD import is not read when the linework comes from the DXF, create_unit counts the segments parsed instead
+    CAD_polyline = rf"{default_gdb}\{CAD_prefix}base-Polyline"
+    input_count = None if base_dxf(CAD_prefix) else instrumentation.feature_count([CAD_polyline])
+    with tracer.span('create_unit', CAD_prefix, input_count=input_count) as span:
+        units_columns = create_unit(CAD_prefix, workspace, handoff=handoff, span=span)
+        if units_columns:
+            span.set(output_count=int(intermediate_store.read_columns(units_columns)['n_polygons']))
+        else:
+            span.set(output_count=instrumentation.feature_count([rf"{workspace}\{CAD_prefix}_Units"]))
+    return units_columns
+
+def export_trace():
+    os.makedirs(trace_dir, exist_ok=True)
+    run_name = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    tracer.to_json(os.path.join(trace_dir, f'clean_cad_spans_{run_name}.json'))
+    tracer.to_chrome_trace(os.path.join(trace_dir, f'clean_cad_trace_{run_name}.json'))
+
+def create_floor_unit(CAD_prefix):
+    # worker entry point: clean one floor inside its own scratch geodatabase, None if the floor is unchanged;
+    # units of the native stages come back as a columnar folder instead of a feature class to copy
+    configure()
+    fingerprint = unit_fingerprint(CAD_prefix)
+    if is_unit_current(CAD_prefix, fingerprint):
+        return None
+    # only the spans of this floor go back, the worker's tracer still holds those of its earlier floors
+    first_span = len(tracer.spans)
+    scratch_gdb = floor_pool.scratch_workspace(scratch_dir, CAD_prefix)
+    handoff = intermediate_store.ColumnarStore(os.path.join(scratch_dir, 'Handoff'))
+    units_columns = traced_create_unit(CAD_prefix, scratch_gdb, handoff)
+    return scratch_gdb, units_columns, fingerprint, tracer.spans[first_span:]
+
+def main(processes=1, floors=None, gdb=None, settings=None):
+    # settings: switches by name (see SETTINGS), the module values are kept for those not given
+    apply_settings(settings or {})
+    configure(gdb)
+    floors = floors or CAD_prefixs
+    if processes == 1:
+        for CAD_prefix in floors:
+            fingerprint = unit_fingerprint(CAD_prefix)
+            if is_unit_current(CAD_prefix, fingerprint):
+                continue
+            traced_create_unit(CAD_prefix)
+            checkpoint.Checkpoints(checkpoint_dir, CAD_prefix).record('create_unit', fingerprint)
+    else:
+        # floors are cleaned side by side, then their outputs are copied into the default gdb one by one
+        results = floor_pool.run_floors(
+            create_floor_unit,
+            floors,
+            processes=processes,
+            env=current_session.environment(),
+            initializer=apply_settings,
+            initargs=(current_settings(),)
+        )
+        # the workers keep their handoff columns, the parent drops them once they are in the default gdb
+        handoff = intermediate_store.ColumnarStore(os.path.join(scratch_dir, 'Handoff'), keep=keep_intermediates)
+        for CAD_prefix, result, error_message in results:
+            if error_message:
+                print(get_current_time(), f'Error creating units for {CAD_prefix}: {error_message}')
+                continue
+            if result is None:
+                continue
+            scratch_gdb, units_columns, fingerprint, spans = result
+            tracer.extend(spans)
+            print(get_current_time(), f'merging units of {CAD_prefix} into', default_gdb)
+            names = FLOOR_OUTPUTS
+            if units_columns:
+                # memory mapped columns written straight into the default gdb, no scratch feature class in between
+                units = intermediate_store.read_columns(units_columns)
+                units['n_polygons'] = int(units['n_polygons'])
+                feature_io.write_polygons(rf"{default_gdb}\{CAD_prefix}_Units", polygonize.iter_polygons(units), coor_system)
+                del units
+                handoff.remove(os.path.basename(units_columns))
+                names = [name for name in FLOOR_OUTPUTS if name != 'Units']
+            floor_pool.copy_outputs(scratch_gdb, default_gdb, [f'{CAD_prefix}_{name}' for name in names])
+            checkpoint.Checkpoints(checkpoint_dir, CAD_prefix).record('create_unit', fingerprint)
+    export_trace()
     print('process finished')
 
-main()
-# use largest overlap to spatial join room units and annotations (exported)
+if __name__ == '__main__':
+    # python clean_cad.py --gdb D:\SAIT\N.gdb --floors N01 N02 --processes 2 --native-linework --tile-size 200
+    parser = argparse.ArgumentParser(description='Clean the CAD lines of every floor into unit polygons')
+    parser.add_argument('--gdb', help='geodatabase with the imported {floor}base-Polyline, the Pro project default when omitted')
+    parser.add_argument('--floors', nargs='+', default=CAD_prefixs)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--keep-intermediates', action=argparse.BooleanOptionalAction, default=keep_intermediates,
+                        help='keep the intermediate feature classes and columns for inspection')
+    parser.add_argument('--native-linework', action=argparse.BooleanOptionalAction, default=native_linework,
+                        help='clean the linework in process instead of with the geoprocessing tools')
+    parser.add_argument('--dxf-dir', default=dxf_dir, help='with --native-linework, read {floor}base.dxf from this folder')
+    parser.add_argument('--tile-size', type=float, default=tile_size, help='with --native-linework, clean in tiles of this size (m)')
+    parser.add_argument('--tile-workers', type=int, default=tile_workers, help='tiles cleaned side by side')
+    parser.add_argument('--trace-memory', action=argparse.BooleanOptionalAction, default=trace_memory,
+                        help='record the peak python memory of every stage, slows the run down')
+    args = parser.parse_args()
+    main(args.processes, args.floors, args.gdb, {name: getattr(args, name) for name in SETTINGS})
 
 
 
@@ -0,0 +1,87 @@
+# connectors between prelim pathway vertices around doors, pure numpy
+# replaces FeatureVerticesToPoints, SpatialJoin WITHIN_A_DISTANCE Doors_All, the Join_Count > 0 export,
+# DeleteIdentical and the self GenerateNearTable in create_pathways
+
+import numpy as np
+
+import spatial_index
+
+# SpatialJoin search radius around the doors
+DOOR_RADIUS = 1.0
+# DeleteIdentical xy tolerance
+DEDUP_TOLERANCE = 0.01
+# GenerateNearTable search radius and closest_count
+PAIR_RADIUS = 1.3
+PAIR_COUNT = 10
+
+def door_adjacent(points, door_segments, radius=DOOR_RADIUS):
+    # mask of the points within radius of any door line
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    adjacent = np.zeros(len(points), dtype=bool)
+    if len(points) and len(door_segments):
+        near_doors = spatial_index.SegmentGrid(door_segments, cell_size=radius).nearest(points, radius=radius, k=1)
+        adjacent[near_doors['IN_FID']] = True
+    return adjacent
+
+def deduplicate_points(points, tolerance=DEDUP_TOLERANCE):
+    # first point of every tolerance grid cell, in input order, like DeleteIdentical on Shape
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) == 0:
+        return points
+    cells = np.round(points / tolerance).astype(np.int64)
+    cells -= cells.min(axis=0)
+    keys = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+    _, first = np.unique(keys, return_index=True)
+    return points[np.sort(first)]
+
+def point_pairs(points, radius=PAIR_RADIUS, k=PAIR_COUNT):
+    # unordered (i, j) pairs, i < j, where j is among the k closest other points of i within radius or the reverse
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    keys = spatial_index.cell_keys(points, radius)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    # the 3 x 3 cells around every point hold all points within one cell size
+    first, second = [], []
+    for dx in (-radius, 0.0, radius):
+        for dy in (-radius, 0.0, radius):
+            neighbour_keys = spatial_index.cell_keys(points + (dx, dy), radius)
+            lo = np.searchsorted(sorted_keys, neighbour_keys, 'left')
+            counts = np.searchsorted(sorted_keys, neighbour_keys, 'right') - lo
+            first.append(np.repeat(np.arange(len(points)), counts))
+            second.append(order[spatial_index.expand_ranges(lo, counts)])
+    first, second = np.concatenate(first), np.concatenate(second)
+    distance = np.hypot(*(points[second] - points[first]).T)
+    within = (first != second) & (distance <= radius)
+    first, second, distance = first[within], second[within], distance[within]
+
+    # k closest per point, ties broken by index like the near rank
+    order = np.lexsort((second, distance, first))
+    first, second = first[order], second[order]
+    rank = np.arange(len(first)) - np.searchsorted(first, first, 'left')
+    first, second = first[rank < k], second[rank < k]
+
+    pair_keys = np.unique(np.minimum(first, second) * len(points) + np.maximum(first, second))
+    return pair_keys // len(points), pair_keys % len(points)
+
+def door_connectors(vertices, door_segments, door_radius=DOOR_RADIUS, tolerance=DEDUP_TOLERANCE,
+                    pair_radius=PAIR_RADIUS, pair_count=PAIR_COUNT):
+    # (m, 4) connector segments between the deduplicated pathway vertices near doors, each pair once
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    near_door = deduplicate_points(vertices[door_adjacent(vertices, door_segments, door_radius)], tolerance)
+    i, j = point_pairs(near_door, pair_radius, pair_count)
+    return np.hstack((near_door[i], near_door[j]))
+
+def crosses_walls(connectors, wall_segments):
+    # mask of the connectors that intersect or touch any wall segment, candidates from an STR-tree of the walls
+    connectors = np.asarray(connectors, dtype=float).reshape(-1, 4)
+    wall_segments = np.asarray(wall_segments, dtype=float).reshape(-1, 4)
+    crossing = np.zeros(len(connectors), dtype=bool)
+    if len(connectors) and len(wall_segments):
+        tree = spatial_index.STRTree(spatial_index.segment_bounds(wall_segments))
+        connector_ids, wall_ids = tree.query(spatial_index.segment_bounds(connectors))
+        hit = spatial_index.segments_intersect(connectors[connector_ids], wall_segments[wall_ids])
+        crossing[connector_ids[hit]] = True
+    return crossing
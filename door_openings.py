@@ -0,0 +1,102 @@
+# door openings cut out of the unit outlines by interval subtraction along the outline edges, pure numpy
+# a door segment lying along an edge (both end points within the tolerance of the edge line) covers the parameter
+# interval between the projections of its end points; the covered intervals of every edge are merged and
+# subtracted, so no buffer polygons are overlaid and door leaves or jambs that only touch an edge leave it whole
+
+import numpy as np
+
+import spatial_index
+import unit_filter
+
+# distance of a door from the outline edge it opens, the former Doors_Buffer distance
+OPENING_TOLERANCE = 0.05
+# wall pieces left between two openings shorter than this are dropped
+MIN_PIECE_LENGTH = 0.001
+
+def covered_intervals(edges, doors, tolerance=OPENING_TOLERANCE):
+    # (edge index, t0, t1) of every door segment lying along an edge, t from 0 to 1 along the edge
+    empty = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    if not len(edges) or not len(doors):
+        return empty
+    tree = spatial_index.STRTree(spatial_index.segment_bounds(edges) + [-tolerance, -tolerance, tolerance, tolerance])
+    door_ids, edge_ids = tree.query(spatial_index.segment_bounds(doors))
+    a = edges[edge_ids, :2]
+    direction = edges[edge_ids, 2:] - a
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    unit = direction / np.where(length > 0, length, 1.0)[:, None]
+    p = doors[door_ids, :2] - a
+    q = doors[door_ids, 2:] - a
+    offset_p = np.abs(unit[:, 0] * p[:, 1] - unit[:, 1] * p[:, 0])
+    offset_q = np.abs(unit[:, 0] * q[:, 1] - unit[:, 1] * q[:, 0])
+    t_p = np.einsum('ij,ij->i', p, unit) / np.where(length > 0, length, 1.0)
+    t_q = np.einsum('ij,ij->i', q, unit) / np.where(length > 0, length, 1.0)
+    t0 = np.clip(np.minimum(t_p, t_q), 0.0, 1.0)
+    t1 = np.clip(np.maximum(t_p, t_q), 0.0, 1.0)
+    along = (length > 0) & (offset_p <= tolerance) & (offset_q <= tolerance) & (t1 > t0)
+    return edge_ids[along], t0[along], t1[along]
+
+def merge_intervals(edge_ids, t0, t1):
+    # overlapping and touching intervals of the same edge merged, sorted by edge and start
+    order = np.lexsort((t0, edge_ids))
+    edge_ids, t0, t1 = edge_ids[order], t0[order], t1[order]
+    if not len(edge_ids):
+        return edge_ids, t0, t1
+    # t stays within [0, 1], shifting every edge by 2 keeps the running maximum inside the edge
+    reach = np.maximum.accumulate(t1 + 2 * edge_ids)
+    starts = np.flatnonzero(np.concatenate(([True], t0[1:] + 2 * edge_ids[1:] > reach[:-1])))
+    return edge_ids[starts], t0[starts], np.maximum.reduceat(t1, starts)
+
+def subtract_intervals(n_edges, edge_ids, t0, t1):
+    # (edge index, t0, t1) of the uncovered pieces of every edge, from merged intervals sorted by edge and start;
+    # on every edge a piece starts at 0 and at each interval end, and ends at each interval start and at 1
+    piece_edge = np.concatenate((np.arange(n_edges), edge_ids))
+    piece_start = np.concatenate((np.zeros(n_edges), t1))
+    piece_end = np.concatenate((t0, np.ones(n_edges)))
+    start_order = np.lexsort((piece_start, piece_edge))
+    end_order = np.lexsort((piece_end, np.concatenate((edge_ids, np.arange(n_edges)))))
+    return piece_edge[start_order], piece_start[start_order], piece_end[end_order]
+
+def cut_openings(xy, ring_offsets, ring_polygon, doors, n_polygons=None, tolerance=OPENING_TOLERANCE):
+    # wall paths of every polygon: its ring outlines with the door openings removed,
+    # a list per polygon of paths [(x, y), ...], pieces that continue over a vertex stay one path
+    n_polygons = int(ring_polygon.max()) + 1 if n_polygons is None and len(ring_polygon) else (n_polygons or 0)
+    a, b, edge_ring = unit_filter.ring_edges(xy, ring_offsets)
+    edges = np.hstack((a, b))
+    doors = np.asarray(doors, dtype=float).reshape(-1, 4)
+    covered = merge_intervals(*covered_intervals(edges, doors, tolerance))
+    piece_edge, t0, t1 = subtract_intervals(len(edges), *covered)
+    length = np.hypot(b[:, 0] - a[:, 0], b[:, 1] - a[:, 1])
+    keep = (t1 - t0) * length[piece_edge] >= MIN_PIECE_LENGTH
+    piece_edge, t0, t1 = piece_edge[keep], t0[keep], t1[keep]
+    direction = b[piece_edge] - a[piece_edge]
+    starts = (a[piece_edge] + t0[:, None] * direction).tolist()
+    ends = (a[piece_edge] + t1[:, None] * direction).tolist()
+
+    # a piece continues the previous one when it starts on the next edge of the same ring where that one ended
+    ring = edge_ring[piece_edge]
+    continues = np.zeros(len(piece_edge), dtype=bool)
+    continues[1:] = (ring[1:] == ring[:-1]) & (piece_edge[1:] == piece_edge[:-1] + 1) & (t1[:-1] == 1.0) & (t0[1:] == 0.0)
+    paths = []
+    for i in range(len(piece_edge)):
+        if continues[i]:
+            paths[-1].append(ends[i])
+        else:
+            paths.append([starts[i], ends[i]])
+
+    # the last path of a ring runs on into its first one when the outline is not opened at the ring's first vertex
+    path_first = np.flatnonzero(~continues)
+    path_last = np.append(path_first[1:], len(piece_edge)) - 1
+    path_ring = ring[path_first]
+    opens_ring = (piece_edge[path_first] == ring_offsets[:-1][path_ring]) & (t0[path_first] == 0.0)
+    closes_ring = (piece_edge[path_last] == ring_offsets[1:][path_ring] - 1) & (t1[path_last] == 1.0)
+    polygon_paths = [[] for _ in range(n_polygons)]
+    ring_start = 0
+    for k in range(len(paths)):
+        if k + 1 < len(paths) and path_ring[k + 1] == path_ring[k]:
+            continue
+        ring_paths = paths[ring_start:k + 1]
+        if len(ring_paths) > 1 and opens_ring[ring_start] and closes_ring[k]:
+            ring_paths = [ring_paths[-1] + ring_paths[0][1:]] + ring_paths[1:-1]
+        polygon_paths[ring_polygon[path_ring[k]]].extend(ring_paths)
+        ring_start = k + 1
+    return polygon_paths
@@ -0,0 +1,305 @@
+# streaming reader for drawings converted to ASCII DXF, pure python, no arcpy or CAD import needed
+# group code pairs are read one at a time and an entity is dropped as soon as its layer is known not to be
+# selected, before any of its coordinates are stored; lines are yielded in packed chunks, so memory stays
+# bounded by the chunk size and the block definitions, not by the size of the base drawing.
+# LINE, LWPOLYLINE (with bulges), POLYLINE, ARC and CIRCLE are read, arcs are densified; INSERTs expand their
+# block like the CAD import does, entities on layer 0 inside a block take the layer of the INSERT
+
+import fnmatch
+import math
+
+import numpy as np
+
+import cad_layers
+import spatial_index
+
+# lines per yielded chunk
+CHUNK_SIZE = 50000
+# largest angle between two densified arc vertices
+ARC_STEP = math.radians(10)
+# entity types that become lines, everything else (text, hatches, dimensions, ...) is skipped unread
+LINE_TYPES = {'LINE', 'LWPOLYLINE', 'POLYLINE', 'ARC', 'CIRCLE'}
+
+def read_pairs(f):
+    # (group code, value) pairs of an ASCII DXF file object
+    for code in f:
+        value = next(f, '').strip()
+        yield int(code), value
+        if value == 'EOF':
+            return
+
+def layer_selector(layers=cad_layers.CLEANING_LAYERS):
+    # case insensitive match of layer names against names or patterns like 'A-Wall*', cached per layer
+    patterns = [layer.casefold() for layer in layers]
+    selected = {}
+    def is_selected(layer):
+        if layer not in selected:
+            selected[layer] = any(fnmatch.fnmatchcase(layer.casefold(), pattern) for pattern in patterns)
+        return selected[layer]
+    return is_selected
+
+def iter_entities(pairs, is_selected):
+    # (section, block name, entity type, pairs) of every entity that can become a line, BLOCK headers and INSERTs;
+    # in the ENTITIES section, entities on layers is_selected rejects are dropped when their layer code is read.
+    # VERTEX pairs are appended to their POLYLINE behind a (0, 'VERTEX') marker
+    section = block = None
+    entity_type = None
+    current = None
+    in_polyline = False
+    for code, value in pairs:
+        if code == 0:
+            if in_polyline and value == 'VERTEX':
+                entity_type = value
+                if current is not None:
+                    current.append((0, value))
+                continue
+            if in_polyline and value == 'SEQEND':
+                entity_type = value
+                in_polyline = False
+                continue
+            if current is not None:
+                yield section, block, current_type, current
+            current = None
+            in_polyline = False
+            entity_type = value
+            if value == 'ENDSEC':
+                section = None
+            elif value == 'ENDBLK':
+                block = None
+            elif section in ('ENTITIES', 'BLOCKS') and (value in LINE_TYPES or value in ('INSERT', 'BLOCK')):
+                current_type = value
+                current = []
+                in_polyline = value == 'POLYLINE'
+            continue
+        if entity_type == 'SECTION' and code == 2:
+            section = value
+        elif entity_type == 'BLOCK' and code == 2:
+            block = value
+        if current is None:
+            continue
+        if code == 8 and section == 'ENTITIES' and entity_type in LINE_TYPES and not is_selected(value):
+            current = None
+            continue
+        current.append((code, value))
+    if current is not None:
+        yield section, block, current_type, current
+
+def _arc_points(center, radius, start, sweep):
+    n_steps = max(1, math.ceil(abs(sweep) / ARC_STEP))
+    return [
+        (center[0] + radius * math.cos(start + sweep * step / n_steps), center[1] + radius * math.sin(start + sweep * step / n_steps))
+        for step in range(n_steps + 1)
+    ]
+
+def _bulge_points(p0, p1, bulge):
+    # vertices from p0 to p1 (p0 excluded) along the arc of the given bulge, tan(sweep / 4)
+    if abs(bulge) < 1e-9:
+        return [p1]
+    sweep = 4 * math.atan(bulge)
+    dx, dy = p1[0] - p0[0], p1[1] - p0[1]
+    chord = math.hypot(dx, dy)
+    if chord == 0:
+        return [p1]
+    offset = chord / 2 / math.tan(sweep / 2)
+    center = ((p0[0] + p1[0]) / 2 - dy / chord * offset, (p0[1] + p1[1]) / 2 + dx / chord * offset)
+    points = _arc_points(center, math.hypot(p0[0] - center[0], p0[1] - center[1]), math.atan2(p0[1] - center[1], p0[0] - center[0]), sweep)
+    return points[1:-1] + [p1]
+
+def _vertex_path(vertices, closed):
+    # vertices: [x, y, bulge] in order, a closed path ends on its first vertex
+    if not vertices:
+        return []
+    if closed:
+        vertices = vertices + [vertices[0]]
+    path = [(vertices[0][0], vertices[0][1])]
+    for (x0, y0, bulge), (x1, y1, _) in zip(vertices[:-1], vertices[1:]):
+        path.extend(_bulge_points((x0, y0), (x1, y1), bulge))
+    return path
+
+def entity_lines(entity_type, pairs):
+    # handle, layer, elevation and paths [(x, y), ...] of one entity, in block coordinates for block entities
+    handle, layer, elevation, flags, extrusion = '', '0', 0.0, 0, 1.0
+    point = {}
+    vertices = []
+    in_vertex = False
+    for code, value in pairs:
+        if code == 0:
+            in_vertex = True
+            vertices.append([0.0, 0.0, 0.0, 0])
+        elif in_vertex:
+            if code in (10, 20):
+                vertices[-1][code // 10 - 1] = float(value)
+            elif code == 42:
+                vertices[-1][2] = float(value)
+            elif code == 70:
+                vertices[-1][3] = int(value)
+        elif code == 5:
+            handle = value
+        elif code == 8:
+            layer = value
+        elif code == 38:
+            elevation = float(value)
+        elif code == 70:
+            flags = int(value)
+        elif code == 230:
+            extrusion = float(value)
+        elif entity_type == 'LWPOLYLINE' and code in (10, 20, 42):
+            if code == 10:
+                vertices.append([float(value), 0.0, 0.0, 0])
+            elif vertices:
+                vertices[-1][1 if code == 20 else 2] = float(value)
+        else:
+            point.setdefault(code, float(value) if 10 <= code <= 59 else value)
+
+    if entity_type == 'LINE':
+        elevation = point.get(30, 0.0)
+        paths = [[(point.get(10, 0.0), point.get(20, 0.0)), (point.get(11, 0.0), point.get(21, 0.0))]]
+    elif entity_type == 'ARC' or entity_type == 'CIRCLE':
+        elevation = point.get(30, 0.0)
+        start = math.radians(point.get(50, 0.0)) if entity_type == 'ARC' else 0.0
+        sweep = (math.radians(point.get(51, 0.0)) - start) % (2 * math.pi) if entity_type == 'ARC' else 2 * math.pi
+        paths = [_arc_points((point.get(10, 0.0), point.get(20, 0.0)), point.get(40, 0.0), start, sweep or 2 * math.pi)]
+    elif entity_type == 'LWPOLYLINE':
+        paths = [_vertex_path([vertex[:3] for vertex in vertices], flags & 1)]
+    elif entity_type == 'POLYLINE':
+        if flags & (16 | 64):
+            # polygon and polyface meshes are not linework
+            return handle, layer, elevation, []
+        elevation = point.get(30, 0.0)
+        # spline frame control points are skipped, the fitted vertices are kept
+        paths = [_vertex_path([vertex[:3] for vertex in vertices if not vertex[3] & 16], flags & 1)]
+    else:
+        paths = []
+    # 2D entities are stored in their object coordinate system, a flipped extrusion mirrors x
+    if extrusion < 0 and entity_type != 'LINE':
+        paths = [[(-x, y) for x, y in path] for path in paths]
+    return handle, layer, elevation, [path for path in paths if len(path) > 1]
+
+def _insert(pairs):
+    values = {}
+    for code, value in pairs:
+        values.setdefault(code, value)
+    return {
+        'handle': values.get(5, ''),
+        'layer': values.get(8, '0'),
+        'block': values.get(2, ''),
+        'xyz': (float(values.get(10, 0.0)), float(values.get(20, 0.0)), float(values.get(30, 0.0))),
+        'scale': (float(values.get(41, 1.0)), float(values.get(42, 1.0))),
+        'rotation': math.radians(float(values.get(50, 0.0))),
+        'mirrored': float(values.get(230, 1.0)) < 0,
+    }
+
+class Blocks:
+    # block definitions in block coordinates, kept in memory for expanding INSERTs of the ENTITIES section
+
+    def __init__(self):
+        self.base = {}
+        self.lines = {}
+        self.inserts = {}
+        self._layers = {}
+
+    def add(self, block, entity_type, pairs):
+        if entity_type == 'BLOCK':
+            values = dict((code, value) for code, value in pairs if code in (10, 20))
+            self.base[block] = (float(values.get(10, 0.0)), float(values.get(20, 0.0)))
+        elif entity_type == 'INSERT':
+            self.inserts.setdefault(block, []).append(_insert(pairs))
+        else:
+            self.lines.setdefault(block, []).append(entity_lines(entity_type, pairs))
+
+    def layers(self, block, depth=0):
+        # layers the block can produce, '0' stands for the layer of the INSERT
+        if block not in self._layers:
+            layers = {layer for _, layer, _, _ in self.lines.get(block, [])}
+            if depth < 16:
+                for insert in self.inserts.get(block, []):
+                    nested = self.layers(insert['block'], depth + 1)
+                    layers |= {insert['layer'] for layer in nested if layer == '0'} | (nested - {'0'})
+            self._layers[block] = layers
+        return self._layers[block]
+
+    def expand(self, insert, is_selected, layer=None, depth=0):
+        # (layer, elevation, paths) of the selected lines of an INSERT in drawing coordinates
+        layer = insert['layer'] if layer is None or insert['layer'] != '0' else layer
+        if depth >= 16 or not any(is_selected(layer if block_layer == '0' else block_layer) for block_layer in self.layers(insert['block'])):
+            return
+        base_x, base_y = self.base.get(insert['block'], (0.0, 0.0))
+        (x0, y0, z0), (sx, sy) = insert['xyz'], insert['scale']
+        cos, sin = math.cos(insert['rotation']), math.sin(insert['rotation'])
+        mirror = -1.0 if insert['mirrored'] else 1.0
+        def transform(path):
+            return [(mirror * (x0 + cos * sx * (x - base_x) - sin * sy * (y - base_y)), y0 + sin * sx * (x - base_x) + cos * sy * (y - base_y)) for x, y in path]
+        for _, line_layer, elevation, paths in self.lines.get(insert['block'], []):
+            line_layer = layer if line_layer == '0' else line_layer
+            if paths and is_selected(line_layer):
+                yield line_layer, z0 + elevation, [transform(path) for path in paths]
+        for nested in self.inserts.get(insert['block'], []):
+            for line_layer, elevation, paths in self.expand(nested, is_selected, layer, depth + 1):
+                yield line_layer, z0 + elevation, [transform(path) for path in paths]
+
+def _pack(paths, handles, layers, elevations):
+    sizes = [len(path) for path in paths]
+    return {
+        'xy': np.array([point for path in paths for point in path], dtype=float).reshape(-1, 2),
+        'line_offsets': np.concatenate(([0], np.cumsum(sizes))).astype(np.int64),
+        'handle': np.array(handles, dtype=str),
+        'layer': np.array(layers, dtype=str),
+        'elevation': np.array(elevations, dtype=float),
+    }
+
+def iter_line_chunks(dxf_path, layers=cad_layers.CLEANING_LAYERS, chunk_size=CHUNK_SIZE):
+    # packed lines of the selected layers, every chunk is a dict with
+    #   xy (n, 2) vertices, line_offsets (m + 1,) into xy, and handle, layer, elevation (m,) per single part line
+    is_selected = layer_selector(layers)
+    blocks = Blocks()
+    paths, handles, line_layers, elevations = [], [], [], []
+    with open(dxf_path, encoding='utf-8', errors='replace') as f:
+        for section, block, entity_type, pairs in iter_entities(read_pairs(f), is_selected):
+            if section == 'BLOCKS':
+                blocks.add(block, entity_type, pairs)
+                continue
+            if entity_type == 'INSERT':
+                insert = _insert(pairs)
+                lines = [(insert['handle'], layer, elevation, insert_paths) for layer, elevation, insert_paths in blocks.expand(insert, is_selected)]
+            else:
+                # entities without a layer code are on layer 0
+                lines = [line for line in [entity_lines(entity_type, pairs)] if is_selected(line[1])]
+            for handle, layer, elevation, entity_paths in lines:
+                for path in entity_paths:
+                    paths.append(path)
+                    handles.append(handle)
+                    line_layers.append(layer)
+                    elevations.append(elevation)
+            if len(paths) >= chunk_size:
+                yield _pack(paths, handles, line_layers, elevations)
+                paths, handles, line_layers, elevations = [], [], [], []
+    if paths:
+        yield _pack(paths, handles, line_layers, elevations)
+
+def read_lines(dxf_path, layers=cad_layers.CLEANING_LAYERS, chunk_size=CHUNK_SIZE):
+    # all chunks of iter_line_chunks as one packed set of lines
+    chunks = list(iter_line_chunks(dxf_path, layers, chunk_size))
+    if not chunks:
+        return _pack([], [], [], [])
+    offsets = [chunks[0]['line_offsets']]
+    for chunk in chunks[1:]:
+        offsets.append(chunk['line_offsets'][1:] + offsets[-1][-1])
+    packed = {field: np.concatenate([chunk[field] for chunk in chunks]) for field in ('xy', 'handle', 'layer', 'elevation')}
+    packed['line_offsets'] = np.concatenate(offsets)
+    return packed
+
+def line_segments(lines):
+    # (n, 4) segments of packed lines and the line index of every segment
+    line_ids = np.repeat(np.arange(len(lines['line_offsets']) - 1), np.diff(lines['line_offsets']))
+    return spatial_index.polyline_segments(line_ids, lines['xy'])
+
+def read_line_layers(dxf_path, layers=cad_layers.CLEANING_LAYERS):
+    # segments of the selected layers with the Layer of their line, like clean_cad.read_line_layers
+    segments, layer_parts = [], []
+    for chunk in iter_line_chunks(dxf_path, layers):
+        chunk_segments, line_ids = line_segments(chunk)
+        segments.append(chunk_segments)
+        layer_parts.append(chunk['layer'][line_ids])
+    if not segments:
+        return np.empty((0, 4)), np.empty(0, dtype=str)
+    return np.concatenate(segments), np.concatenate(layer_parts)
@@ -0,0 +1,110 @@
+# reading and writing feature geometry as plain coordinate lists for the numpy engines
+# arcpy is imported inside the functions, like checkpoint.dataset_fingerprint
+
+import os
+
+import numpy as np
+
+import spatial_index
+
+def read_polygon_rings(polygon_fc):
+    # object ids and rings of every polygon, interior rings are separated by None inside a part
+    import arcpy
+    polygon_oids, polygon_rings = [], []
+    with arcpy.da.SearchCursor(polygon_fc, ['OID@', 'SHAPE@']) as cursor:
+        for oid, shape in cursor:
+            rings = []
+            for part in shape or []:
+                ring = []
+                for point in part:
+                    if point is None:
+                        rings.append(ring)
+                        ring = []
+                    else:
+                        ring.append((point.X, point.Y))
+                rings.append(ring)
+            polygon_oids.append(oid)
+            polygon_rings.append([ring for ring in rings if ring])
+    return polygon_oids, polygon_rings
+
+def read_line_paths(line_fc):
+    # object ids and paths of every polyline, one path per part
+    import arcpy
+    line_oids, line_paths = [], []
+    with arcpy.da.SearchCursor(line_fc, ['OID@', 'SHAPE@']) as cursor:
+        for oid, shape in cursor:
+            paths = [[(point.X, point.Y) for point in part if point is not None] for part in shape or []]
+            line_oids.append(oid)
+            line_paths.append([path for path in paths if len(path) > 1])
+    return line_oids, line_paths
+
+def read_line_segments(line_fc):
+    # exploded vertices, and the segments between consecutive vertices of every single part line
+    import arcpy
+    line_vertices = arcpy.da.FeatureClassToNumPyArray(
+        in_table=line_fc,
+        field_names=['OID@', 'SHAPE@XY'],
+        explode_to_points=True
+    )
+    line_segments, line_ids = spatial_index.polyline_segments(line_vertices['OID@'], line_vertices['SHAPE@XY'])
+    return line_vertices['SHAPE@XY'], line_segments, line_ids
+
+def read_line_layers(line_fc):
+    # segments of every line with the Layer of the line they belong to
+    import arcpy
+    line_vertices = arcpy.da.FeatureClassToNumPyArray(
+        in_table=line_fc,
+        field_names=['OID@', 'SHAPE@XY', 'Layer'],
+        explode_to_points=True
+    )
+    line_segments, line_ids = spatial_index.polyline_segments(line_vertices['OID@'], line_vertices['SHAPE@XY'])
+    oids, first = np.unique(line_vertices['OID@'], return_index=True)
+    return line_segments, line_vertices['Layer'][first][np.searchsorted(oids, line_ids)]
+
+def write_lines(line_fc, segments, spatial_reference):
+    # new polyline feature class with one two-point line per segment
+    import arcpy
+    if arcpy.Exists(line_fc):
+        arcpy.management.Delete(line_fc)
+    arcpy.management.CreateFeatureclass(
+        out_path=os.path.dirname(line_fc),
+        out_name=os.path.basename(line_fc),
+        geometry_type="POLYLINE",
+        spatial_reference=spatial_reference
+    )
+    with arcpy.da.InsertCursor(line_fc, ['SHAPE@']) as cursor:
+        for x1, y1, x2, y2 in segments:
+            cursor.insertRow([arcpy.Polyline(arcpy.Array([arcpy.Point(x1, y1), arcpy.Point(x2, y2)]))])
+
+def write_polygons(polygon_fc, polygon_rings, spatial_reference):
+    # new polygon feature class from lists of (n, 2) ring arrays
+    import arcpy
+    if arcpy.Exists(polygon_fc):
+        arcpy.management.Delete(polygon_fc)
+    arcpy.management.CreateFeatureclass(
+        out_path=os.path.dirname(polygon_fc),
+        out_name=os.path.basename(polygon_fc),
+        geometry_type="POLYGON",
+        spatial_reference=spatial_reference
+    )
+    with arcpy.da.InsertCursor(polygon_fc, ['SHAPE@']) as cursor:
+        for rings in polygon_rings:
+            parts = arcpy.Array([arcpy.Array([arcpy.Point(x, y) for x, y in ring]) for ring in rings])
+            cursor.insertRow([arcpy.Polygon(parts, spatial_reference)])
+
+def write_paths(line_fc, line_paths, spatial_reference):
+    # new polyline feature class with one multipart line per list of paths, empty lists are not written
+    import arcpy
+    if arcpy.Exists(line_fc):
+        arcpy.management.Delete(line_fc)
+    arcpy.management.CreateFeatureclass(
+        out_path=os.path.dirname(line_fc),
+        out_name=os.path.basename(line_fc),
+        geometry_type="POLYLINE",
+        spatial_reference=spatial_reference
+    )
+    with arcpy.da.InsertCursor(line_fc, ['SHAPE@']) as cursor:
+        for paths in line_paths:
+            if paths:
+                parts = arcpy.Array([arcpy.Array([arcpy.Point(x, y) for x, y in path]) for path in paths])
+                cursor.insertRow([arcpy.Polyline(parts, spatial_reference)])
@@ -0,0 +1,78 @@
+# run per-floor stages in a process pool, every floor writes to its own scratch file geodatabase
+# outputs are copied back into the shared geodatabase by the parent process, one floor at a time
+
+import multiprocessing
+import os
+import sys
+import contextlib
+import traceback
+
+def scratch_workspace(scratch_dir, CAD_prefix):
+    # one file geodatabase per floor, so workers never hold locks on the same workspace
+    import arcpy
+    os.makedirs(scratch_dir, exist_ok=True)
+    gdb_name = f'{CAD_prefix}_Scratch.gdb'
+    scratch_gdb = os.path.join(scratch_dir, gdb_name)
+    if not arcpy.Exists(scratch_gdb):
+        arcpy.management.CreateFileGDB(out_folder_path=scratch_dir, out_name=gdb_name)
+    return scratch_gdb
+
+def copy_outputs(source_workspace, target_workspace, names):
+    # overwrite the named datasets in the target with the ones from the scratch workspace
+    import arcpy
+    for name in names:
+        source = os.path.join(source_workspace, name)
+        target = os.path.join(target_workspace, name)
+        if not arcpy.Exists(source):
+            continue
+        if arcpy.Exists(target):
+            arcpy.management.Delete(target)
+        arcpy.management.Copy(source, target)
+
+def delete_outputs(workspace, names):
+    # drop the named datasets, e.g. outputs of an earlier run that the current switches no longer produce
+    import arcpy
+    for name in names:
+        path = os.path.join(workspace, name)
+        if arcpy.Exists(path):
+            arcpy.management.Delete(path)
+
+@contextlib.contextmanager
+def _environment(env):
+    # the variables are set while the pool runs and the previous values are put back afterwards
+    previous = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def _run_floor(args):
+    func, CAD_prefix = args
+    try:
+        return CAD_prefix, func(CAD_prefix), None
+    except Exception as e:
+        return CAD_prefix, None, f'{e}\n{traceback.format_exc()}'
+
+def run_floors(func, CAD_prefixs, processes=None, env=None, initializer=None, initargs=()):
+    # func(CAD_prefix) must be a module level function so it can be sent to the workers
+    # returns (CAD_prefix, result, error_message) in floor order, a failed floor does not stop the others
+    # env is exported to the workers only, the worker modules read it at import time;
+    # initializer(*initargs) runs in every worker before its first floor, e.g. to set the script's switches,
+    # which spawned workers would otherwise take from the module defaults
+    jobs = [(func, CAD_prefix) for CAD_prefix in CAD_prefixs]
+    if processes == 1 or len(jobs) < 2:
+        return [_run_floor(job) for job in jobs]
+
+    context = multiprocessing.get_context('spawn')
+    # inside ArcGIS Pro sys.executable is ArcGISPro.exe, workers have to start the bundled python instead
+    python_exe = os.path.join(sys.exec_prefix, 'python.exe')
+    if os.path.exists(python_exe):
+        context.set_executable(python_exe)
+    processes = min(processes or os.cpu_count(), len(jobs))
+    with _environment(env or {}), context.Pool(processes, initializer=initializer, initargs=initargs) as pool:
+        return pool.map(_run_floor, jobs, chunksize=1)
@@ -0,0 +1,55 @@
+# repair small gaps between CAD lines with extra "rectangular" segments
+# pure numpy, no arcpy needed, so it can be tested on synthetic wall vertices
+
+import numpy as np
+
+# gaps shorter than min_dist are treated as touching, longer than max_dist as real openings
+GAP_MIN_DIST = 0.001
+GAP_MAX_DIST = 0.2
+
+# dtype of the table handed to XYToLine
+XY_TABLE_DTYPE = np.dtype([('FROM_X', 'f8'), ('FROM_Y', 'f8'), ('NEAR_X', 'f8'), ('NEAR_Y', 'f8')])
+
+def near_angles(from_xy, near_xy):
+    # same convention as GenerateNearTable NEAR_ANGLE: degrees from the x axis, -180 to 180
+    delta = near_xy - from_xy
+    return np.degrees(np.arctan2(delta[:, 1], delta[:, 0]))
+
+def is_orthogonal(angle, angle_tolerance=0.0):
+    # angle is one of 0, 90, 180, -90, -180 (within tolerance)
+    offset = np.abs(np.mod(angle + 45.0, 90.0) - 45.0)
+    return offset <= angle_tolerance
+
+def repair_gaps(from_xy, near_xy, near_dist=None, near_angle=None,
+                min_dist=GAP_MIN_DIST, max_dist=GAP_MAX_DIST, angle_tolerance=0.0):
+    # from_xy, near_xy: (n, 2) vertex and near point coordinates
+    # returns an (m, 4) array of extra segments [from_x, from_y, near_x, near_y]
+    # orthogonal pairs give one straight segment, others are split into an x leg and a y leg
+    from_xy = np.asarray(from_xy, dtype=float).reshape(-1, 2)
+    near_xy = np.asarray(near_xy, dtype=float).reshape(-1, 2)
+    if near_dist is None:
+        near_dist = np.hypot(*(near_xy - from_xy).T)
+    if near_angle is None:
+        near_angle = near_angles(from_xy, near_xy)
+    near_dist = np.asarray(near_dist, dtype=float)
+    near_angle = np.asarray(near_angle, dtype=float)
+
+    in_window = (near_dist > min_dist) & (near_dist < max_dist)
+    x1, y1 = from_xy[in_window].T
+    x2, y2 = near_xy[in_window].T
+    straight = is_orthogonal(near_angle[in_window], angle_tolerance)
+
+    # every pair gets two slots, the second slot is dropped for straight pairs
+    pairs = np.empty((len(x1), 2, 4))
+    pairs[:, 0] = np.column_stack((x1, y1, x2, np.where(straight, y2, y1)))
+    pairs[:, 1] = np.column_stack((x2, y1, x2, y2))
+    used = np.column_stack((np.ones_like(straight), ~straight))
+    return pairs[used]
+
+def to_xy_table(segments):
+    # structured array ready for arcpy.da.NumPyArrayToTable and XYToLine
+    segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+    table = np.empty(len(segments), dtype=XY_TABLE_DTYPE)
+    for i, name in enumerate(XY_TABLE_DTYPE.names):
+        table[name] = segments[:, i]
+    return table
@@ -3,9 +3,31 @@
 # Polygon: Units (all valid)
 # Text: Annotation (Adjusted)
 
-import arcpy
+import argparse
+import contextlib
 import os
 import datetime
+import numpy as np
+
+import annotation_join
+import annotation_rules
+import checkpoint
+import door_connector
+import door_openings
+import feature_io
+import floor_pool
+import indoors_loader
+import instrumentation
+import intermediate_store
+import level_footprint
+import route_index
+import routing
+import session
+import unit_filter
+import workflow
+
+# arcpy is only started by the first geoprocessing call, importing this script does not need a Pro session
+arcpy = session.LazyModule('arcpy')
 
 ################### Global Settings ####################
 
@@ -14,19 +36,86 @@ import datetime
 CAD_prefix = 'N01'
 building_prefix = CAD_prefix[0] # 'N'
 
-# set the workspace to the default geodatabase
-default_gdb = arcpy.env.workspace = os.path.join(arcpy.mp.ArcGISProject("CURRENT").homeFolder, building_prefix+'.gdb')
-CAD_output_dir = os.path.join(arcpy.mp.ArcGISProject("CURRENT").homeFolder, 'ExportedCAD') 
+# the project home folder and every path in it are set by configure() when the run starts:
+# from the command line, from the environment in worker processes, or from the Pro project
+current_session = None
+home_folder = default_gdb = CAD_output_dir = indoor_gdb_path = None
 indoor_gdb_name = "Indoor.gdb"
-indoor_gdb_path = os.path.join(arcpy.mp.ArcGISProject("CURRENT").homeFolder, indoor_gdb_name)
 
-# set the log table location
-log_table = rf"{default_gdb}\Process_Log"
+# per-floor scratch geodatabases for the parallel mode
+scratch_dir = None
+
+# per-floor stage fingerprints, unchanged stages are skipped on re-run
+checkpoint_dir = None
+
+# routing graph of PrelimPathways, its landmark index and the pathway node of every unit, rebuilt after the pathways
+routing_dir = None
+
+# keep create_Arc intermediates (Level, Level_Polygon, Level_Whole, Doors_Buffer) in the floor dataset for debugging,
+# otherwise they stay in memory and only Doors_All and the Arc_* layers are written
+keep_intermediates = False
+
+# cut the door openings out of the unit outlines by interval subtraction along the outline edges
+# instead of Buffer and Erase against Doors_Buffer polygons
+native_door_openings = False
+
+# build Level_Whole and Arc_Level as the union of the Level_Polygon and Units polygons with the gaps up to the
+# aggregation distance closed, instead of AggregatePolygons and FeatureToLine
+native_level_footprint = False
 
-# set the coordinate system to WGS_1984_Web_Mercator_Auxiliary_Sphere
-coor_system = arcpy.SpatialReference(3857)
+# write Levels, Units and Details straight into the Indoors schema from the floor's feature classes instead of
+# exporting a DWG and importing it again with ImportCADToIndoorDataset; the DWG stays available as a side artifact
+direct_indoors_load = False
+export_dwg = True
+
+# peak python memory of every span through tracemalloc, slows the whole run down, so only for profiling
+trace_memory = False
+
+# set the log table location, messages and stage spans are buffered and written to it by flush_log()
+log_table = None
+tracer = instrumentation.Tracer()
+trace_dir = None
+
+# set the coordinate system to WGS_1984_Web_Mercator_Auxiliary_Sphere, by configure()
+coor_system = None
 z_coor_system = 'PROJCS["WGS_1984_Web_Mercator_Auxiliary_Sphere",GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],PROJECTION["Mercator_Auxiliary_Sphere"],PARAMETER["False_Easting",0.0],PARAMETER["False_Northing",0.0],PARAMETER["Central_Meridian",0.0],PARAMETER["Standard_Parallel_1",0.0],PARAMETER["Auxiliary_Sphere_Type",0.0],UNIT["Meter",1.0]],VERTCS["WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PARAMETER["Vertical_Shift",0.0],PARAMETER["Direction",1.0],UNIT["Meter",1.0]];-20037700 -30241100 10000;-100000 10000;-100000 10000;0.001;0.001;0.001;IsHighPrecision'
 
+# switches above that worker processes need, they import this script with its defaults
+SETTINGS = ('trace_memory', 'keep_intermediates', 'native_door_openings', 'native_level_footprint', 'direct_indoors_load', 'export_dwg')
+
+def current_settings():
+    return {name: globals()[name] for name in SETTINGS}
+
+def apply_settings(settings):
+    # set the switches of the run, in the parent from its arguments and in every worker before its first floor
+    unknown = sorted(set(settings) - set(SETTINGS))
+    if unknown:
+        raise ValueError(f"unknown settings: {', '.join(unknown)}")
+    globals().update(settings)
+
+def configure(home=None):
+    # paths of the run in the given project home folder, INDOOR_HOME_FOLDER or the home folder of the Pro project;
+    # later calls without a folder keep the current one, worker processes configure themselves from the environment
+    global current_session, home_folder, default_gdb, CAD_output_dir, indoor_gdb_path, scratch_dir, checkpoint_dir
+    global routing_dir, log_table, trace_dir, coor_system
+    if trace_memory:
+        tracer.start_memory_tracing()
+    if current_session is not None and home is None:
+        return current_session
+    current_session = session.Session(home, building_prefix=building_prefix)
+    home_folder = current_session.home_folder
+    # set the workspace to the default geodatabase
+    default_gdb = arcpy.env.workspace = current_session.default_gdb
+    CAD_output_dir = current_session.folder('ExportedCAD')
+    indoor_gdb_path = current_session.folder(indoor_gdb_name)
+    scratch_dir = current_session.folder('Scratch')
+    checkpoint_dir = current_session.folder('Checkpoints')
+    routing_dir = current_session.folder('Routing')
+    log_table = rf"{default_gdb}\Process_Log"
+    trace_dir = current_session.folder('Logs')
+    coor_system = arcpy.SpatialReference(3857)
+    return current_session
+
 def get_current_time():
     return datetime.datetime.now()
 
@@ -34,229 +123,299 @@ def create_log_table():
     # Check if the log table exists, if not, create it
     if not arcpy.Exists(log_table):
         arcpy.management.CreateTable(out_path=default_gdb, out_name="Process_Log")
-        arcpy.management.AddField(log_table, "Timestamp", "TEXT")
-        arcpy.management.AddField(log_table, "CADPrefix", "TEXT")
-        arcpy.management.AddField(log_table, "Message", "TEXT")
+    instrumentation.create_log_fields(log_table)
 
 def log_message_to_table(log_table, message, CAD_prefix):
-    # Insert the log message into the table
-    with arcpy.da.InsertCursor(log_table, ["Timestamp", "CADPrefix", "Message"]) as cursor:
-        cursor.insertRow([get_current_time(), CAD_prefix, message])
+    # Buffer the log message, all buffered rows are inserted into the table by flush_log()
+    tracer.message(message, CAD_prefix)
+
+def flush_log():
+    tracer.flush(log_table)
+
+def export_trace():
+    # stage spans of the whole run as JSON and Chrome trace, for finding the slowest floor and stage
+    os.makedirs(trace_dir, exist_ok=True)
+    run_name = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    tracer.to_json(os.path.join(trace_dir, f'spans_{run_name}.json'))
+    tracer.to_chrome_trace(os.path.join(trace_dir, f'trace_{run_name}.json'))
+
+def split_annotations(annotation_fc, outputs):
+    # one read of the source annotations, every row written to all outputs with their field rules applied
+    # outputs: {output feature class: {field: rule}}
+    description = arcpy.Describe(annotation_fc)
+    fields = [field.name for field in arcpy.ListFields(annotation_fc) if field.editable and field.type not in ('OID', 'Geometry')]
+    for output_fc in outputs:
+        if arcpy.Exists(output_fc):
+            arcpy.management.Delete(output_fc)
+        arcpy.management.CreateFeatureclass(
+            out_path=os.path.dirname(output_fc),
+            out_name=os.path.basename(output_fc),
+            geometry_type=description.shapeType.upper(),
+            template=annotation_fc,
+            has_z="ENABLED" if description.hasZ else "DISABLED",
+            spatial_reference=description.spatialReference
+        )
+    with contextlib.ExitStack() as stack:
+        insert_cursors = {
+            output_fc: stack.enter_context(arcpy.da.InsertCursor(output_fc, fields + ['SHAPE@'])) for output_fc in outputs
+        }
+        with arcpy.da.SearchCursor(annotation_fc, fields + ['SHAPE@']) as cursor:
+            for values in cursor:
+                row = dict(zip(fields, values[:-1]))
+                for output_fc, rules in outputs.items():
+                    derived = annotation_rules.apply_rules(row, rules)
+                    insert_cursors[output_fc].insertRow([derived[field] for field in fields] + [values[-1]])
 
 def create_annotations(CAD_prefix):
-    message = 'Duplicate adjusted annotation to two feature classes: room type and room number, and modify fields'
+    message = 'Splitting adjusted annotation into room type and room number feature classes in one pass'
     log_message_to_table(log_table, message, CAD_prefix)
     print(message)
     try:
-        arcpy.management.CopyFeatures(
-            in_features=rf"{CAD_prefix}\{CAD_prefix}_Annotation",
-            out_feature_class=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Type",
-            config_keyword="",
-            spatial_grid_1=None,
-            spatial_grid_2=None,
-            spatial_grid_3=None
-        )
-        arcpy.management.CalculateField(
-            in_table=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Type",
-            field='Layer',
-            expression='"Annotation_Type"',
-            expression_type="PYTHON3"
-        )
-        arcpy.management.CalculateField(
-            in_table=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Type",
-            field='TxtMemo',
-            expression=f"!{'ROOMNAME'}!",
-            expression_type="PYTHON3"
-        )
-        arcpy.management.CalculateField(
-            in_table=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Type",
-            field='Height',
-            expression=f"!{'Height'}! / 1000",
-            expression_type="PYTHON3"
-        )
-        arcpy.management.CalculateField(
-            in_table=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Type",
-            field='TxtWidth',
-            expression=f"!{'TxtWidth'}! / 10",
-            expression_type="PYTHON3"
-        )
-        
-        arcpy.management.CopyFeatures(
-            in_features=rf"{CAD_prefix}\{CAD_prefix}_Annotation",
-            out_feature_class=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Number",
-            config_keyword="",
-            spatial_grid_1=None,
-            spatial_grid_2=None,
-            spatial_grid_3=None
-        )
-        arcpy.management.CalculateField(
-            in_table=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Number",
-            field='Layer',
-            expression='"Annotation_Number"',
-            expression_type="PYTHON3"
-        )
-        arcpy.management.CalculateField(
-            in_table=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Number",
-            field='TxtMemo',
-            expression=f"!{'RMNUMBER'}!",
-            expression_type="PYTHON3"
-        )
-        arcpy.management.CalculateField(
-            in_table=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Number",
-            field='Height',
-            expression=f"!{'Height'}! / 1000",
-            expression_type="PYTHON3"
-        )
-        arcpy.management.CalculateField(
-            in_table=rf"{CAD_prefix}\{CAD_prefix}_Annotation_Number",
-            field='TxtWidth',
-            expression=f"!{'TxtWidth'}! / 10",
-            expression_type="PYTHON3"
+        split_annotations(
+            rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Annotation",
+            {
+                rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_{name}": rules
+                for name, rules in annotation_rules.ANNOTATION_OUTPUTS.items()
+            }
         )
         
     except Exception as e:
-        error_message = f"Error duplicating adjusted annotation to two feature classes for {CAD_prefix}: {str(e)}"
+        error_message = f"Error splitting adjusted annotation for {CAD_prefix}: {str(e)}"
         log_message_to_table(log_table, error_message, CAD_prefix)
         print(error_message)
     
     
 
-# Create Arc files to export to CAD
-def create_Arc(CAD_prefix):
-    arcpy.env.addOutputsToMap = False
-    # Section 1: creating Arc_Level, for Level and facility (only level 1) in Import CAD to Indoor Database
-    message = 'Merging Doors and Door_Extra to create Doors_All feature class'
-    log_message_to_table(log_table, message, CAD_prefix)
-    print(message)
-    try:
-        arcpy.management.Merge(
-            inputs=rf"{CAD_prefix}\{CAD_prefix}_Doors;{CAD_prefix}\{CAD_prefix}_Door_Extra",
-            output=rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Doors_All",
-            add_source="NO_SOURCE_INFO"
-        )
-    except Exception as e:
-        error_message = f"Error creating Doors_All for {CAD_prefix}: {str(e)}"
-        log_message_to_table(log_table, error_message, CAD_prefix)
-        print(error_message)
-    
-    message = 'Merging Walls, Wall_Extra, Doors_All, Lines_Extra to create Level feature class'
+def join_annotations(CAD_prefix):
+    # room number and room name of every unit from the annotation text box it overlaps most,
+    # written to RMNUMBER and ROOMNAME of Units; unmatched and ambiguous annotations are logged
+    message = 'Joining room number and room type annotations to units by largest overlap'
     log_message_to_table(log_table, message, CAD_prefix)
     print(message)
     try:
-        arcpy.management.Merge(
-            inputs=rf"{CAD_prefix}\{CAD_prefix}_Walls;{CAD_prefix}\{CAD_prefix}_Wall_Extra;{CAD_prefix}\{CAD_prefix}_Doors_All",  # for those layers don't have lines_extra
-            # inputs=rf"{CAD_prefix}\{CAD_prefix}_Walls;{CAD_prefix}\{CAD_prefix}_Wall_Extra;{CAD_prefix}\{CAD_prefix}_Lines_Extra;{CAD_prefix}\{CAD_prefix}_Doors_All",
-            output=rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Level",
-            add_source="NO_SOURCE_INFO"
-        )
+        unit_fc = rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Units"
+        unit_oids, unit_rings = feature_io.read_polygon_rings(unit_fc)
+        xy, ring_offsets, ring_polygon = unit_filter.pack_polygons(unit_rings)
+        unit_values = [dict() for _ in unit_oids]
+        unit_overlaps = [dict() for _ in unit_oids]
+        for name, field in (('Annotation_Number', 'RMNUMBER'), ('Annotation_Type', 'ROOMNAME')):
+            annotations = arcpy.da.FeatureClassToNumPyArray(
+                in_table=rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_{name}",
+                field_names=['SHAPE@XY', 'TxtMemo', 'Height', 'TxtWidth'],
+                null_value={'TxtMemo': '', 'Height': 0, 'TxtWidth': 1}
+            )
+            boxes = annotation_join.text_boxes(
+                annotations['SHAPE@XY'],
+                annotations['Height'],
+                annotations['TxtWidth'],
+                np.char.str_len(annotations['TxtMemo'].astype(str))
+            )
+            joined = annotation_join.join_annotations(boxes, xy, ring_offsets, ring_polygon, len(unit_oids))
+            # a unit with several annotations takes the one overlapping it most
+            for text, unit, overlap in zip(annotations['TxtMemo'].tolist(), joined['unit'].tolist(), joined['overlap'].tolist()):
+                if unit >= 0 and overlap > unit_overlaps[unit].get(field, 0.0):
+                    unit_values[unit][field] = text
+                    unit_overlaps[unit][field] = overlap
+            message = (f"{name}: {int((joined['unit'] < 0).sum())} unmatched, {int(joined['ambiguous'].sum())} ambiguous, "
+                       f"{int((joined['unit_count'] > 1).sum())} units with more than one annotation")
+            log_message_to_table(log_table, message, CAD_prefix)
+            print(message)
+
+        existing = {field.name for field in arcpy.ListFields(unit_fc)}
+        for field in ('RMNUMBER', 'ROOMNAME'):
+            if field not in existing:
+                arcpy.management.AddField(unit_fc, field, "TEXT", field_length=255)
+        values_by_oid = dict(zip(unit_oids, unit_values))
+        with arcpy.da.UpdateCursor(unit_fc, ['OID@', 'RMNUMBER', 'ROOMNAME']) as cursor:
+            for oid, *_ in cursor:
+                values = values_by_oid.get(oid, {})
+                cursor.updateRow([oid, values.get('RMNUMBER'), values.get('ROOMNAME')])
+        return True
+
     except Exception as e:
-        error_message = f"Error creating Level for {CAD_prefix}: {str(e)}"
+        error_message = f"Error joining annotations to units for {CAD_prefix}: {str(e)}"
         log_message_to_table(log_table, error_message, CAD_prefix)
         print(error_message)
-    
-    message='Outputing polygons from the Level lines'
-    log_message_to_table(log_table, message, CAD_prefix)
-    print(message)
-    try:
-        arcpy.management.FeatureToPolygon(
-            in_features=rf"{CAD_prefix}\{CAD_prefix}_Level",
-            out_feature_class=rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Level_Polygon",
-            cluster_tolerance=None,
-            attributes="ATTRIBUTES",
-            label_features=None
-        )
-    except Exception as e:
-        error_message = f"Error creating polygons from {CAD_prefix}_Level_Polygon: {str(e)}"
+        return False
+
+# Create Arc files to export to CAD
+def create_Arc(CAD_prefix, store=None):
+    arcpy.env.addOutputsToMap = False
+    # Doors_All is persisted because create_pathways joins against it later
+    store = store or intermediate_store.make_store(rf"{default_gdb}\{CAD_prefix}", keep_intermediates)
+    level = store.path(f"{CAD_prefix}_Level")
+    level_polygon = store.path(f"{CAD_prefix}_Level_Polygon")
+    # Level_Whole is persisted because load_indoors writes the level and facility footprint from it
+    level_whole = rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Level_Whole"
+    doors_buffer = store.path(f"{CAD_prefix}_Doors_Buffer")
+
+    # full paths, the steps run on worker threads
+    def dataset(name):
+        return rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_{name}"
+
+    steps = [
+        # Section 1: creating Arc_Level, for Level and facility (only level 1) in Import CAD to Indoor Database
+        workflow.Step(
+            'Doors_All',
+            lambda: arcpy.management.Merge(
+                inputs=f"{dataset('Doors')};{dataset('Door_Extra')}",
+                output=dataset('Doors_All'),
+                add_source="NO_SOURCE_INFO"
+            ),
+            inputs=['Doors', 'Door_Extra'], outputs=['Doors_All'],
+            message='Merging Doors and Door_Extra to create Doors_All feature class'
+        ),
+        workflow.Step(
+            'Level',
+            lambda: arcpy.management.Merge(
+                inputs=f"{dataset('Walls')};{dataset('Wall_Extra')};{dataset('Doors_All')}",  # for those layers don't have lines_extra
+                # inputs=f"{dataset('Walls')};{dataset('Wall_Extra')};{dataset('Lines_Extra')};{dataset('Doors_All')}",
+                output=level,
+                add_source="NO_SOURCE_INFO"
+            ),
+            inputs=['Walls', 'Wall_Extra', 'Doors_All'], outputs=['Level'],
+            message='Merging Walls, Wall_Extra, Doors_All, Lines_Extra to create Level feature class'
+        ),
+        workflow.Step(
+            'Level_Polygon',
+            lambda: arcpy.management.FeatureToPolygon(
+                in_features=level,
+                out_feature_class=level_polygon,
+                cluster_tolerance=None,
+                attributes="ATTRIBUTES",
+                label_features=None
+            ),
+            inputs=['Level'], outputs=['Level_Polygon'],
+            message='Outputing polygons from the Level lines'
+        ),
+    ]
+    if native_level_footprint:
+        steps.append(workflow.Step(
+            'Level_Whole',
+            lambda: build_level_footprint(CAD_prefix, level_polygon),
+            inputs=['Level_Polygon', 'Units'], outputs=['Level_Whole', 'Arc_Level'],
+            message='Uniting Level polygons and Units to the whole level polygon and its outline for CAD export'
+        ))
+    else:
+        steps += [
+            workflow.Step(
+                'Level_Whole',
+                lambda: arcpy.cartography.AggregatePolygons(
+                    in_features=level_polygon,
+                    out_feature_class=level_whole,
+                    aggregation_distance="0.05 Meters",
+                    minimum_area="0 SquareMeters",
+                    minimum_hole_size="0 SquareMeters",
+                    orthogonality_option="NON_ORTHOGONAL",
+                    barrier_features=None,
+                    out_table=None,
+                    aggregate_field=None
+                ),
+                inputs=['Level_Polygon'], outputs=['Level_Whole'],
+                message='Aggregate all level polygons to a whole polygon'
+            ),
+            workflow.Step(
+                'Arc_Level',
+                lambda: arcpy.management.FeatureToLine(
+                    in_features=level_whole,
+                    out_feature_class=dataset('Arc_Level'),
+                    cluster_tolerance=None,
+                    attributes="ATTRIBUTES"
+                ),
+                inputs=['Level_Whole'], outputs=['Arc_Level'],
+                message='Creating whole outline of the dissolved level polygon for CAD export'
+            ),
+        ]
+    steps += [
+        # Section 2: creating Arc_Units, for Units in Import CAD to Indoor Database
+        workflow.Step(
+            'Arc_Units',
+            lambda: arcpy.management.PolygonToLine(
+                in_features=dataset('Units'),
+                out_feature_class=dataset('Arc_Units'),
+                neighbor_option="IGNORE_NEIGHBORS"
+            ),
+            inputs=['Units'], outputs=['Arc_Units'],
+            message='Creating lines from valid Units Polygons'
+        ),
+    ]
+    # Section 3: creating Arc_Walls, for details in Import CAD to Indoor Database
+    if native_door_openings:
+        steps.append(workflow.Step(
+            'Arc_Walls',
+            lambda: cut_door_openings(CAD_prefix),
+            inputs=['Units', 'Doors_All'], outputs=['Arc_Walls'],
+            message='Cutting Doors_All openings out of the Units outlines to create Arc_Walls for CAD export'
+        ))
+    else:
+        steps += [
+            workflow.Step(
+                'Doors_Buffer',
+                lambda: arcpy.analysis.Buffer(
+                    in_features=dataset('Doors_All'),
+                    out_feature_class=doors_buffer,
+                    buffer_distance_or_field="0.05 Meters",
+                    line_side="FULL",
+                    line_end_type="ROUND",
+                    dissolve_option="NONE",
+                    dissolve_field=None,
+                    method="PLANAR"
+                ),
+                inputs=['Doors_All'], outputs=['Doors_Buffer'],
+                message='Buffering Doors_All to be erased from Units_Line'
+            ),
+            workflow.Step(
+                'Arc_Walls',
+                lambda: arcpy.analysis.Erase(
+                    in_features=dataset('Arc_Units'),
+                    erase_features=doors_buffer,
+                    out_feature_class=dataset('Arc_Walls'),
+                    cluster_tolerance=None
+                ),
+                inputs=['Arc_Units', 'Doors_Buffer'], outputs=['Arc_Walls'],
+                message='Erasing Units_Lines with Doors_Buffer to create Arc_Walls for CAD export'
+            ),
+        ]
+
+    def on_start(step):
+        log_message_to_table(log_table, step.message, CAD_prefix)
+        print(step.message)
+
+    def on_error(step, e):
+        error_message = f"Error creating {step.name} for {CAD_prefix}: {str(e)}"
         log_message_to_table(log_table, error_message, CAD_prefix)
         print(error_message)
-    
-    message='Aggregate all level polygons to a whole polygon'
-    log_message_to_table(log_table, message, CAD_prefix)
-    print(message)
-    try:
-        arcpy.cartography.AggregatePolygons(
-            in_features=rf"{CAD_prefix}\{CAD_prefix}_Level_Polygon",
-            out_feature_class=rf"{CAD_prefix}\{CAD_prefix}_Level_Whole",
-            aggregation_distance="0.05 Meters",
-            minimum_area="0 SquareMeters",
-            minimum_hole_size="0 SquareMeters",
-            orthogonality_option="NON_ORTHOGONAL",
-            barrier_features=None,
-            out_table=None,
-            aggregate_field=None
-        )
-    except Exception as e:
-        error_message = f"Error creating polygons from {CAD_prefix}_Level_Polygon: {str(e)}"
+
+    def on_skip(step, failed):
+        error_message = f"Skipping {step.name} for {CAD_prefix}, its inputs from {', '.join(failed)} were not created"
         log_message_to_table(log_table, error_message, CAD_prefix)
         print(error_message)
-    
-    message = 'Creating whole outline of the dissolved level polygon for CAD export'
-    log_message_to_table(log_table, message, CAD_prefix)
-    print(message)
-    try:
-        arcpy.management.FeatureToLine(
-            in_features=rf"{CAD_prefix}\{CAD_prefix}_Level_Whole",
-            out_feature_class=rf"{CAD_prefix}\{CAD_prefix}_Arc_Level",
-            cluster_tolerance=None,
-            attributes="ATTRIBUTES"
-        )
-    except Exception as e:
-        error_message = f"Error exporting Arc_Units for {CAD_prefix}: {str(e)}"
-        log_message_to_table(log_table, error_message, CAD_prefix)
-        print(error_message)   
 
-    # Section 2: creating Arc_Units, for Units in Import CAD to Indoor Database
-    message = 'Creating lines from valid Units Polygons'
-    log_message_to_table(log_table, message, CAD_prefix)
-    print(message)
-    try:
-        
-        arcpy.management.PolygonToLine(
-            in_features=rf"{CAD_prefix}\{CAD_prefix}_Units",
-            out_feature_class=rf"{CAD_prefix}\{CAD_prefix}_Arc_Units",
-            neighbor_option="IGNORE_NEIGHBORS"
-        )
-        
-    except Exception as e:
-        error_message = f"Error creating lines from valid Units Polygons for {CAD_prefix}: {str(e)}"
-        log_message_to_table(log_table, error_message, CAD_prefix)
-        print(error_message)  
-    
-    # Section 3: creating Arc_Walls, for details in Import CAD to Indoor Database
-    message = 'Buffering Doors_All to be erased from Units_Line'
-    log_message_to_table(log_table, message, CAD_prefix)
-    print(message)
-    try:
-        arcpy.analysis.Buffer(
-            in_features=rf"{CAD_prefix}\{CAD_prefix}_Doors_All",
-            out_feature_class=rf"{CAD_prefix}\{CAD_prefix}_Doors_Buffer",
-            buffer_distance_or_field="0.05 Meters",
-            line_side="FULL",
-            line_end_type="ROUND",
-            dissolve_option="NONE",
-            dissolve_field=None,
-            method="PLANAR"
-        )
-    except Exception as e:
-        error_message = f"Error buffering Doors_All for {CAD_prefix}: {str(e)}"
-        log_message_to_table(log_table, error_message, CAD_prefix)
-        print(error_message)   
-    
-    message = 'Erasing Units_Lines with Doors_Buffer to create Arc_Walls for CAD export'
-    log_message_to_table(log_table, message, CAD_prefix)
-    print(message)
-    try:
-        arcpy.analysis.Erase(
-            in_features=rf"{CAD_prefix}\{CAD_prefix}_Arc_Units",
-            erase_features=rf"{CAD_prefix}\{CAD_prefix}_Doors_Buffer",
-            out_feature_class=rf"{CAD_prefix}\{CAD_prefix}_Arc_Walls",
-            cluster_tolerance=None
-        )
-    except Exception as e:
-        error_message = f"Error erasing Units_Lines with Doors_Buffer for {CAD_prefix}: {str(e)}"
-        log_message_to_table(log_table, error_message, CAD_prefix)
-        print(error_message)  
+    # the Level outline, the Units outline and the door buffer only share Doors_All, the DAG orders them and
+    # skips the steps of a failed branch
+    results = workflow.run_steps(steps, on_start, on_error, on_skip)
+    store.clear()
+    return not workflow.failed_steps(results)
         
+def build_level_footprint(CAD_prefix, level_polygon):
+    # Level_Whole polygons and their rings as the Arc_Level lines, one multipart line per polygon like FeatureToLine
+    unit_fc = rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Units"
+    _, level_rings = feature_io.read_polygon_rings(level_polygon)
+    _, unit_rings = feature_io.read_polygon_rings(unit_fc)
+    footprint = level_footprint.level_footprint(level_rings + unit_rings)
+    spatial_reference = arcpy.Describe(unit_fc).spatialReference
+    feature_io.write_polygons(rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Level_Whole", footprint, spatial_reference)
+    feature_io.write_paths(rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Arc_Level", level_footprint.outline_paths(footprint), spatial_reference)
+
+def cut_door_openings(CAD_prefix):
+    # unit outlines minus the stretches that Doors_All lines run along, one multipart line per unit like Erase
+    unit_fc = rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Units"
+    _, unit_rings = feature_io.read_polygon_rings(unit_fc)
+    door_segments = feature_io.read_line_segments(rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Doors_All")[1]
+    xy, ring_offsets, ring_polygon = unit_filter.pack_polygons(unit_rings)
+    wall_paths = door_openings.cut_openings(xy, ring_offsets, ring_polygon, door_segments, len(unit_rings))
+    feature_io.write_paths(rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Arc_Walls", wall_paths, arcpy.Describe(unit_fc).spatialReference)
+
 def export_CAD(CAD_prefix):
     message = 'Exporting Arc_Level, Arc_Units, Arc_Walls to new CAD file'
     log_message_to_table(log_table, message, CAD_prefix)
@@ -283,28 +442,30 @@ def export_CAD(CAD_prefix):
         log_message_to_table(log_table, error_message, CAD_prefix)
         print(error_message)
 
+def ensure_indoor_database():
+    # Check if indoor database exists, if not, create a new one
+    if not os.path.exists(indoor_gdb_path):
+        arcpy.management.CreateFileGDB(
+            out_folder_path=home_folder,
+            out_name=indoor_gdb_name,
+            out_version="CURRENT"
+        )
+        arcpy.indoors.CreateIndoorsDatabase(
+            target_gdb=indoor_gdb_path,
+            create_network="CREATE_NETWORK",
+            spatial_reference=z_coor_system,
+            create_attribute_rules="CREATE_RULES"
+            )
+        print(f"Indoor Database '{indoor_gdb_path}' created successfully.")
+
 def import_CAD(CAD_prefix):
     message = f'Import Arc_Level, Arc_Units, Arc_Walls of layer {CAD_prefix} from CAD file to Indoor Database'
     log_message_to_table(log_table, message, CAD_prefix)
     print(message)
     try:
-        # Check if indoor database exists, if not, create a new one
-        if not os.path.exists(indoor_gdb_path):
-            arcpy.management.CreateFileGDB(
-                out_folder_path=arcpy.mp.ArcGISProject("CURRENT").homeFolder,
-                out_name=indoor_gdb_name,
-                out_version="CURRENT"
-            )
-            arcpy.indoors.CreateIndoorsDatabase(
-                target_gdb=indoor_gdb_path,
-                create_network="CREATE_NETWORK",
-                spatial_reference=z_coor_system,
-                create_attribute_rules="CREATE_RULES"
-                )
-            print(f"Indoor Database '{indoor_gdb_path}' created successfully.")
-        else:
-            # print(f"Folder '{CAD_output_dir}' already exists.")
-            pass
+        ensure_indoor_database()
+        # a changed floor is imported again, its earlier Level, Units, Details (and facility) rows go first
+        delete_floor_rows(CAD_prefix)
         
         if str(int(CAD_prefix[-2:])) == '1': # for the first floor, import facility
             arcpy.indoors.ImportCADToIndoorDataset(
@@ -333,17 +494,6 @@ def import_CAD(CAD_prefix):
                 input_unit_minimum_width="2 FeetInt",
                 input_unit_minimum_area="2 SquareFeet"
             )
-            
-            # update Facility_ID in Facilities to style like "SAIT.N"
-            arcpy.management.CalculateField(
-                in_table=rf"{indoor_gdb_path}\Indoors\Facilities",
-                field="FACILITY_ID",
-                expression=f'"SAIT.{CAD_prefix[0]}"',
-                expression_type="PYTHON3",
-                code_block="",
-                field_type="TEXT",
-                enforce_domains="NO_ENFORCE_DOMAINS"
-            )
             # arcpy.management.AddField(rf"{indoor_gdb_path}\Indoors\Levels", "NAME_LONG", "TEXT")
             
         else: # for layers other than first floor, do not import facility
@@ -372,62 +522,129 @@ def import_CAD(CAD_prefix):
                 input_unit_minimum_area="2 SquareFeet"
             )
         
-        # update Level_ID in Units to style like "SAIT.N.L1"
+        # Facility_ID and Level_ID of the imported rows are normalized for all floors at once by normalize_ids
+        print(f'import CAD of layer {CAD_prefix} to indoor database complete')
+        return True
+            
+    except Exception as e:
+        error_message = f"Error importing exported CAD layers to Indoor Database for {CAD_prefix}: {str(e)}"
+        log_message_to_table(log_table, error_message, CAD_prefix)
+        print(error_message)
+        return False
+
+def load_indoors(CAD_prefix):
+    # direct replacement of export_CAD + import_CAD: the level footprint, the units with USE_TYPE and NAME from the
+    # joined annotations and the walls as details are written to the Indoors schema without the DWG round trip,
+    # with Facility_ID and Level_ID already normalized
+    message = f'Loading Level, Units and Details of layer {CAD_prefix} directly to Indoor Database'
+    log_message_to_table(log_table, message, CAD_prefix)
+    print(message)
+    try:
+        ensure_indoor_database()
+        # rows of an earlier import_CAD run may still carry the IDs written before normalize_ids
+        delete_floor_rows(CAD_prefix)
+        _, level_polygons = feature_io.read_polygon_rings(rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Level_Whole")
+        unit_fc = rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Units"
+        unit_oids, unit_polygons = feature_io.read_polygon_rings(unit_fc)
+        with arcpy.da.SearchCursor(unit_fc, ['OID@', 'RMNUMBER', 'ROOMNAME']) as cursor:
+            unit_values = {oid: (number, name) for oid, number, name in cursor}
+        _, detail_paths = feature_io.read_line_paths(rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Arc_Walls")
+        records = indoors_loader.floor_records(
+            CAD_prefix,
+            level_polygons,
+            unit_polygons,
+            [unit_values[oid][0] for oid in unit_oids],
+            [unit_values[oid][1] for oid in unit_oids],
+            detail_paths
+        )
+        indoors_loader.load_floor(indoors_loader.GeodatabaseIndoorsWriter(indoor_gdb_path, arcpy.SpatialReference(text=z_coor_system)), records)
+        message = f"Loaded {len(records['Units'])} units and {len(records['Details'])} details of layer {CAD_prefix}"
+        log_message_to_table(log_table, message, CAD_prefix)
+        print(message)
+        return True
+
+    except Exception as e:
+        error_message = f"Error loading layer {CAD_prefix} directly to Indoor Database: {str(e)}"
+        log_message_to_table(log_table, error_message, CAD_prefix)
+        print(error_message)
+        return False
+
+facility_id = indoors_loader.facility_id
+level_name = indoors_loader.level_name
+level_id = indoors_loader.level_id
+
+def sql_in(field, values):
+    quoted = ', '.join("'" + str(value).replace("'", "''") + "'" for value in values)
+    return f"{field} IN ({quoted})" if values else "1 = 0"
+
+def delete_rows(table, where_clause):
+    if arcpy.Exists(table):
+        with arcpy.da.UpdateCursor(table, ['OID@'], where_clause=where_clause) as cursor:
+            for _ in cursor:
+                cursor.deleteRow()
+
+def floor_level_ids(CAD_prefix):
+    # the normalized Level_ID of the floor plus any raw one its Levels row still carries
+    level_ids = {level_id(CAD_prefix)}
+    level_fc = rf"{indoor_gdb_path}\Indoors\Levels"
+    if arcpy.Exists(level_fc):
+        with arcpy.da.SearchCursor(level_fc, ['LEVEL_ID'], where_clause=sql_in('NAME', [level_name(CAD_prefix)])) as cursor:
+            level_ids.update(row[0] for row in cursor if row[0])
+    return sorted(level_ids)
+
+def delete_floor_rows(CAD_prefix):
+    # what an earlier import or load of the floor wrote, so re-running it replaces the rows instead of adding them
+    level_ids = floor_level_ids(CAD_prefix)
+    for table in ('Units', 'Details', 'Levels'):
+        delete_rows(rf"{indoor_gdb_path}\Indoors\{table}", sql_in('LEVEL_ID', level_ids))
+    if indoors_loader.vertical_order(CAD_prefix) == 0:
+        facility = [facility_id(CAD_prefix)]
+        delete_rows(rf"{indoor_gdb_path}\Indoors\Facilities", f"{sql_in('NAME', facility)} OR {sql_in('FACILITY_ID', facility)}")
+
+def ensure_attribute_index(table, field):
+    if not any(field in [index_field.name for index_field in index.fields] for index in arcpy.ListIndexes(table)):
+        arcpy.management.AddIndex(table, [field], f"IDX_{field}")
+
+def normalize_ids(CAD_prefixs):
+    # Facility_ID "SAIT.N" and Level_ID "SAIT.N.L1" for the imported floors, one pass per table:
+    # the level name -> raw Level_ID mapping is read once and Units and Details only visit rows with a raw ID
+    message = f"Normalizing Facility_ID and Level_ID of {', '.join(CAD_prefixs)}"
+    log_message_to_table(log_table, message, building_prefix)
+    print(message)
+    try:
         level_fc = rf"{indoor_gdb_path}\Indoors\Levels"
         unit_fc = rf"{indoor_gdb_path}\Indoors\Units"
         detail_fc = rf"{indoor_gdb_path}\Indoors\Details"
-        Level_ID = ""
+        facility_fc = rf"{indoor_gdb_path}\Indoors\Facilities"
+        floors = {level_name(CAD_prefix): CAD_prefix for CAD_prefix in CAD_prefixs}
 
-        # Step 1: Populate the dictionary with values from the first feature class
-        with arcpy.da.SearchCursor(level_fc, ['NAME', 'LEVEL_ID']) as cursor:
-            for row in cursor:
-                # Store the 'number' value with 'name' as key in the dictionary
-                if row[0] == f"L{str(int(CAD_prefix[-2:]))}":
-                    Level_ID = row[1]
-                    
-        with arcpy.da.UpdateCursor(unit_fc, ['LEVEL_ID']) as cursor:
-            for row in cursor:
-                # Check if the 'name' exists in the dictionary
-                if row[0] == Level_ID:
-                    # Update the 'number_field_to_populate' with the corresponding value from the dictionary
-                    row[0] = f"SAIT.{CAD_prefix[0]}.L{str(int(CAD_prefix[-2:]))}"
-                    cursor.updateRow(row)
-                    
-        with arcpy.da.UpdateCursor(detail_fc, ['LEVEL_ID']) as cursor:
+        raw_level_ids = {}
+        with arcpy.da.UpdateCursor(level_fc, ['NAME', 'LEVEL_ID', 'FACILITY_ID'], where_clause=sql_in('NAME', list(floors))) as cursor:
             for row in cursor:
-                # Check if the 'name' exists in the dictionary
-                if row[0] == Level_ID:
-                    # Update the 'number_field_to_populate' with the corresponding value from the dictionary
-                    row[0] = f"SAIT.{CAD_prefix[0]}.L{str(int(CAD_prefix[-2:]))}"
-                    cursor.updateRow(row)
-        
-        # update Facility_ID in Levels to style like "SAIT.N"
-        arcpy.management.CalculateField(
-            in_table=rf"{indoor_gdb_path}\Indoors\Levels",
-            field="FACILITY_ID",
-            expression=f'"SAIT.{CAD_prefix[0]}"',
-            expression_type="PYTHON3",
-            code_block="",
-            field_type="TEXT",
-            enforce_domains="NO_ENFORCE_DOMAINS"
-        )
-        
-        # update Level_ID in Levels to style like "SAIT.N.L1"
-        arcpy.management.CalculateField(
-            in_table=rf"{indoor_gdb_path}\Indoors\Levels",
-            field="LEVEL_ID",
-            expression=f'"SAIT.{CAD_prefix[0]}.L" + str(!LEVEL_NUMBER!)',
-            expression_type="PYTHON3",
-            code_block="",
-            field_type="TEXT",
-            enforce_domains="NO_ENFORCE_DOMAINS"
-        )
-        print(f'import CAD of layer {CAD_prefix} to indoor database complete')
-            
+                CAD_prefix = floors[row[0]]
+                if row[1] != level_id(CAD_prefix):
+                    raw_level_ids[row[1]] = level_id(CAD_prefix)
+                if row[1:] != [level_id(CAD_prefix), facility_id(CAD_prefix)]:
+                    cursor.updateRow([row[0], level_id(CAD_prefix), facility_id(CAD_prefix)])
+
+        for feature_class in (unit_fc, detail_fc):
+            ensure_attribute_index(feature_class, 'LEVEL_ID')
+            with arcpy.da.UpdateCursor(feature_class, ['LEVEL_ID'], where_clause=sql_in('LEVEL_ID', list(raw_level_ids))) as cursor:
+                for row in cursor:
+                    cursor.updateRow([raw_level_ids[row[0]]])
+
+        facility_ids = sorted({facility_id(CAD_prefix) for CAD_prefix in CAD_prefixs})
+        if len(facility_ids) == 1:
+            with arcpy.da.UpdateCursor(facility_fc, ['FACILITY_ID'], where_clause=f"FACILITY_ID IS NULL OR FACILITY_ID <> '{facility_ids[0]}'") as cursor:
+                for row in cursor:
+                    cursor.updateRow([facility_ids[0]])
+        return True
+
     except Exception as e:
-        error_message = f"Error importing exported CAD layers to Indoor Database for {CAD_prefix}: {str(e)}"
-        log_message_to_table(log_table, error_message, CAD_prefix)
+        error_message = f"Error normalizing Facility_ID and Level_ID: {str(e)}"
+        log_message_to_table(log_table, error_message, building_prefix)
         print(error_message)
+        return False
 
 def duplicate_empty_prelim_pathway():
     message = 'Create prelim dataset to save intermediate variables for prelim pathways repair'
@@ -480,88 +697,19 @@ def create_pathways(CAD_prefix):
             detail_exp=f"USE_TYPE = '{CAD_prefix}_Arc_Walls'"
         )
         
-        arcpy.management.FeatureVerticesToPoints(
-            in_features=rf"{indoor_gdb_path}\Prelims\Prelim",
-            out_feature_class=rf"{indoor_gdb_path}\Prelims\Prelim_Point",
-            point_location="ALL"
-        )
-        
-        arcpy.analysis.SpatialJoin(
-            target_features=rf"{indoor_gdb_path}\Prelims\Prelim_Point",
-            join_features=rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Doors_All",
-            out_feature_class=rf"{indoor_gdb_path}\Prelims\Prelim_Point_Door_Spatial",
-            join_operation="JOIN_ONE_TO_ONE",
-            join_type="KEEP_ALL",
-            field_mapping=None,
-            match_option="WITHIN_A_DISTANCE",
-            search_radius="1 Meters",
-            distance_field_name="",
-            match_fields=None
-        )
-        
-        arcpy.conversion.ExportFeatures(
-            in_features=rf"{indoor_gdb_path}\Prelims\Prelim_Point_Door_Spatial",
-            out_features=rf"{indoor_gdb_path}\Prelims\Prelim_Point_Near_Door",
-            where_clause="Join_Count > 0",
-            use_field_alias_as_name="NOT_USE_ALIAS",
-            field_mapping=None,
-            sort_field=None
-        )
-        
-        arcpy.management.DeleteIdentical(
-            in_dataset=rf"{indoor_gdb_path}\Prelims\Prelim_Point_Near_Door",
-            fields="Shape",
-            xy_tolerance="0.01 Meters",
-            z_tolerance=0
-        )
-        
-        arcpy.analysis.GenerateNearTable(
-            in_features=rf"{indoor_gdb_path}\Prelims\Prelim_Point_Near_Door",
-            near_features=rf"{indoor_gdb_path}\Prelims\Prelim_Point_Near_Door",
-            out_table=rf"{indoor_gdb_path}\Prelim_Point_Pair",
-            search_radius="1.3 Meters",
-            location="LOCATION",
-            angle="NO_ANGLE",
-            closest="ALL",
-            closest_count=10,
-            method="PLANAR",
-            distance_unit="Meters"
-        )
-        
-        arcpy.management.XYToLine(
-            in_table=rf"{indoor_gdb_path}\Prelim_Point_Pair",
-            out_featureclass=rf"{indoor_gdb_path}\Prelims\Prelim_Extra",
-            startx_field="FROM_X",
-            starty_field="FROM_Y",
-            endx_field="NEAR_X",
-            endy_field="NEAR_Y",
-            line_type="PLANAR",
-            id_field=None,
-            spatial_reference=z_coor_system,
-            attributes="NO_ATTRIBUTES"
-        )
-        
-        arcpy.analysis.SpatialJoin(
-            target_features=rf"{indoor_gdb_path}\Prelims\Prelim_Extra",
-            join_features=rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Arc_Walls",
-            out_feature_class=rf"{indoor_gdb_path}\Prelims\Prelim_Wall_Intersect",
-            join_operation="JOIN_ONE_TO_ONE",
-            join_type="KEEP_ALL",
-            field_mapping=None,
-            match_option="INTERSECT",
-            search_radius=None,
-            distance_field_name="",
-            match_fields=None
-        )
-        
-        arcpy.conversion.ExportFeatures(
-            in_features=rf"{indoor_gdb_path}\Prelims\Prelim_Wall_Intersect",
-            out_features=rf"{indoor_gdb_path}\Prelims\Prelim_NonIntersected",
-            where_clause="",
-            use_field_alias_as_name="NOT_USE_ALIAS",
-            field_mapping=None,
-            sort_field=None
-        )
+        # connectors between pathway vertices within 1m of a door, deduplicated at 0.01m and paired up to 10
+        # neighbours within 1.3m, found on coordinate arrays instead of point feature classes;
+        # connectors touching or crossing Arc_Walls are dropped before they are appended
+        pathway_vertices = arcpy.da.FeatureClassToNumPyArray(
+            in_table=rf"{indoor_gdb_path}\Prelims\Prelim",
+            field_names=['SHAPE@XY'],
+            explode_to_points=True
+        )['SHAPE@XY']
+        door_segments = feature_io.read_line_segments(rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Doors_All")[1]
+        wall_segments = feature_io.read_line_segments(rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_Arc_Walls")[1]
+        connectors = door_connector.door_connectors(pathway_vertices, door_segments)
+        connectors = connectors[~door_connector.crosses_walls(connectors, wall_segments)]
+        feature_io.write_lines(rf"{indoor_gdb_path}\Prelims\Prelim_Extra", connectors, z_coor_system)
         
         arcpy.management.Append(
             inputs=rf"{indoor_gdb_path}\Prelims\Prelim_Extra",
@@ -578,15 +726,23 @@ def create_pathways(CAD_prefix):
         # From_Level_Name = L1
         # Level_ID = SAIT.N.L1
         
-        with arcpy.da.UpdateCursor(rf"{indoor_gdb_path}\Prelims\Prelim", ['FACILITY_ID', 'FACILITY_NAME', 'LEVEL_NAME_FROM', 'LEVEL_ID']) as cursor:
+        # only rows where any of the four fields differs from the floor's values, the generated pathways and connectors
+        prelim_values = {
+            'FACILITY_ID': facility_id(CAD_prefix),
+            'FACILITY_NAME': facility_id(CAD_prefix),
+            'LEVEL_NAME_FROM': level_name(CAD_prefix),
+            'LEVEL_ID': level_id(CAD_prefix),
+        }
+        with arcpy.da.UpdateCursor(
+            rf"{indoor_gdb_path}\Prelims\Prelim",
+            list(prelim_values),
+            where_clause=' OR '.join(f"{field} IS NULL OR NOT {sql_in(field, [value])}" for field, value in prelim_values.items())
+        ) as cursor:
             for row in cursor:
-                # Store the 'number' value with 'name' as key in the dictionary
-                row[0] = f"SAIT.{CAD_prefix[0]}"
-                row[1] = f"SAIT.{CAD_prefix[0]}"
-                row[2] = f"L{str(int(CAD_prefix[-2:]))}"
-                row[3] = f"SAIT.{CAD_prefix[0]}.L{str(int(CAD_prefix[-2:]))}"
-                cursor.updateRow(row)
+                cursor.updateRow(list(prelim_values.values()))
         
+        # pathways of an earlier run of this floor are replaced, not appended to
+        delete_rows(rf"{indoor_gdb_path}\PrelimNetwork\PrelimPathways", sql_in('LEVEL_ID', [level_id(CAD_prefix)]))
         arcpy.management.Append(
             inputs=rf"{indoor_gdb_path}\Prelims\Prelim",
             target=rf"{indoor_gdb_path}\PrelimNetwork\PrelimPathways",
@@ -598,32 +754,301 @@ def create_pathways(CAD_prefix):
             update_geometry="NOT_UPDATE_GEOMETRY"
         )
         print(f'prelim pathways for layer {CAD_prefix} completed')
+        return True
 
     except Exception as e:
         error_message = f"Error creating prelim pathways for all the layers: {str(e)}"
         log_message_to_table(log_table, error_message, CAD_prefix)
         print(error_message)
+        return False
 
-def fill_database(CAD_prefix):
-    create_log_table()
-    create_annotations(CAD_prefix)
-    create_Arc(CAD_prefix)
-    export_CAD(CAD_prefix)
-    import_CAD(CAD_prefix)
-    print('Indoor database filled for', CAD_prefix)
+def build_routing_graph():
+    message = 'Building the routing graph from PrelimPathways'
+    log_message_to_table(log_table, message, building_prefix)
+    print(message)
+    try:
+        pathways = arcpy.da.FeatureClassToNumPyArray(
+            in_table=rf"{indoor_gdb_path}\PrelimNetwork\PrelimPathways",
+            field_names=['OID@', 'SHAPE@X', 'SHAPE@Y', 'SHAPE@Z', 'LEVEL_ID'],
+            explode_to_points=True,
+            null_value={'LEVEL_ID': ''}
+        )
+        graph = routing.RoutingGraph.from_pathways(
+            pathways['OID@'],
+            np.column_stack((pathways['SHAPE@X'], pathways['SHAPE@Y'], np.nan_to_num(pathways['SHAPE@Z']))),
+            pathways['LEVEL_ID']
+        )
+        os.makedirs(routing_dir, exist_ok=True)
+        graph.save(os.path.join(routing_dir, 'PrelimPathways.npz'))
 
-# duplicate_empty_prelim_pathway()
+        # units are routed from the pathway node closest to their centroid on the same level, keyed by UNIT_ID
+        # (the object ID where it is empty); NAME holds the room number imported from ANNOTATION_NUMBER
+        unit_fc = rf"{indoor_gdb_path}\Indoors\Units"
+        has_unit_id = 'UNIT_ID' in {field.name for field in arcpy.ListFields(unit_fc)}
+        units = arcpy.da.FeatureClassToNumPyArray(
+            in_table=unit_fc,
+            field_names=['OID@', 'NAME', 'LEVEL_ID', 'SHAPE@XY'] + (['UNIT_ID'] if has_unit_id else []),
+            null_value={'NAME': '', 'LEVEL_ID': '', 'UNIT_ID': ''} if has_unit_id else {'NAME': '', 'LEVEL_ID': ''}
+        )
+        unit_ids = [unit_id or str(oid) for oid, unit_id in zip(
+            units['OID@'].tolist(), units['UNIT_ID'].tolist() if has_unit_id else [''] * len(units))]
+        np.savez(
+            os.path.join(routing_dir, 'Unit_Nodes.npz'),
+            unit_id=np.array(unit_ids, dtype=str),
+            name=units['NAME'],
+            level_id=units['LEVEL_ID'],
+            node=graph.nearest_nodes(units['SHAPE@XY'], units['LEVEL_ID'])
+        )
+        print(f'routing graph with {graph.n_nodes} nodes saved to {routing_dir}')
+
+        # landmark index for point to point queries, only rebuilt when a level's pathways changed
+        _, changed_levels = route_index.update_index(graph, os.path.join(routing_dir, 'Landmarks.npz'))
+        if changed_levels:
+            message = f"Rebuilt the landmark index for changed levels {', '.join(changed_levels)}"
+            log_message_to_table(log_table, message, building_prefix)
+            print(message)
+        return True
+
+    except Exception as e:
+        error_message = f"Error building the routing graph: {str(e)}"
+        log_message_to_table(log_table, error_message, building_prefix)
+        print(error_message)
+        return False
+
+# inputs read by each stage, counted for the stage spans
+STAGE_INPUTS = {
+    'create_annotations': ['Annotation'],
+    'join_annotations': ['Units'],
+    'create_Arc': ['Walls', 'Wall_Extra', 'Doors', 'Door_Extra', 'Units'],
+    'export_CAD': ['Arc_Level', 'Arc_Units', 'Arc_Walls', 'Annotation_Number', 'Annotation_Type'],
+    'load_indoors': ['Level_Whole', 'Units', 'Arc_Walls'],
+    'create_pathways': ['Doors_All', 'Arc_Walls'],
+}
+
+# outputs written by each stage, a stage is only recorded as done when all of them exist;
+# the stages writing into the shared Indoor database are checked by the floor's rows, see stage_outputs
+STAGE_OUTPUTS = {
+    'create_annotations': list(annotation_rules.ANNOTATION_OUTPUTS),
+    'create_Arc': ['Doors_All', 'Level_Whole', 'Arc_Level', 'Arc_Units', 'Arc_Walls'],
+}
 
-def main():
-    CAD_prefixs = ['N01', 'N02', 'N03']
-    for CAD_prefix in CAD_prefixs:
-        fill_database(CAD_prefix)
-        create_pathways(CAD_prefix)
+def floor_datasets(CAD_prefix, names):
+    return [rf"{default_gdb}\{CAD_prefix}\{CAD_prefix}_{name}" for name in names]
 
+def stage_outputs(stage, CAD_prefix):
+    if stage == 'export_CAD':
+        return [os.path.join(CAD_output_dir, f'{CAD_prefix}.dwg')]
+    if stage in ('import_CAD', 'load_indoors'):
+        return [checkpoint.TableRows(rf"{indoor_gdb_path}\Indoors\Levels", sql_in('NAME', [level_name(CAD_prefix)]))]
+    if stage == 'create_pathways':
+        return [checkpoint.TableRows(rf"{indoor_gdb_path}\PrelimNetwork\PrelimPathways", sql_in('LEVEL_ID', [level_id(CAD_prefix)]))]
+    return floor_datasets(CAD_prefix, STAGE_OUTPUTS.get(stage, []))
 
+def stage_fingerprints(CAD_prefix):
+    # fingerprint of every stage of one floor, chained so that a change upstream reruns everything after it
+    def sources(stage):
+        return [checkpoint.dataset_fingerprint(dataset, ['Handle']) for dataset in floor_datasets(CAD_prefix, STAGE_INPUTS[stage])]
+    annotations = checkpoint.fingerprint(sources('create_annotations'), checkpoint.code_fingerprint(create_annotations, split_annotations, annotation_rules))
+    joined = checkpoint.fingerprint(annotations, sources('join_annotations'), checkpoint.code_fingerprint(join_annotations, annotation_join))
+    # the switches between the arcpy tools and their native replacements change the outputs as much as the code does
+    arc_flags = {'native_door_openings': native_door_openings, 'native_level_footprint': native_level_footprint}
+    arc = checkpoint.fingerprint(sources('create_Arc'), arc_flags, checkpoint.code_fingerprint(create_Arc, build_level_footprint, cut_door_openings, door_openings, level_footprint, workflow))
+    export = checkpoint.fingerprint(annotations, arc, checkpoint.code_fingerprint(export_CAD))
+    if direct_indoors_load:
+        imported = checkpoint.fingerprint(joined, arc, checkpoint.code_fingerprint(load_indoors, indoors_loader))
+    else:
+        imported = checkpoint.fingerprint(export, checkpoint.code_fingerprint(import_CAD))
+    pathways = checkpoint.fingerprint(imported, arc, checkpoint.code_fingerprint(create_pathways, door_connector))
+    return {
+        'create_annotations': annotations,
+        'join_annotations': joined,
+        'create_Arc': arc,
+        'export_CAD': export,
+        'import_CAD': imported,
+        'load_indoors': imported,
+        'create_pathways': pathways,
+    }
 
+def run_stage(stage, func, CAD_prefix, fingerprints):
+    checkpoints = checkpoint.Checkpoints(checkpoint_dir, CAD_prefix)
+    outputs = stage_outputs(stage, CAD_prefix)
+    if checkpoints.is_current(stage, fingerprints[stage], outputs):
+        message = f'Skipping {stage} for {CAD_prefix}, inputs unchanged since the last run'
+        log_message_to_table(log_table, message, CAD_prefix)
+        print(message)
+        return
+    # stale outputs must not make a failed run look successful,
+    # rows in the shared Indoor database are replaced per floor by the stage itself
+    datasets = [output for output in outputs if not isinstance(output, checkpoint.TableRows)]
+    for output in datasets:
+        if os.path.isfile(output):
+            os.remove(output)
+        elif arcpy.Exists(output):
+            arcpy.management.Delete(output)
+    input_count = instrumentation.feature_count(floor_datasets(CAD_prefix, STAGE_INPUTS.get(stage, [])))
+    with tracer.span(stage, CAD_prefix, input_count=input_count) as span:
+        succeeded = func(CAD_prefix)
+        span.set(output_count=instrumentation.feature_count(datasets))
+    if succeeded is not False and all(checkpoint.output_exists(output) for output in outputs):
+        checkpoints.record(stage, fingerprints[stage])
 
+def load_floor(CAD_prefix, fingerprints):
+    # the floor goes into the Indoors schema either directly or through the exported DWG
+    if direct_indoors_load:
+        run_stage('load_indoors', load_indoors, CAD_prefix, fingerprints)
+    else:
+        run_stage('import_CAD', import_CAD, CAD_prefix, fingerprints)
 
+def fill_database(CAD_prefix):
+    configure()
+    create_log_table()
+    fingerprints = stage_fingerprints(CAD_prefix)
+    run_stage('create_annotations', create_annotations, CAD_prefix, fingerprints)
+    run_stage('join_annotations', join_annotations, CAD_prefix, fingerprints)
+    run_stage('create_Arc', create_Arc, CAD_prefix, fingerprints)
+    if export_dwg or not direct_indoors_load:
+        run_stage('export_CAD', export_CAD, CAD_prefix, fingerprints)
+    load_floor(CAD_prefix, fingerprints)
+    flush_log()
+    print('Indoor database filled for', CAD_prefix)
+    return fingerprints
+# outputs of the per-floor stages that are copied back from the scratch workspace,
+# Units carries the RMNUMBER and ROOMNAME written by join_annotations
+ARC_OUTPUTS = ['Units', 'Annotation_Type', 'Annotation_Number', 'Doors_All', 'Level', 'Level_Polygon', 'Level_Whole', 'Arc_Level', 'Arc_Units', 'Doors_Buffer', 'Arc_Walls']
+
+def produced_outputs():
+    # the ARC_OUTPUTS that create_Arc leaves with the current switches: Level, Level_Polygon and Doors_Buffer
+    # are intermediates, only persisted with keep_intermediates, and native_door_openings buffers no doors
+    dropped = set()
+    if not keep_intermediates:
+        dropped |= {'Level', 'Level_Polygon', 'Doors_Buffer'}
+    if native_door_openings:
+        dropped.add('Doors_Buffer')
+    return [name for name in ARC_OUTPUTS if name not in dropped]
+
+def prepare_floor(CAD_prefix):
+    # worker entry point: annotations, Arc layers and DWG export of one floor in its own scratch workspace
+    # a worker process can prepare several floors, so the floor's inputs come from the session's shared
+    # geodatabase and default_gdb only points at the scratch workspace while this floor is prepared
+    global default_gdb, log_table
+    configure()
+    # only the spans of this floor go back, the worker's tracer still holds those of its earlier floors
+    first_span = len(tracer.spans)
+    shared_gdb = current_session.default_gdb
+    scratch_gdb = floor_pool.scratch_workspace(scratch_dir, CAD_prefix)
+    floor_pool.copy_outputs(shared_gdb, scratch_gdb, [CAD_prefix])
+    default_gdb = arcpy.env.workspace = scratch_gdb
+    log_table = rf"{scratch_gdb}\Process_Log"
+    try:
+        if arcpy.Exists(log_table):
+            arcpy.management.Delete(log_table)
+        create_log_table()
+        fingerprints = stage_fingerprints(CAD_prefix)
+        run_stage('create_annotations', create_annotations, CAD_prefix, fingerprints)
+        run_stage('join_annotations', join_annotations, CAD_prefix, fingerprints)
+        run_stage('create_Arc', create_Arc, CAD_prefix, fingerprints)
+        if export_dwg or not direct_indoors_load:
+            run_stage('export_CAD', export_CAD, CAD_prefix, fingerprints)
+        flush_log()
+    finally:
+        default_gdb = arcpy.env.workspace = shared_gdb
+        log_table = rf"{shared_gdb}\Process_Log"
+    return scratch_gdb, fingerprints, tracer.spans[first_span:]
 
+def merge_floor(CAD_prefix, scratch_gdb):
+    # copy the floor outputs and its log rows back into the shared default geodatabase
+    message = f'Merging outputs of layer {CAD_prefix} from {scratch_gdb}'
+    log_message_to_table(log_table, message, CAD_prefix)
+    print(message)
+    produced = produced_outputs()
+    floor_pool.copy_outputs(
+        rf"{scratch_gdb}\{CAD_prefix}",
+        rf"{default_gdb}\{CAD_prefix}",
+        [f'{CAD_prefix}_{name}' for name in produced]
+    )
+    # copies left in the shared dataset by runs with other switches would look like this run's outputs
+    floor_pool.delete_outputs(
+        rf"{default_gdb}\{CAD_prefix}",
+        [f'{CAD_prefix}_{name}' for name in ARC_OUTPUTS if name not in produced]
+    )
+    arcpy.management.Append(
+        inputs=rf"{scratch_gdb}\Process_Log",
+        target=log_table,
+        schema_type="NO_TEST"
+    )
+
+# duplicate_empty_prelim_pathway()
+
+def main(processes=1, CAD_prefixs=None, home=None, settings=None):
+    # settings: switches by name (see SETTINGS), the module values are kept for those not given
+    apply_settings(settings or {})
+    configure(home)
+    CAD_prefixs = CAD_prefixs or ['N01', 'N02', 'N03']
+    if processes == 1:
+        floor_fingerprints = {CAD_prefix: fill_database(CAD_prefix) for CAD_prefix in CAD_prefixs}
+        # IDs of all imported floors in one pass per table, before any pathways are generated
+        with tracer.span('normalize_ids', building_prefix):
+            normalize_ids(CAD_prefixs)
+        for CAD_prefix, fingerprints in floor_fingerprints.items():
+            run_stage('create_pathways', create_pathways, CAD_prefix, fingerprints)
+            flush_log()
+        with tracer.span('build_routing_graph', building_prefix):
+            build_routing_graph()
+        flush_log()
+        export_trace()
+        return
 
+    # floors are prepared side by side, the shared Indoor database is only written serially
+    create_log_table()
+    results = floor_pool.run_floors(
+        prepare_floor,
+        CAD_prefixs,
+        processes=processes,
+        env=current_session.environment(),
+        initializer=apply_settings,
+        initargs=(current_settings(),)
+    )
+    floor_fingerprints = {}
+    for CAD_prefix, result, error_message in results:
+        if error_message:
+            error_message = f"Error preparing layer {CAD_prefix} in a worker process: {error_message}"
+            log_message_to_table(log_table, error_message, CAD_prefix)
+            print(error_message)
+            continue
+        scratch_gdb, fingerprints, spans = result
+        tracer.extend(spans)
+        merge_floor(CAD_prefix, scratch_gdb)
+        load_floor(CAD_prefix, fingerprints)
+        print('Indoor database filled for', CAD_prefix)
+        floor_fingerprints[CAD_prefix] = fingerprints
+        flush_log()
+    with tracer.span('normalize_ids', building_prefix):
+        normalize_ids(list(floor_fingerprints))
+    for CAD_prefix, fingerprints in floor_fingerprints.items():
+        run_stage('create_pathways', create_pathways, CAD_prefix, fingerprints)
+        flush_log()
+    with tracer.span('build_routing_graph', building_prefix):
+        build_routing_graph()
+    flush_log()
+    export_trace()
 
+if __name__ == '__main__':
+    # python indoor_network.py --home D:\SAIT --floors N01 N02 N03 --processes 3 --direct-indoors-load --no-export-dwg
+    parser = argparse.ArgumentParser(description='Fill the Indoor geodatabase and build the pathways of every floor')
+    parser.add_argument('--home', help='project home folder with the building geodatabase, the Pro project home when omitted')
+    parser.add_argument('--floors', nargs='+', default=['N01', 'N02', 'N03'])
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--keep-intermediates', action=argparse.BooleanOptionalAction, default=keep_intermediates,
+                        help='keep the create_Arc intermediates in the floor dataset')
+    parser.add_argument('--trace-memory', action=argparse.BooleanOptionalAction, default=trace_memory,
+                        help='record the peak python memory of every stage, slows the run down')
+    parser.add_argument('--native-door-openings', action=argparse.BooleanOptionalAction, default=native_door_openings,
+                        help='cut the door openings by interval subtraction instead of Buffer and Erase')
+    parser.add_argument('--native-level-footprint', action=argparse.BooleanOptionalAction, default=native_level_footprint,
+                        help='build Level_Whole in process instead of with AggregatePolygons')
+    parser.add_argument('--direct-indoors-load', action=argparse.BooleanOptionalAction, default=direct_indoors_load,
+                        help='write the floors straight into the Indoors schema instead of through a DWG')
+    parser.add_argument('--export-dwg', action=argparse.BooleanOptionalAction, default=export_dwg,
+                        help='still export the DWG with --direct-indoors-load')
+    args = parser.parse_args()
+    main(args.processes, args.floors, args.home, {name: getattr(args, name) for name in SETTINGS})
@@ -0,0 +1,192 @@
+# direct hand-off of a floor's level, units and details to the Indoors schema
+# replaces the ExportCAD to DWG / ImportCADToIndoorDataset round trip: records are plain dicts of field values
+# with 'rings' (polygons) or 'paths' (lines) of (x, y) coordinates and a 'z', so they can be written to the
+# Indoors geodatabase or to the file based stand-in that works without ArcGIS
+
+import json
+import os
+
+import numpy as np
+
+# ImportCADToIndoorDataset level_elevation, 5 m per vertical order
+FLOOR_HEIGHT = 5.0
+
+# table -> field that identifies the rows of one floor, rows are replaced per floor so reloading is idempotent
+FLOOR_KEYS = {
+    'Facilities': 'FACILITY_ID',
+    'Levels': 'LEVEL_ID',
+    'Units': 'LEVEL_ID',
+    'Details': 'LEVEL_ID',
+}
+
+def facility_id(CAD_prefix):
+    return f"SAIT.{CAD_prefix[0]}"
+
+def level_name(CAD_prefix):
+    return f"L{str(int(CAD_prefix[-2:]))}"
+
+def level_id(CAD_prefix):
+    return f"{facility_id(CAD_prefix)}.{level_name(CAD_prefix)}"
+
+def vertical_order(CAD_prefix):
+    return int(CAD_prefix[-2:]) - 1
+
+def floor_records(CAD_prefix, level_polygons, unit_polygons, unit_names, unit_use_types, detail_paths):
+    # records of every Indoors table for one floor, polygons are lists of rings, detail_paths lists of paths
+    # the first floor also carries the facility footprint, as ImportCADToIndoorDataset did
+    level = {
+        'FACILITY_ID': facility_id(CAD_prefix),
+        'LEVEL_ID': level_id(CAD_prefix),
+        'z': vertical_order(CAD_prefix) * FLOOR_HEIGHT,
+    }
+    level_rings = [ring for polygon in level_polygons for ring in polygon]
+    records = {
+        'Facilities': [],
+        'Levels': [dict(
+            level,
+            NAME=level_name(CAD_prefix),
+            NAME_SHORT=level_name(CAD_prefix),
+            LEVEL_NUMBER=int(CAD_prefix[-2:]),
+            VERTICAL_ORDER=vertical_order(CAD_prefix),
+            ELEVATION_RELATIVE=level['z'],
+            rings=level_rings,
+        )],
+        # room numbers can be empty or repeated, UNIT_ID tells the units of a level apart
+        'Units': [
+            dict(level, UNIT_ID=f'{level_id(CAD_prefix)}.{number}', NAME=name, USE_TYPE=use_type, rings=rings)
+            for number, (rings, name, use_type) in enumerate(zip(unit_polygons, unit_names, unit_use_types), 1)
+        ],
+        'Details': [
+            dict(level, USE_TYPE=f'{CAD_prefix}_Arc_Walls', paths=paths)
+            for paths in detail_paths
+        ],
+    }
+    if vertical_order(CAD_prefix) == 0:
+        records['Facilities'].append({
+            'FACILITY_ID': facility_id(CAD_prefix),
+            'NAME': facility_id(CAD_prefix),
+            'z': 0.0,
+            'rings': level_rings,
+        })
+    return records
+
+def group_rings(rings):
+    # rings of a record as polygons, each its exterior followed by its holes; a ring inside an odd number of the
+    # other rings is a hole of the innermost exterior around it, however the rings are wound
+    if len(rings) < 2:
+        return [list(rings)] if len(rings) else []
+    rings = [np.asarray(ring, dtype=float).reshape(-1, 2) for ring in rings]
+    first = np.array([ring[0] for ring in rings])
+    # containing[i, j]: first vertex of ring i inside ring j, even-odd
+    containing = np.zeros((len(rings), len(rings)), dtype=bool)
+    for j, ring in enumerate(rings):
+        a, b = ring, np.roll(ring, -1, axis=0)
+        straddles = (a[None, :, 1] > first[:, None, 1]) != (b[None, :, 1] > first[:, None, 1])
+        dy = np.where(straddles, b[None, :, 1] - a[None, :, 1], 1.0)
+        x_cross = a[None, :, 0] + (first[:, None, 1] - a[None, :, 1]) * (b[None, :, 0] - a[None, :, 0]) / dy
+        containing[:, j] = (straddles & (first[:, None, 0] < x_cross)).sum(axis=1) % 2 == 1
+    np.fill_diagonal(containing, False)
+    depth = containing.sum(axis=1)
+    exteriors = np.flatnonzero(depth % 2 == 0)
+    polygons = {exterior: [rings[exterior]] for exterior in exteriors.tolist()}
+    for hole in np.flatnonzero(depth % 2 == 1).tolist():
+        around = exteriors[containing[hole, exteriors]]
+        polygons[int(around[np.argmax(depth[around])])].append(rings[hole])
+    return list(polygons.values())
+
+def load_floor(writer, records):
+    # replace the floor's rows in every table, a floor without units or details loses its old ones;
+    # the facility is only replaced by the floor that carries it
+    level = records['Levels'][0]
+    for table, key_field in FLOOR_KEYS.items():
+        if records[table] or table != 'Facilities':
+            writer.replace(table, key_field, level[key_field], records[table])
+
+class FileIndoorsWriter:
+    # file based stand-in for the Indoors schema, one GeoJSON feature collection per table in a folder
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, table):
+        return os.path.join(self.folder, f'{table}.geojson')
+
+    def read(self, table):
+        if not os.path.exists(self.path(table)):
+            return []
+        with open(self.path(table)) as f:
+            features = json.load(f)['features']
+        records = []
+        for feature in features:
+            record = dict(feature['properties'])
+            geometry = feature['geometry']
+            coordinates = geometry['coordinates']
+            if geometry['type'] == 'MultiPolygon':
+                coordinates = [ring for polygon in coordinates for ring in polygon]
+            key = 'rings' if geometry['type'] in ('Polygon', 'MultiPolygon') else 'paths'
+            record[key] = [[point[:2] for point in part] for part in coordinates]
+            record['z'] = coordinates[0][0][2] if coordinates and coordinates[0] else 0.0
+            records.append(record)
+        return records
+
+    def replace(self, table, key_field, key, records):
+        kept = [record for record in self.read(table) if record.get(key_field) != key]
+        features = []
+        for record in kept + list(records):
+            z = record.get('z', 0.0)
+            if 'rings' in record:
+                # several exterior rings (multipart units, level footprints of several polygons) make a MultiPolygon
+                polygons = [[[[float(x), float(y), z] for x, y in ring] for ring in polygon]
+                            for polygon in group_rings(record['rings'])]
+                geometry = ({'type': 'MultiPolygon', 'coordinates': polygons} if len(polygons) > 1 else
+                            {'type': 'Polygon', 'coordinates': polygons[0] if polygons else []})
+            else:
+                geometry = {
+                    'type': 'MultiLineString',
+                    'coordinates': [[[float(x), float(y), z] for x, y in part] for part in record['paths']],
+                }
+            features.append({
+                'type': 'Feature',
+                'properties': {field: value for field, value in record.items() if field not in ('rings', 'paths', 'z')},
+                'geometry': geometry,
+            })
+        temp_path = self.path(table) + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f)
+        os.replace(temp_path, self.path(table))
+
+class GeodatabaseIndoorsWriter:
+    # Indoors feature classes of the Indoor geodatabase, only fields present in the target are written
+
+    def __init__(self, indoor_gdb_path, spatial_reference):
+        self.indoor_gdb_path = indoor_gdb_path
+        self.spatial_reference = spatial_reference
+
+    def path(self, table):
+        return os.path.join(self.indoor_gdb_path, 'Indoors', table)
+
+    def _geometry(self, record):
+        import arcpy
+        z = record.get('z', 0.0)
+        parts = arcpy.Array([
+            arcpy.Array([arcpy.Point(x, y, z) for x, y in part])
+            for part in record['rings' if 'rings' in record else 'paths']
+        ])
+        if 'rings' in record:
+            return arcpy.Polygon(parts, self.spatial_reference, True)
+        return arcpy.Polyline(parts, self.spatial_reference, True)
+
+    def replace(self, table, key_field, key, records):
+        import arcpy
+        path = self.path(table)
+        available = {field.name for field in arcpy.ListFields(path)}
+        with arcpy.da.UpdateCursor(path, [key_field], where_clause=f"{key_field} = '{key}'") as cursor:
+            for _ in cursor:
+                cursor.deleteRow()
+        if not records:
+            return
+        fields = [field for field in records[0] if field in available]
+        with arcpy.da.InsertCursor(path, fields + ['SHAPE@']) as cursor:
+            for record in records:
+                cursor.insertRow([record[field] for field in fields] + [self._geometry(record)])
@@ -0,0 +1,136 @@
+# timed stage spans and log messages, buffered in memory and written to the log table in one batch
+# spans record wall time, input/output feature counts and, when memory tracing is started, the peak python heap
+# (tracemalloc slows every allocation and does not see the native memory of arcpy, so it is opt-in),
+# and can be exported as JSON or as a Chrome trace (chrome://tracing, Perfetto)
+
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+LOG_FIELDS = [
+    ('Timestamp', 'TEXT'),
+    ('CADPrefix', 'TEXT'),
+    ('Message', 'TEXT'),
+    ('Stage', 'TEXT'),
+    ('DurationSec', 'DOUBLE'),
+    ('PeakMemoryMB', 'DOUBLE'),
+    ('InputCount', 'LONG'),
+    ('OutputCount', 'LONG'),
+]
+
+class Span(dict):
+
+    def set(self, **values):
+        self.update(values)
+
+class Tracer:
+
+    def __init__(self, trace_memory=False):
+        self.spans = []
+        self.rows = []
+        self.trace_memory = False
+        self._stack = []
+        if trace_memory:
+            self.start_memory_tracing()
+
+    def start_memory_tracing(self):
+        # peak memory of the spans opened from now on
+        self.trace_memory = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def current_stage(self):
+        return self._stack[-1]['name'] if self._stack else None
+
+    def message(self, message, CAD_prefix):
+        # buffered log row, written by flush()
+        self.rows.append((str(datetime.datetime.now()), CAD_prefix, message, self.current_stage(), None, None, None, None))
+
+    @contextlib.contextmanager
+    def span(self, name, CAD_prefix=None, input_count=None, output_count=None):
+        span = Span(name=name, CAD_prefix=CAD_prefix, input_count=input_count, output_count=output_count,
+                    start=time.time(), pid=os.getpid(), tid=threading.get_ident(), error=None)
+        if self.trace_memory:
+            # a nested span resets the peak, so the parent keeps the highest peak seen so far
+            if self._stack:
+                parent = self._stack[-1]
+                parent['_peak'] = max(parent.get('_peak', 0), tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            span['_peak'] = 0
+        self._stack.append(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = str(e)
+            raise
+        finally:
+            span['duration'] = time.perf_counter() - started
+            self._stack.pop()
+            peak = span.pop('_peak', None)
+            if peak is not None:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                span['peak_memory_mb'] = peak / 2 ** 20
+                if self._stack:
+                    self._stack[-1]['_peak'] = max(self._stack[-1].get('_peak', 0), peak)
+            else:
+                span['peak_memory_mb'] = None
+            self.spans.append(span)
+            status = 'failed' if span['error'] else 'finished'
+            self.rows.append((str(datetime.datetime.now()), CAD_prefix, f'{name} {status} in {span["duration"]:.2f}s',
+                              name, span['duration'], span['peak_memory_mb'], span['input_count'], span['output_count']))
+
+    def extend(self, spans):
+        # spans recorded in a worker process
+        self.spans.extend(spans)
+
+    def flush(self, log_table):
+        # one InsertCursor for all buffered rows
+        import arcpy
+        if not self.rows:
+            return
+        with arcpy.da.InsertCursor(log_table, [field for field, _ in LOG_FIELDS]) as cursor:
+            for row in self.rows:
+                cursor.insertRow(row)
+        self.rows = []
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.spans, f, indent=2, default=str)
+
+    def to_chrome_trace(self, path):
+        events = []
+        for span in self.spans:
+            events.append({
+                'name': span['name'],
+                'cat': span['CAD_prefix'] or '',
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['duration'] * 1e6,
+                'pid': span['pid'],
+                'tid': span['tid'],
+                'args': {key: span[key] for key in ('CAD_prefix', 'input_count', 'output_count', 'peak_memory_mb', 'error')},
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+def create_log_fields(log_table):
+    # older log tables only have Timestamp, CADPrefix and Message
+    import arcpy
+    existing = {field.name for field in arcpy.ListFields(log_table)}
+    for field, field_type in LOG_FIELDS:
+        if field not in existing:
+            arcpy.management.AddField(log_table, field, field_type)
+
+def feature_count(paths):
+    # total number of features in the given datasets, files like the exported DWG are not counted
+    import arcpy
+    count = 0
+    for path in paths:
+        if not os.path.isfile(path) and arcpy.Exists(path):
+            count += int(arcpy.management.GetCount(path)[0])
+    return count
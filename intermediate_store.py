@@ -0,0 +1,160 @@
+# where pipeline intermediates live between stages
+# by default they stay in memory and only final outputs are written to the geodatabase,
+# with keep_intermediates they are written to disk as before so they can be inspected;
+# array intermediates of the numpy stages go to a columnar folder instead of a feature class
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+class ArrayStore:
+    # plain dict of numpy arrays, for the pure python stages and for tests without arcpy
+
+    def __init__(self):
+        self.arrays = {}
+
+    def path(self, name):
+        return name
+
+    def put(self, name, array):
+        self.arrays[name] = array
+        return self.path(name)
+
+    def get(self, name):
+        return self.arrays[name]
+
+    def exists(self, name):
+        return name in self.arrays
+
+    def clear(self):
+        self.arrays.clear()
+
+def write_columns(path, columns):
+    # one .npy file per column (flat coordinates, offsets, typed attributes) in the folder path,
+    # the manifest is written last so a partly written dataset is never read
+    os.makedirs(path, exist_ok=True)
+    manifest = os.path.join(path, 'columns.json')
+    if os.path.exists(manifest):
+        os.remove(manifest)
+    shapes = {}
+    for name, column in columns.items():
+        column = np.asarray(column)
+        if column.dtype == object:
+            column = column.astype(str)
+        np.save(os.path.join(path, f'{name}.npy'), column, allow_pickle=False)
+        shapes[name] = list(column.shape)
+    with open(manifest, 'w') as f:
+        json.dump(shapes, f)
+
+def read_columns(path, mmap=True):
+    # columns as read-only memory maps, nothing is copied until a column is used; works in any process
+    with open(os.path.join(path, 'columns.json')) as f:
+        shapes = json.load(f)
+    return {
+        # empty files cannot be memory mapped
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap and np.prod(shape) else None, allow_pickle=False)
+        for name, shape in shapes.items()
+    }
+
+def _columns(array):
+    if isinstance(array, dict):
+        return array
+    return {name: array[name] for name in array.dtype.names}
+
+class ColumnarStore:
+    # array intermediates as columnar folders on disk, read back memory mapped, so large vertex arrays are
+    # passed between stages and worker processes by path instead of being pickled or copied
+
+    def __init__(self, directory, keep=True):
+        self.directory = directory
+        self.keep = keep
+        self.names = set()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def put(self, name, array):
+        # array: dict of columns or a structured array, whose fields become the columns
+        self.names.add(name)
+        write_columns(self.path(name), _columns(array))
+        return self.path(name)
+
+    def get(self, name):
+        return read_columns(self.path(name))
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.path(name), 'columns.json'))
+
+    def remove(self, name):
+        # one folder, once its reader is done with it (memory maps closed)
+        if self.keep:
+            return
+        shutil.rmtree(self.path(name), ignore_errors=True)
+        self.names.discard(name)
+
+    def clear(self):
+        if self.keep:
+            return
+        for name in sorted(self.names):
+            shutil.rmtree(self.path(name), ignore_errors=True)
+        self.names.clear()
+
+class GeodatabaseStore:
+    # intermediates are feature classes and tables in a workspace on disk, nothing is cleared
+
+    def __init__(self, workspace):
+        self.workspace = workspace
+
+    def path(self, name):
+        return os.path.join(self.workspace, name)
+
+    def put(self, name, array):
+        import arcpy
+        path = self.path(name)
+        if arcpy.Exists(path):
+            arcpy.management.Delete(path)
+        arcpy.da.NumPyArrayToTable(array, path)
+        return path
+
+    def get(self, name):
+        import arcpy
+        return arcpy.da.TableToNumPyArray(self.path(name), '*')
+
+    def exists(self, name):
+        import arcpy
+        return arcpy.Exists(self.path(name))
+
+    def clear(self):
+        pass
+
+class MemoryStore(GeodatabaseStore):
+    # intermediates are written to the arcpy memory workspace and deleted once the stage is done
+
+    def __init__(self):
+        super().__init__('memory')
+        self.names = set()
+
+    def path(self, name):
+        self.names.add(name)
+        return rf"memory\{name}"
+
+    def clear(self):
+        import arcpy
+        for name in sorted(self.names):
+            path = rf"memory\{name}"
+            if arcpy.Exists(path):
+                arcpy.management.Delete(path)
+        self.names.clear()
+
+def make_store(workspace, keep_intermediates=False):
+    if keep_intermediates:
+        return GeodatabaseStore(workspace)
+    return MemoryStore()
+
+def make_array_store(directory, keep_intermediates=False):
+    # store for intermediates that never leave numpy, kept as columnar folders for inspection
+    if keep_intermediates:
+        return ColumnarStore(directory)
+    return ArrayStore()
@@ -0,0 +1,153 @@
+# level footprint as the union of the level and unit polygons, pure numpy alternative to AggregatePolygons
+# all ring edges go into one noded arrangement together with bridges across the gaps between polygons up to the
+# aggregation distance; its faces are kept when they lie inside an input polygon or are no wider than the
+# distance (the gaps closed by the bridges), edges shared by two kept faces cancel and the rest are traced into
+# the footprint rings, exterior rings counter-clockwise and holes clockwise
+
+import numpy as np
+
+import noding
+import polygonize
+import spatial_index
+import unit_filter
+
+# aggregation_distance of the former AggregatePolygons step
+AGGREGATION_DISTANCE = 0.05
+SNAP_TOLERANCE = polygonize.SNAP_TOLERANCE
+
+def gap_bridges(edges, edge_polygon, distance=AGGREGATION_DISTANCE, tolerance=SNAP_TOLERANCE):
+    # (m, 4) segments from every ring vertex to the closest point of each other polygon within the distance,
+    # a vertex touching a polygon is not across a gap from it
+    empty = np.empty((0, 4))
+    if not len(edges):
+        return empty
+    vertices = edges[:, :2]
+    tree = spatial_index.STRTree(spatial_index.segment_bounds(edges) + [-distance, -distance, distance, distance])
+    vertex_ids, edge_ids = tree.query(np.hstack((vertices, vertices)))
+    other = edge_polygon[vertex_ids] != edge_polygon[edge_ids]
+    vertex_ids, edge_ids = vertex_ids[other], edge_ids[other]
+    if not len(vertex_ids):
+        return empty
+    dist, near = spatial_index.point_segment_distance(vertices[vertex_ids], edges[edge_ids])
+
+    # closest edge of every (vertex, polygon) pair
+    near_polygon = edge_polygon[edge_ids]
+    order = np.lexsort((dist, near_polygon, vertex_ids))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (vertex_ids[order][1:] != vertex_ids[order][:-1]) | (near_polygon[order][1:] != near_polygon[order][:-1])
+    order = order[first]
+    gap = (dist[order] > tolerance) & (dist[order] <= distance)
+    return np.hstack((vertices[vertex_ids[order[gap]]], near[order[gap]]))
+
+def containing_polygons(points, xy, ring_offsets, ring_polygon, n_polygons):
+    # (point index, polygon index) of every polygon containing a point, even-odd over the STRTree candidates;
+    # rings must be packed in polygon order, as pack_polygons and polygonize write them
+    a, b, edge_ring = unit_filter.ring_edges(xy, ring_offsets)
+    edge_polygon = ring_polygon[edge_ring]
+    bounds = np.full((n_polygons, 4), [np.inf, np.inf, -np.inf, -np.inf])
+    for column, reduce, coordinate in ((0, np.minimum, 0), (1, np.minimum, 1), (2, np.maximum, 0), (3, np.maximum, 1)):
+        reduce.at(bounds[:, column], edge_polygon, a[:, coordinate])
+    point_ids, polygon_ids = spatial_index.STRTree(bounds).query(np.hstack((points, points)))
+
+    # every candidate pair against all edges of its polygon
+    edge_start = np.searchsorted(edge_polygon, np.arange(n_polygons + 1), 'left')
+    counts = edge_start[polygon_ids + 1] - edge_start[polygon_ids]
+    pair = np.repeat(np.arange(len(point_ids)), counts)
+    edge = spatial_index.expand_ranges(edge_start[polygon_ids], counts)
+    p = points[point_ids[pair]]
+    straddles = (a[edge, 1] > p[:, 1]) != (b[edge, 1] > p[:, 1])
+    dy = np.where(straddles, b[edge, 1] - a[edge, 1], 1.0)
+    x_cross = a[edge, 0] + (p[:, 1] - a[edge, 1]) * (b[edge, 0] - a[edge, 0]) / dy
+    inside = np.bincount(pair, straddles & (p[:, 0] < x_cross), minlength=len(point_ids)) % 2 == 1
+    return point_ids[inside], polygon_ids[inside]
+
+def left_points(a, b, offset):
+    # points just left of the edge midpoints, inside a counter-clockwise ring or outside a clockwise one
+    direction = b - a
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    normal = np.column_stack((-direction[:, 1], direction[:, 0])) / np.where(length > 0, length, 1.0)[:, None]
+    return (a + b) / 2 + normal * np.reshape(offset, (-1, 1))
+
+def face_points(faces, tolerance=SNAP_TOLERANCE):
+    # a point inside every face, next to the middle of the longest edge of its exterior ring
+    xy, ring_offsets, ring_polygon = faces['xy'], faces['ring_offsets'], faces['ring_polygon']
+    a, b, edge_ring = unit_filter.ring_edges(xy, ring_offsets)
+    first_ring = np.searchsorted(ring_polygon, np.arange(faces['n_polygons']), 'left')
+    exterior = np.flatnonzero(edge_ring == first_ring[ring_polygon[edge_ring]])
+    length = np.hypot(*(b[exterior] - a[exterior]).T)
+    order = np.lexsort((-length, ring_polygon[edge_ring[exterior]]))
+    longest = order[np.searchsorted(ring_polygon[edge_ring[exterior]][order], np.arange(faces['n_polygons']), 'left')]
+    # a triangle on the longest edge is at least half its height deep at the middle of that edge
+    offset = np.minimum(tolerance / 2, faces['area'] / (2 * length[longest]))
+    return left_points(a[exterior[longest]], b[exterior[longest]], offset)
+
+def dissolve(faces, keep, tolerance=SNAP_TOLERANCE):
+    # rings of the union of the kept faces: edges shared by two kept faces cancel, the others have the union on
+    # their left and are traced like polygonize traces faces; returns the rings and their signed areas
+    xy, ring_offsets, ring_polygon = faces['xy'], faces['ring_offsets'], faces['ring_polygon']
+    a, b, edge_ring = unit_filter.ring_edges(xy, ring_offsets)
+    kept = keep[ring_polygon[edge_ring]]
+    nodes, node_ids = spatial_index.snap_to_grid(np.hstack((a[kept], b[kept])).reshape(-1, 2), tolerance)
+    u, v = node_ids[0::2], node_ids[1::2]
+    _, edge_key, edge_count = np.unique(np.minimum(u, v) * len(nodes) + np.maximum(u, v),
+                                        return_inverse=True, return_counts=True)
+    boundary = (edge_count[edge_key.ravel()] == 1) & (u != v)
+    u, v = u[boundary], v[boundary]
+    if not len(u):
+        return [], np.empty(0)
+
+    # half-edge 2i runs u -> v along boundary edge i, so its cycle keeps the union on the left
+    origin, dest, label, rank = polygonize.trace_cycles(nodes, u, v)
+    cycles = np.unique(label[0::2])
+    order = np.lexsort((rank, label))
+    order = order[np.isin(label[order], cycles)]
+    starts = np.searchsorted(label[order], cycles, 'left')
+    ring_xy = np.split(nodes[origin[order]], starts[1:])
+    cross = nodes[origin, 0] * nodes[dest, 1] - nodes[dest, 0] * nodes[origin, 1]
+    ring_area = np.bincount(label, cross, minlength=len(origin))[cycles] / 2
+    return ring_xy, ring_area
+
+def assemble(ring_xy, ring_area, tolerance=SNAP_TOLERANCE):
+    # polygons as lists of rings, every hole after the smallest exterior ring around it, largest polygon first
+    exteriors = np.flatnonzero(ring_area > 0)
+    exteriors = exteriors[np.argsort(-ring_area[exteriors], kind='stable')]
+    polygons = [[ring_xy[ring]] for ring in exteriors]
+    holes = np.flatnonzero(ring_area < 0)
+    if not len(holes) or not len(exteriors):
+        return polygons
+    # a point just outside every hole, inside the union, tested against the exterior rings
+    points = left_points(np.array([ring_xy[ring][0] for ring in holes]),
+                         np.array([ring_xy[ring][1] for ring in holes]), tolerance / 2)
+    xy, ring_offsets, ring_polygon = unit_filter.pack_polygons(polygons)
+    hole_ids, polygon_ids = containing_polygons(points, xy, ring_offsets, ring_polygon, len(polygons))
+    # polygons are sorted by decreasing area, so the last containing one is the smallest
+    order = np.lexsort((polygon_ids, hole_ids))
+    last = np.append(hole_ids[order][1:] != hole_ids[order][:-1], True)
+    for hole, polygon in zip(hole_ids[order][last], polygon_ids[order][last]):
+        polygons[polygon].append(ring_xy[holes[hole]])
+    return polygons
+
+def level_footprint(polygons, distance=AGGREGATION_DISTANCE, tolerance=SNAP_TOLERANCE):
+    # union of polygons (lists of rings) with the gaps up to the distance closed, like
+    # AggregatePolygons(aggregation_distance, minimum_area=0, minimum_hole_size=0); returns a list of polygons,
+    # each a list of (n, 2) rings with the exterior first
+    xy, ring_offsets, ring_polygon = unit_filter.pack_polygons(polygons)
+    if not len(xy):
+        return []
+    a, b, edge_ring = unit_filter.ring_edges(xy, ring_offsets)
+    edges = np.hstack((a, b))
+    bridges = gap_bridges(edges, ring_polygon[edge_ring], distance, tolerance)
+    noded, _ = noding.node_segments(np.concatenate((edges, bridges)), tolerance)
+    faces = polygonize.polygonize(noded, tolerance)
+    if not faces['n_polygons']:
+        return []
+
+    inside = np.zeros(faces['n_polygons'], dtype=bool)
+    inside[containing_polygons(face_points(faces, tolerance), xy, ring_offsets, ring_polygon, len(polygons))[0]] = True
+    # faces outside every polygon are gaps between them, closed when they are no wider than the distance
+    narrow = 2 * faces['area'] <= distance * faces['perimeter']
+    return assemble(*dissolve(faces, inside | narrow, tolerance), tolerance)
+
+def outline_paths(footprint):
+    # closed paths of every footprint ring, one multipart line per polygon like FeatureToLine
+    return [[np.vstack((ring, ring[:1])) for ring in rings] for rings in footprint]
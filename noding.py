@@ -0,0 +1,136 @@
+# noding and deduplication of CAD and gap repair segments, pure numpy
+# replaces Dissolve by Layer, Merge with Lines_Extra and the UNSPLIT_LINES Dissolve before polygonization:
+# segments are snapped to the XY resolution grid, duplicates (also reversed ones) are dropped through a hash of
+# their end points, and every segment is split where another one crosses or touches it, candidate pairs come
+# from an STRTree over the segment boxes so memory stays bounded by the pairs whose boxes actually overlap,
+# however long or diagonal a segment is
+
+import numpy as np
+
+import gap_repair
+import polygonize
+import spatial_index
+
+SNAP_TOLERANCE = polygonize.SNAP_TOLERANCE
+
+def snap(xy, tolerance=SNAP_TOLERANCE):
+    return np.round(np.asarray(xy, dtype=float) / tolerance) * tolerance
+
+def canonicalize(segments, tolerance=SNAP_TOLERANCE):
+    # snapped, lexicographically ordered end points, zero length segments dropped
+    # returns the canonical segments and the row of the input they came from
+    segments = snap(np.asarray(segments, dtype=float).reshape(-1, 4), tolerance)
+    a, b = segments[:, :2], segments[:, 2:]
+    swap = (a[:, 0] > b[:, 0]) | ((a[:, 0] == b[:, 0]) & (a[:, 1] > b[:, 1]))
+    ordered = np.where(swap[:, None], np.hstack((b, a)), segments)
+    proper = np.any(ordered[:, :2] != ordered[:, 2:], axis=1)
+    return ordered[proper], np.flatnonzero(proper)
+
+def deduplicate(segments, tolerance=SNAP_TOLERANCE):
+    # exact and reversed duplicates, hashed on the integer grid coordinates of both end points
+    canonical, source = canonicalize(segments, tolerance)
+    if len(canonical) == 0:
+        return canonical, source
+    _, node_ids = spatial_index.snap_to_grid(canonical.reshape(-1, 2), tolerance)
+    n_nodes = node_ids.max() + 1
+    keys = node_ids[0::2] * n_nodes + node_ids[1::2]
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+    return canonical[first], source[first]
+
+# segments queried against the tree at once, bounds the tree walk arrays
+QUERY_CHUNK = 4096
+
+def candidate_pairs(segments, tolerance=SNAP_TOLERANCE):
+    # pairs of segments whose bounding boxes, grown by the tolerance, overlap, each pair once
+    bounds = spatial_index.segment_bounds(segments) + [-tolerance, -tolerance, tolerance, tolerance]
+    tree = spatial_index.STRTree(bounds)
+    first, second = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for start in range(0, len(bounds), QUERY_CHUNK):
+        i, j = tree.query(bounds[start:start + QUERY_CHUNK])
+        i += start
+        once = i < j
+        first.append(i[once])
+        second.append(j[once])
+    return np.concatenate(first), np.concatenate(second)
+
+def _cross(a, b):
+    return a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+
+def split_parameters(segments, i, j, tolerance=SNAP_TOLERANCE):
+    # positions along segment i (0..1) where segment j crosses it or where an end point of j touches it
+    p, r = segments[i, :2], segments[i, 2:] - segments[i, :2]
+    q, s = segments[j, :2], segments[j, 2:] - segments[j, :2]
+    length = np.hypot(r[:, 0], r[:, 1])
+    margin = tolerance / np.where(length > 0, length, 1.0)
+
+    split_segment, split_t = [], []
+    denom = _cross(r, s)
+    crossing = np.abs(denom) > 1e-12
+    safe = np.where(crossing, denom, 1.0)
+    t = _cross(q - p, s) / safe
+    u = _cross(q - p, r) / safe
+    length_j = np.hypot(s[:, 0], s[:, 1])
+    margin_j = tolerance / np.where(length_j > 0, length_j, 1.0)
+    hit = crossing & (t > margin) & (t < 1 - margin) & (u >= -margin_j) & (u <= 1 + margin_j)
+    split_segment.append(i[hit])
+    split_t.append(t[hit])
+
+    # end points of j on the interior of i, covers T junctions and collinear overlaps
+    length2 = np.where(length > 0, length ** 2, 1.0)
+    for end in (q, q + s):
+        t = np.einsum('ij,ij->i', end - p, r) / length2
+        distance = np.hypot(*(p + t[:, None] * r - end).T)
+        touch = (distance <= tolerance) & (t > margin) & (t < 1 - margin)
+        split_segment.append(i[touch])
+        split_t.append(t[touch])
+    return np.concatenate(split_segment), np.concatenate(split_t)
+
+def node_segments(segments, tolerance=SNAP_TOLERANCE):
+    # noded, deduplicated segments that only meet at end points, and the input row each piece came from
+    segments, source = deduplicate(segments, tolerance)
+    if len(segments) == 0:
+        return segments, source
+    i, j = candidate_pairs(segments, tolerance)
+    si, ti = split_parameters(segments, i, j, tolerance)
+    sj, tj = split_parameters(segments, j, i, tolerance)
+
+    # every segment keeps its own end points, pieces run between consecutive split positions
+    n = len(segments)
+    split_segment = np.concatenate((np.arange(n), np.arange(n), si, sj))
+    split_t = np.concatenate((np.zeros(n), np.ones(n), ti, tj))
+    order = np.lexsort((split_t, split_segment))
+    split_segment, split_t = split_segment[order], split_t[order]
+    points = segments[split_segment, :2] + split_t[:, None] * (segments[split_segment, 2:] - segments[split_segment, :2])
+    same = split_segment[1:] == split_segment[:-1]
+    pieces = np.hstack((points[:-1][same], points[1:][same]))
+    pieces, piece_source = deduplicate(pieces, tolerance)
+    return pieces, source[split_segment[:-1][same][piece_source]]
+
+def connected_line_ids(segments, groups, tolerance=SNAP_TOLERANCE):
+    # id of the chain of same-group segments (e.g. same Layer) between junctions, like the single part features
+    # of Dissolve by Layer: segments only join through a node where exactly two segments of the group meet
+    _, node_ids = spatial_index.snap_to_grid(np.asarray(segments).reshape(-1, 2), tolerance)
+    _, group_codes = np.unique(groups, return_inverse=True)
+    ends = np.repeat(group_codes.ravel(), 2) * (node_ids.max() + 1) + node_ids
+    order = np.argsort(ends, kind='stable')
+    ends = ends[order]
+    degree = np.searchsorted(ends, ends, 'right') - np.searchsorted(ends, ends, 'left')
+    first = np.flatnonzero((degree == 2) & np.concatenate((ends[1:] == ends[:-1], [False])))
+    return polygonize.node_components(len(segments), order[first] // 2, order[first + 1] // 2)
+
+def clean_linework(segments, layers, tolerance=SNAP_TOLERANCE, near_radius=gap_repair.GAP_MAX_DIST, near_count=5):
+    # the whole linework stage of create_unit: node the CAD lines, add gap repair segments from every vertex to
+    # lines of other runs within the radius, node again (which also drops repair segments emitted twice)
+    noded, source = node_segments(segments, tolerance)
+    line_ids = connected_line_ids(noded, np.asarray(layers)[source], tolerance)
+    vertices, _ = spatial_index.snap_to_grid(noded.reshape(-1, 2), tolerance)
+    near_pairs = spatial_index.SegmentGrid(noded, ids=line_ids).nearest(vertices, radius=near_radius, k=near_count)
+    extra = gap_repair.repair_gaps(
+        from_xy=np.column_stack((near_pairs['FROM_X'], near_pairs['FROM_Y'])),
+        near_xy=np.column_stack((near_pairs['NEAR_X'], near_pairs['NEAR_Y'])),
+        near_dist=near_pairs['NEAR_DIST'],
+        near_angle=near_pairs['NEAR_ANGLE']
+    )
+    merged, _ = node_segments(np.concatenate((noded, extra)), tolerance)
+    return merged
@@ -0,0 +1,171 @@
+# planar polygonization of noded line segments, pure numpy alternative to FeatureToPolygon
+# endpoints are snapped to the XY resolution, dangles are pruned, then faces are traced on a half-edge graph:
+# counter-clockwise cycles are faces, clockwise cycles are the outlines of separate wall groups and become
+# holes of the smallest face around them (or are dropped when they bound the outside)
+
+import math
+
+import numpy as np
+
+import spatial_index
+
+# XY resolution of z_coor_system
+SNAP_TOLERANCE = 0.001
+
+def _pointer_doubling_rounds(n):
+    return max(1, math.ceil(math.log2(max(n, 2)))) + 1
+
+def prune_dangles(u, v, n_nodes):
+    # repeatedly drop edges ending in a node of degree one, like door leaves drawn open
+    while len(u):
+        degree = np.bincount(np.concatenate((u, v)), minlength=n_nodes)
+        dangling = (degree[u] == 1) | (degree[v] == 1)
+        if not dangling.any():
+            break
+        u, v = u[~dangling], v[~dangling]
+    return u, v
+
+def graph_edges(segments, tolerance=SNAP_TOLERANCE):
+    # snapped nodes and unique undirected edges without dangles
+    segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+    nodes, node_ids = spatial_index.snap_to_grid(segments.reshape(-1, 2), tolerance)
+    u, v = node_ids[0::2], node_ids[1::2]
+    proper = u != v
+    u, v = np.minimum(u[proper], v[proper]), np.maximum(u[proper], v[proper])
+    edge_keys = np.unique(u * len(nodes) + v)
+    u, v = edge_keys // max(len(nodes), 1), edge_keys % max(len(nodes), 1)
+    u, v = prune_dangles(u, v, len(nodes))
+    return nodes, u, v
+
+def trace_cycles(nodes, u, v):
+    # half-edge 2i runs u -> v, 2i + 1 runs v -> u; next() keeps the face on the left
+    n_half = 2 * len(u)
+    origin = np.empty(n_half, dtype=np.int64)
+    dest = np.empty(n_half, dtype=np.int64)
+    origin[0::2], origin[1::2] = u, v
+    dest[0::2], dest[1::2] = v, u
+    delta = nodes[dest] - nodes[origin]
+    angle = np.arctan2(delta[:, 1], delta[:, 0])
+
+    # outgoing half-edges sorted counter-clockwise around their origin
+    order = np.lexsort((angle, origin))
+    position = np.empty(n_half, dtype=np.int64)
+    position[order] = np.arange(n_half)
+    group_start = np.searchsorted(origin[order], origin, 'left')
+    group_size = np.bincount(origin, minlength=len(nodes))[origin]
+
+    # arriving at v over h, leave over the edge just clockwise of the twin
+    twin = np.arange(n_half) ^ 1
+    t_start, t_size = group_start[twin], group_size[twin]
+    next_half = order[t_start + (position[twin] - t_start - 1) % t_size]
+
+    # cycle label = smallest half-edge in the cycle, rank = steps from that half-edge
+    label = np.arange(n_half)
+    jump = next_half
+    for _ in range(_pointer_doubling_rounds(n_half)):
+        label = np.minimum(label, label[jump])
+        jump = jump[jump]
+    head = label == np.arange(n_half)
+    previous = np.empty(n_half, dtype=np.int64)
+    previous[next_half] = np.arange(n_half)
+    rank = np.where(head, 0, 1)
+    jump = np.where(head, np.arange(n_half), previous)
+    for _ in range(_pointer_doubling_rounds(n_half)):
+        rank = rank + rank[jump]
+        jump = jump[jump]
+    return origin, dest, label, rank
+
+def node_components(n_nodes, u, v):
+    # connected wall groups by min-label propagation with pointer jumping
+    component = np.arange(n_nodes)
+    while True:
+        before = component.copy()
+        low = np.minimum(component[u], component[v])
+        np.minimum.at(component, u, low)
+        np.minimum.at(component, v, low)
+        component = component[component]
+        if np.array_equal(component, before):
+            return component
+
+def _ring_contains(point, ring_xy):
+    a = ring_xy
+    b = np.roll(ring_xy, -1, axis=0)
+    straddles = (a[:, 1] > point[1]) != (b[:, 1] > point[1])
+    dy = np.where(straddles, b[:, 1] - a[:, 1], 1.0)
+    x_cross = a[:, 0] + (point[1] - a[:, 1]) * (b[:, 0] - a[:, 0]) / dy
+    return np.count_nonzero(straddles & (point[0] < x_cross)) % 2 == 1
+
+def polygonize(segments, tolerance=SNAP_TOLERANCE):
+    # segments must be noded: they may only touch at their end points
+    # returns packed polygons (exterior ring first, counter-clockwise; holes clockwise) with area and perimeter:
+    #   xy, ring_offsets, ring_polygon, n_polygons, area, perimeter
+    nodes, u, v = graph_edges(segments, tolerance)
+    origin, dest, label, rank = trace_cycles(nodes, u, v)
+    n_half = len(origin)
+
+    cross = nodes[origin, 0] * nodes[dest, 1] - nodes[dest, 0] * nodes[origin, 1]
+    cycle_area = np.bincount(label, cross, minlength=n_half) / 2
+    cycle_length = np.bincount(label, np.hypot(*(nodes[dest] - nodes[origin]).T), minlength=n_half)
+    cycle_size = np.bincount(label, minlength=n_half)
+    # area below the squared resolution is a bridge or a sliver traced back and forth, not a face
+    min_area = tolerance * tolerance
+    faces = np.flatnonzero(cycle_area > min_area)
+    outlines = np.flatnonzero(cycle_area < -min_area)
+
+    # half-edges grouped per cycle in traversal order
+    order = np.lexsort((rank, label))
+    cycle_start = np.searchsorted(label[order], np.arange(n_half), 'left')
+
+    def cycle_xy(cycle):
+        return nodes[origin[order[cycle_start[cycle]:cycle_start[cycle] + cycle_size[cycle]]]]
+
+    # an outline becomes a hole of the smallest face of another wall group around it
+    component = node_components(len(nodes), u, v)
+    face_component = component[origin[faces]]
+    face_bounds = np.empty((len(faces), 4))
+    if len(outlines):
+        bounds = np.full((n_half, 4), [np.inf, np.inf, -np.inf, -np.inf])
+        for column, reduce, coordinate in ((0, np.minimum, 0), (1, np.minimum, 1), (2, np.maximum, 0), (3, np.maximum, 1)):
+            reduce.at(bounds[:, column], label, nodes[origin, coordinate])
+        face_bounds = bounds[faces]
+    hole_of = np.full(len(outlines), -1)
+    for i, outline in enumerate(outlines):
+        point = nodes[origin[outline]]
+        candidates = np.flatnonzero(
+            (face_bounds[:, 0] <= point[0]) & (face_bounds[:, 2] >= point[0])
+            & (face_bounds[:, 1] <= point[1]) & (face_bounds[:, 3] >= point[1])
+            & (face_component != component[origin[outline]])
+        )
+        for candidate in candidates[np.argsort(cycle_area[faces[candidates]])]:
+            if _ring_contains(point, cycle_xy(faces[candidate])):
+                hole_of[i] = candidate
+                break
+
+    # packed rings: every face followed by its holes
+    holes = hole_of >= 0
+    ring_cycle = np.concatenate((faces, outlines[holes]))
+    ring_polygon = np.concatenate((np.arange(len(faces)), hole_of[holes]))
+    ring_order = np.lexsort((np.arange(len(ring_cycle)), ring_polygon))
+    ring_cycle, ring_polygon = ring_cycle[ring_order], ring_polygon[ring_order]
+    ring_sizes = cycle_size[ring_cycle]
+    ring_offsets = np.concatenate(([0], np.cumsum(ring_sizes))).astype(np.int64)
+    half_edges = order[spatial_index.expand_ranges(cycle_start[ring_cycle], ring_sizes)]
+
+    area = np.bincount(ring_polygon, np.abs(cycle_area[ring_cycle]) * np.where(cycle_area[ring_cycle] > 0, 1, -1),
+                       minlength=len(faces))
+    perimeter = np.bincount(ring_polygon, cycle_length[ring_cycle], minlength=len(faces))
+    return {
+        'xy': nodes[origin[half_edges]],
+        'ring_offsets': ring_offsets,
+        'ring_polygon': ring_polygon,
+        'n_polygons': len(faces),
+        'area': area,
+        'perimeter': perimeter,
+    }
+
+def iter_polygons(polygons, indices=None):
+    # rings of the selected polygons as lists of (n, 2) arrays, for writing with arcpy
+    xy, ring_offsets, ring_polygon = polygons['xy'], polygons['ring_offsets'], polygons['ring_polygon']
+    first_ring = np.searchsorted(ring_polygon, np.arange(polygons['n_polygons'] + 1), 'left')
+    for index in range(polygons['n_polygons']) if indices is None else indices:
+        yield [xy[ring_offsets[ring]:ring_offsets[ring + 1]] for ring in range(first_ring[index], first_ring[index + 1])]
@@ -0,0 +1,171 @@
+# landmark (ALT) index over the routing graph and an LRU cache of unit to unit distances
+# landmark distances are computed offline after the pathways are built and saved next to the graph;
+# a query is answered by the landmarks alone when their lower and upper bounds meet, otherwise by a scipy Dijkstra
+# search limited to the upper bound, which settles only the nodes closer to the source than that detour.
+# every level keeps a fingerprint of its pathways, the index is rebuilt and the cache dropped when one changes
+
+import collections
+import os
+
+import numpy as np
+
+import checkpoint
+import routing
+
+N_LANDMARKS = 16
+CACHE_SIZE = 100000
+
+def level_fingerprints(graph):
+    # level -> hash of the level's edges by coordinates, so node renumbering alone does not change it
+    sources = np.repeat(np.arange(graph.n_nodes), np.diff(graph.indptr))
+    forward = sources < graph.indices
+    edges = np.column_stack((graph.nodes[sources], graph.nodes[graph.indices], graph.weights))[forward]
+    edge_level = graph.edge_level[forward]
+    fingerprints = {}
+    for code, level in enumerate(graph.levels.tolist()):
+        level_edges = edges[edge_level == code]
+        fingerprints[level] = checkpoint.fingerprint(level_edges[np.lexsort(level_edges.T[::-1])])
+    return fingerprints
+
+def select_landmarks(graph, n_landmarks=N_LANDMARKS):
+    # farthest point selection: every new landmark is the reachable node farthest from the chosen ones
+    # returns the landmarks and their (n_landmarks, n_nodes) network distances
+    landmarks, distances = [], []
+    closest = np.full(graph.n_nodes, np.inf)
+    has_edges = np.diff(graph.indptr) > 0
+    start_distance = graph.dijkstra(int(np.argmax(has_edges)))[0]
+    candidate = int(np.argmax(np.where(np.isfinite(start_distance), start_distance, -1)))
+    for _ in range(min(n_landmarks, graph.n_nodes)):
+        distance = graph.dijkstra(candidate)[0]
+        landmarks.append(candidate)
+        distances.append(distance)
+        closest = np.minimum(closest, distance)
+        # nodes of other components are at infinite distance, they get their own landmark first
+        candidate = int(np.argmax(np.where(has_edges, closest, -1)))
+        if candidate in landmarks:
+            break
+    return np.array(landmarks, dtype=np.int64), np.array(distances)
+
+class LandmarkIndex:
+    # ALT lower bounds |d(l, t) - d(l, v)| over the landmarks l, admissible for A* on the undirected graph
+
+    def __init__(self, graph, landmarks, distances, fingerprints):
+        self.graph = graph
+        self.landmarks = landmarks
+        self.distances = distances
+        self.fingerprints = fingerprints
+        # landmark distances of one node side by side with NaN where the landmark does not reach it
+        self._node_distances = np.ascontiguousarray(np.where(np.isfinite(distances), distances, np.nan).T)
+
+    @classmethod
+    def build(cls, graph, n_landmarks=N_LANDMARKS):
+        landmarks, distances = select_landmarks(graph, n_landmarks)
+        return cls(graph, landmarks, distances, level_fingerprints(graph))
+
+    @classmethod
+    def load(cls, path, graph):
+        with np.load(path, allow_pickle=False) as data:
+            fingerprints = dict(zip(data['levels'].tolist(), data['fingerprints'].tolist()))
+            return cls(graph, data['landmarks'], data['distances'], fingerprints)
+
+    def save(self, path):
+        np.savez(path, landmarks=self.landmarks, distances=self.distances,
+                 levels=np.array(list(self.fingerprints)), fingerprints=np.array(list(self.fingerprints.values())))
+
+    def changed_levels(self, graph):
+        # levels added, removed or regenerated since the index was built
+        current = level_fingerprints(graph)
+        return sorted(level for level in set(current) | set(self.fingerprints)
+                      if current.get(level) != self.fingerprints.get(level))
+
+    def lower_bounds(self, nodes, target):
+        # bound of the given nodes towards target, a landmark that reaches only one of the two nodes tells nothing
+        # (fmax skips the NaN differences)
+        difference = np.abs(self._node_distances[nodes] - self._node_distances[target])
+        return np.fmax.reduce(difference, axis=1, initial=0.0)
+
+    def upper_bound(self, source, target):
+        # shortest detour over a landmark, d(s, t) <= d(s, l) + d(l, t), inf when no landmark reaches both
+        return float(np.min(self.distances[:, source] + self.distances[:, target], initial=np.inf))
+
+    def distance(self, source, target):
+        # network distance, inf when the nodes are not connected
+        upper = self.upper_bound(source, target)
+        if upper <= self.lower_bounds([source], target)[0] * (1 + 1e-12):
+            return upper
+        # a little slack so the target at exactly the upper bound is still settled
+        limit = upper * (1 + 1e-9) + 1e-9 if np.isfinite(upper) else np.inf
+        return float(self.graph.dijkstra(source, limit)[0][target])
+
+def update_index(graph, index_path, n_landmarks=N_LANDMARKS):
+    # reuse the saved index while no level changed, otherwise rebuild it; returns the index and the changed levels
+    if os.path.exists(index_path):
+        index = LandmarkIndex.load(index_path, graph)
+        changed = index.changed_levels(graph)
+        if not changed:
+            return index, []
+    else:
+        changed = list(graph.levels.tolist())
+    index = LandmarkIndex.build(graph, n_landmarks)
+    index.save(index_path)
+    return index, changed
+
+class UnitRouter:
+    # unit to unit distances by Units UNIT_ID from the files written by build_routing_graph,
+    # reloaded together with a fresh cache whenever the routing graph file is rewritten;
+    # room numbers (NAME) can be empty or shared, units_named lists the units of one
+
+    def __init__(self, routing_dir, cache_size=CACHE_SIZE):
+        self.routing_dir = routing_dir
+        self.cache_size = cache_size
+        self._stamp = None
+        self.refresh()
+
+    def _graph_stamp(self):
+        stats = os.stat(os.path.join(self.routing_dir, 'PrelimPathways.npz'))
+        return stats.st_mtime_ns, stats.st_size
+
+    def refresh(self):
+        # reload after create_pathways regenerated a level, the cached routes may run through it
+        stamp = self._graph_stamp()
+        if stamp == self._stamp:
+            return False
+        graph = routing.RoutingGraph.load(os.path.join(self.routing_dir, 'PrelimPathways.npz'))
+        self.index, self.changed_levels = update_index(graph, os.path.join(self.routing_dir, 'Landmarks.npz'))
+        with np.load(os.path.join(self.routing_dir, 'Unit_Nodes.npz'), allow_pickle=False) as data:
+            unit_ids, names, nodes = data['unit_id'].tolist(), data['name'].tolist(), data['node'].tolist()
+        duplicates = sorted({unit for unit, count in collections.Counter(unit_ids).items() if count > 1})
+        if duplicates:
+            raise ValueError(f"UNIT_ID is not unique in {self.routing_dir}: {', '.join(duplicates[:10])}")
+        self.unit_nodes = dict(zip(unit_ids, nodes))
+        self.unit_names = collections.defaultdict(list)
+        for unit, name in zip(unit_ids, names):
+            self.unit_names[name].append(unit)
+        self.cache = collections.OrderedDict()
+        self._stamp = stamp
+        return True
+
+    def units_named(self, name):
+        self.refresh()
+        return list(self.unit_names.get(name, []))
+
+    def unit_node(self, unit):
+        # routing node of a unit, units on a level without pathways have none
+        if unit not in self.unit_nodes:
+            raise KeyError(f'no unit with UNIT_ID {unit!r} in {self.routing_dir}')
+        node = self.unit_nodes[unit]
+        if node < 0:
+            raise ValueError(f'unit {unit!r} is on a level without pathway nodes')
+        return node
+
+    def distance(self, unit_a, unit_b):
+        self.refresh()
+        key = (unit_a, unit_b) if unit_a <= unit_b else (unit_b, unit_a)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        value = self.index.distance(self.unit_node(key[0]), self.unit_node(key[1]))
+        self.cache[key] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return value
@@ -0,0 +1,162 @@
+# routing graph over the indoor pathways, pure numpy, no arcpy needed
+# pathway end points are snapped to nodes and the network is kept as CSR adjacency (indptr, indices, weights)
+# with the LEVEL_ID of every edge; one-to-many Dijkstra (scipy csgraph on the CSR matrix) answers whole rows of a
+# unit distance matrix per search, and points snap to nodes through an STRTree over the nodes of their level
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+
+import spatial_index
+
+# XY resolution of z_coor_system
+SNAP_TOLERANCE = 0.001
+# sources searched together, every one holds a row over all nodes
+SOURCE_CHUNK = 64
+
+def snap_nodes(xyz, tolerance=SNAP_TOLERANCE):
+    # 3D points closer than the tolerance grid merge into one node, returns node coordinates and node of every point
+    xyz = np.asarray(xyz, dtype=float).reshape(-1, 3)
+    cells = np.round(xyz / tolerance).astype(np.int64)
+    _, first, node_ids = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+    return xyz[first], node_ids.ravel()
+
+def pathway_edges(line_ids, xyz):
+    # first and last vertex row and 3D length of every pathway, from exploded vertices grouped by line id
+    line_ids = np.asarray(line_ids)
+    xyz = np.asarray(xyz, dtype=float).reshape(-1, 3)
+    starts = np.flatnonzero(np.concatenate(([True], line_ids[1:] != line_ids[:-1])))
+    ends = np.append(starts[1:], len(line_ids)) - 1
+    step = np.linalg.norm(np.diff(xyz, axis=0), axis=1)
+    step[line_ids[1:] != line_ids[:-1]] = 0.0
+    cumulative = np.concatenate(([0.0], np.cumsum(step)))
+    return starts, ends, cumulative[ends] - cumulative[starts]
+
+def nearest_points(xy, points):
+    # index of the closest of xy to every point, boxes around the points grow until they hold a node that is
+    # closer than the box half width (nodes outside the box are farther away)
+    nearest = np.full(len(points), -1, dtype=np.int64)
+    if not len(xy) or not len(points):
+        return nearest
+    tree = spatial_index.STRTree(np.hstack((xy, xy)))
+    extent = np.ptp(xy, axis=0).max()
+    radius = np.full(len(points), max(extent / np.sqrt(len(xy)), SNAP_TOLERANCE))
+    pending = np.arange(len(points))
+    while len(pending):
+        p = points[pending]
+        r = radius[pending, None]
+        query_ids, node_ids = tree.query(np.hstack((p - r, p + r)))
+        distance = np.hypot(*(xy[node_ids] - p[query_ids]).T)
+        # closest node of every query with a node in its box
+        order = np.lexsort((node_ids, distance, query_ids))
+        order = order[np.concatenate(([True], query_ids[order][1:] != query_ids[order][:-1]))[:len(order)]]
+        hit, best = pending[query_ids[order]], distance[order]
+        found = best <= radius[hit]
+        nearest[hit[found]] = node_ids[order[found]]
+        # a box with nodes only in its corners is redone with the closest of them as half width, an empty one doubles
+        radius[pending] *= 2
+        radius[hit] = best
+        pending = pending[nearest[pending] < 0]
+    return nearest
+
+class RoutingGraph:
+    # undirected pathway network, nodes (n, 3), CSR adjacency with edge lengths and level codes
+
+    def __init__(self, nodes, indptr, indices, weights, edge_level, levels):
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.edge_level = edge_level
+        self.levels = levels
+        # explicit zero weights stay edges for csgraph
+        self._matrix = scipy.sparse.csr_matrix((weights, indices, indptr), shape=(len(nodes), len(nodes)))
+
+    @classmethod
+    def from_pathways(cls, line_ids, xyz, level_ids, tolerance=SNAP_TOLERANCE):
+        # line_ids, xyz, level_ids: exploded pathway vertices, level_ids is the LEVEL_ID of the vertex's pathway
+        starts, ends, lengths = pathway_edges(line_ids, xyz)
+        nodes, node_ids = snap_nodes(xyz, tolerance)
+        levels, level_codes = np.unique(np.asarray(level_ids)[starts], return_inverse=True)
+        u, v = node_ids[starts], node_ids[ends]
+        proper = u != v
+        u, v, lengths, level_codes = u[proper], v[proper], lengths[proper], level_codes.ravel()[proper]
+
+        # both directions, parallel pathways keep the shortest one
+        source = np.concatenate((u, v))
+        target = np.concatenate((v, u))
+        weight = np.concatenate((lengths, lengths))
+        level = np.concatenate((level_codes, level_codes))
+        order = np.lexsort((weight, target, source))
+        source, target, weight, level = source[order], target[order], weight[order], level[order]
+        first = np.concatenate(([True], (source[1:] != source[:-1]) | (target[1:] != target[:-1])))
+        source, target, weight, level = source[first], target[first], weight[first], level[first]
+
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(source, minlength=len(nodes))))).astype(np.int64)
+        return cls(nodes, indptr, target.astype(np.int64), weight, level.astype(np.int64), levels)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['nodes'], data['indptr'], data['indices'], data['weights'], data['edge_level'], data['levels'])
+
+    def save(self, path):
+        np.savez(path, nodes=self.nodes, indptr=self.indptr, indices=self.indices, weights=self.weights,
+                 edge_level=self.edge_level, levels=self.levels)
+
+    @property
+    def n_nodes(self):
+        return len(self.nodes)
+
+    def node_levels(self):
+        # level code of every node from its first edge, -1 for isolated nodes
+        node_level = np.full(self.n_nodes, -1, dtype=np.int64)
+        has_edges = np.diff(self.indptr) > 0
+        node_level[has_edges] = self.edge_level[self.indptr[:-1][has_edges]]
+        return node_level
+
+    def nearest_nodes(self, points, levels=None):
+        # closest node in plan to every (x, y) point, restricted to nodes of the point's LEVEL_ID when given;
+        # -1 for points on a level without nodes
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        node_level = self.node_levels()
+        if levels is None:
+            point_level = np.zeros(len(points), dtype=np.int64)
+            node_level = np.where(node_level < 0, -1, 0)
+        else:
+            level_codes = {level: code for code, level in enumerate(self.levels.tolist())}
+            point_level = np.array([level_codes.get(level, -2) for level in levels], dtype=np.int64)
+        nearest = np.full(len(points), -1, dtype=np.int64)
+        for code in np.unique(point_level[point_level >= 0]):
+            level_points = np.flatnonzero(point_level == code)
+            level_nodes = np.flatnonzero(node_level == code)
+            found = nearest_points(self.nodes[level_nodes, :2], points[level_points])
+            nearest[level_points[found >= 0]] = level_nodes[found[found >= 0]]
+        return nearest
+
+    def dijkstra(self, source, limit=np.inf):
+        # distances from source to every node (inf when unreachable or farther than limit) and the predecessor
+        # tree, -1 for none
+        distance, predecessor = scipy.sparse.csgraph.dijkstra(self._matrix, indices=source, return_predecessors=True, limit=limit)
+        return distance, np.where(predecessor < 0, -1, predecessor).astype(np.int64)
+
+    def shortest_paths(self, sources, targets=None):
+        # (len(sources), len(targets)) network distances, one search per distinct source
+        sources = np.asarray(sources, dtype=np.int64).ravel()
+        targets = np.arange(self.n_nodes) if targets is None else np.asarray(targets, dtype=np.int64).ravel()
+        unique_sources, source_rows = np.unique(sources, return_inverse=True)
+        rows = np.empty((len(unique_sources), len(targets)))
+        for start in range(0, len(unique_sources), SOURCE_CHUNK):
+            chunk = unique_sources[start:start + SOURCE_CHUNK]
+            rows[start:start + len(chunk)] = scipy.sparse.csgraph.dijkstra(self._matrix, indices=chunk)[:, targets]
+        return rows[source_rows.ravel()]
+
+    def route(self, source, target):
+        # length and node path of the shortest route, inf and an empty path when the nodes are not connected
+        distance, predecessor = self.dijkstra(source)
+        if not np.isfinite(distance[target]):
+            return float('inf'), np.empty(0, dtype=np.int64)
+        path = [target]
+        while predecessor[path[-1]] != -1:
+            path.append(int(predecessor[path[-1]]))
+        return float(distance[target]), np.array(path[::-1], dtype=np.int64)
@@ -0,0 +1,53 @@
+# paths of one pipeline run, resolved on first use instead of when the scripts are imported
+# the project folder comes from the argument, the environment (worker processes, command line runs) or, only when
+# neither is given, the ArcGIS Pro project the script runs in; arcpy itself is only imported when first used
+
+import importlib
+import os
+
+class LazyModule:
+    # stands in for a module until one of its attributes is used, so importing the scripts does not start arcpy
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+def current_project():
+    import arcpy
+    return arcpy.mp.ArcGISProject("CURRENT")
+
+class Session:
+    # home_folder holds the building and Indoor geodatabases and the run folders (Scratch, Checkpoints, Logs, ...)
+
+    def __init__(self, home_folder=None, default_gdb=None, building_prefix='N'):
+        self._home_folder = home_folder
+        self._default_gdb = default_gdb
+        self.building_prefix = building_prefix
+
+    @classmethod
+    def for_default_gdb(cls, default_gdb=None):
+        # run folders next to the given geodatabase, INDOOR_DEFAULT_GDB or the project's default geodatabase
+        default_gdb = default_gdb or os.environ.get('INDOOR_DEFAULT_GDB') or current_project().defaultGeodatabase
+        return cls(os.path.dirname(default_gdb), default_gdb)
+
+    @property
+    def home_folder(self):
+        if self._home_folder is None:
+            self._home_folder = os.environ.get('INDOOR_HOME_FOLDER') or current_project().homeFolder
+        return self._home_folder
+
+    @property
+    def default_gdb(self):
+        return self._default_gdb or os.path.join(self.home_folder, self.building_prefix + '.gdb')
+
+    def folder(self, name):
+        return os.path.join(self.home_folder, name)
+
+    def environment(self):
+        # exported to worker processes, which configure their own session from it
+        return {'INDOOR_HOME_FOLDER': self.home_folder, 'INDOOR_DEFAULT_GDB': self.default_gdb}
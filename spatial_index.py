@@ -0,0 +1,210 @@
+# spatial index over line segments for vertex-to-line nearest queries
+# replaces FeatureVerticesToPoints + GenerateNearTable, pure numpy, no arcpy needed
+
+import numpy as np
+
+# same fields as the table written by GenerateNearTable(location="LOCATION", angle="ANGLE")
+NEAR_TABLE_DTYPE = np.dtype([
+    ('IN_FID', 'i8'), ('NEAR_FID', 'i8'), ('NEAR_DIST', 'f8'), ('NEAR_RANK', 'i4'),
+    ('FROM_X', 'f8'), ('FROM_Y', 'f8'), ('NEAR_X', 'f8'), ('NEAR_Y', 'f8'), ('NEAR_ANGLE', 'f8')
+])
+
+# cell coordinates are packed into one int64 key
+_KEY_OFFSET = 2 ** 30
+_KEY_SHIFT = 2 ** 32
+
+def snap_to_grid(xy, tolerance):
+    # points closer than the tolerance grid merge into one node, returns node coordinates and the node of every point
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    if len(xy) == 0:
+        return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+    cells = np.round(xy / tolerance).astype(np.int64)
+    cells -= cells.min(axis=0)
+    keys = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+    _, first, node_ids = np.unique(keys, return_index=True, return_inverse=True)
+    return xy[first], node_ids.ravel()
+
+def polyline_segments(line_ids, xy):
+    # line_ids, xy: exploded vertices, consecutive rows with the same id belong to one single part line
+    # returns (n, 4) segments and the id of the line each segment came from
+    line_ids = np.asarray(line_ids)
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    same_line = line_ids[1:] == line_ids[:-1]
+    segments = np.hstack((xy[:-1][same_line], xy[1:][same_line]))
+    return segments, line_ids[:-1][same_line]
+
+def point_segment_distance(points, segments):
+    # distance and closest point from each point to the segment on the same row
+    a = segments[:, :2]
+    ab = segments[:, 2:] - a
+    length2 = np.einsum('ij,ij->i', ab, ab)
+    t = np.einsum('ij,ij->i', points - a, ab) / np.where(length2 > 0, length2, 1.0)
+    near = a + np.clip(t, 0.0, 1.0)[:, None] * ab
+    return np.hypot(*(near - points).T), near
+
+def cell_keys(xy, cell_size):
+    # packed int64 key of the grid cell of every point
+    cells = np.floor(np.asarray(xy, dtype=float).reshape(-1, 2) / cell_size).astype(np.int64) + _KEY_OFFSET
+    return cells[:, 0] * _KEY_SHIFT + cells[:, 1]
+
+def expand_ranges(starts, counts):
+    # concatenated aranges start[i] .. start[i] + counts[i]
+    total = counts.sum()
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(total) - offsets + np.repeat(starts, counts)
+
+class SegmentGrid:
+    # uniform grid, each segment is registered in every cell it passes through
+
+    def __init__(self, segments, ids=None, cell_size=0.4):
+        self.segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+        self.ids = np.arange(len(self.segments)) if ids is None else np.asarray(ids)
+        self.cell_size = float(cell_size)
+        # samples along a segment are spaced half a cell apart so no traversed cell is far from a sample
+        self.sample_spacing = self.cell_size / 2
+        self._build()
+
+    def _cell_keys(self, xy):
+        return cell_keys(xy, self.cell_size)
+
+    def _build(self):
+        a = self.segments[:, :2]
+        ab = self.segments[:, 2:] - a
+        lengths = np.hypot(ab[:, 0], ab[:, 1])
+        n_samples = np.floor(lengths / self.sample_spacing).astype(np.int64) + 2
+        seg = np.repeat(np.arange(len(self.segments)), n_samples)
+        step = expand_ranges(np.zeros(len(n_samples), dtype=np.int64), n_samples)
+        t = step / (n_samples[seg] - 1)
+        samples = a[seg] + t[:, None] * ab[seg]
+
+        # one (cell, segment) entry per distinct pair, sorted by cell
+        keys = self._cell_keys(samples)
+        pairs = np.unique(np.column_stack((keys, seg)), axis=0)
+        self.cell_keys = pairs[:, 0]
+        self.cell_segments = pairs[:, 1]
+
+    def candidates(self, points, radius):
+        # (point index, segment index) pairs whose cells are within reach of the point
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        reach = int(np.ceil((radius + self.sample_spacing / 2) / self.cell_size))
+        offsets = np.arange(-reach, reach + 1) * self.cell_size
+        point_ids, segment_ids = [], []
+        for dx in offsets:
+            for dy in offsets:
+                keys = self._cell_keys(points + (dx, dy))
+                lo = np.searchsorted(self.cell_keys, keys, 'left')
+                hi = np.searchsorted(self.cell_keys, keys, 'right')
+                counts = hi - lo
+                point_ids.append(np.repeat(np.arange(len(points)), counts))
+                segment_ids.append(self.cell_segments[expand_ranges(lo, counts)])
+        pairs = np.unique(np.column_stack((np.concatenate(point_ids), np.concatenate(segment_ids))), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+    def nearest(self, points, radius, k=None):
+        # all segment features within radius of every point, closest first, at most k per point
+        # like GenerateNearTable(closest="ALL"), a feature is reported once at its closest location
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        point_ids, segment_ids = self.candidates(points, radius)
+        dist, near = point_segment_distance(points[point_ids], self.segments[segment_ids])
+        within = dist <= radius
+        point_ids, near_fids = point_ids[within], self.ids[segment_ids[within]]
+        dist, near = dist[within], near[within]
+
+        # closest first per point, then keep the first hit of each (point, feature)
+        order = np.lexsort((dist, near_fids, point_ids))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (point_ids[order][1:] != point_ids[order][:-1]) | (near_fids[order][1:] != near_fids[order][:-1])
+        order = order[first]
+        order = order[np.lexsort((dist[order], point_ids[order]))]
+
+        point_ids, near_fids, dist, near = point_ids[order], near_fids[order], dist[order], near[order]
+        group_start = np.searchsorted(point_ids, point_ids, 'left')
+        rank = np.arange(len(point_ids)) - group_start + 1
+        if k is not None:
+            keep = rank <= k
+            point_ids, near_fids, dist, near, rank = point_ids[keep], near_fids[keep], dist[keep], near[keep], rank[keep]
+
+        table = np.empty(len(point_ids), dtype=NEAR_TABLE_DTYPE)
+        table['IN_FID'] = point_ids
+        table['NEAR_FID'] = near_fids
+        table['NEAR_DIST'] = dist
+        table['NEAR_RANK'] = rank
+        table['FROM_X'], table['FROM_Y'] = points[point_ids].T
+        table['NEAR_X'], table['NEAR_Y'] = near.T
+        delta = near - points[point_ids]
+        table['NEAR_ANGLE'] = np.degrees(np.arctan2(delta[:, 1], delta[:, 0]))
+        return table
+
+def segment_bounds(segments):
+    # (n, 4) xmin, ymin, xmax, ymax of every segment
+    segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+    return np.hstack((np.minimum(segments[:, :2], segments[:, 2:]), np.maximum(segments[:, :2], segments[:, 2:])))
+
+def boxes_overlap(a, b):
+    return (a[:, 0] <= b[:, 2]) & (b[:, 0] <= a[:, 2]) & (a[:, 1] <= b[:, 3]) & (b[:, 1] <= a[:, 3])
+
+def segments_intersect(a, b, tolerance=0.0):
+    # closed segment intersection of a[i] and b[i], touching counts like SpatialJoin INTERSECT
+    def orientation(p, q, r):
+        value = (q[:, 0] - p[:, 0]) * (r[:, 1] - p[:, 1]) - (q[:, 1] - p[:, 1]) * (r[:, 0] - p[:, 0])
+        return np.where(np.abs(value) <= tolerance, 0, np.sign(value))
+
+    p1, p2, q1, q2 = a[:, :2], a[:, 2:], b[:, :2], b[:, 2:]
+    o1, o2 = orientation(p1, p2, q1), orientation(p1, p2, q2)
+    o3, o4 = orientation(q1, q2, p1), orientation(q1, q2, p2)
+    proper = (o1 * o2 <= 0) & (o3 * o4 <= 0)
+    # collinear segments only meet when their bounding boxes overlap
+    collinear = (o1 == 0) & (o2 == 0)
+    return np.where(collinear, boxes_overlap(segment_bounds(a), segment_bounds(b)), proper)
+
+class STRTree:
+    # packed R-tree over boxes, built by sort-tile-recursive and queried for many boxes at once
+
+    def __init__(self, boxes, node_capacity=16):
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.node_capacity = node_capacity
+        # level 0 holds the items in leaf order, every level above holds the bounds of consecutive children
+        self.order = self._tile_order(boxes)
+        self.bounds = [boxes[self.order]]
+        self.child_start = [None]
+        self.child_count = [None]
+        while len(self.bounds[-1]) > node_capacity:
+            self._add_level()
+
+    def _tile_order(self, boxes):
+        # sort by x into vertical slices of whole nodes, then by y inside every slice
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        n_nodes = -(-len(boxes) // self.node_capacity)
+        slice_size = self.node_capacity * max(1, int(np.ceil(np.sqrt(n_nodes))))
+        by_x = np.argsort(centers[:, 0], kind='stable')
+        slice_of = np.empty(len(boxes), dtype=np.int64)
+        slice_of[by_x] = np.arange(len(boxes)) // slice_size
+        return np.lexsort((centers[:, 1], slice_of))
+
+    def _add_level(self):
+        children = self.bounds[-1]
+        starts = np.arange(0, len(children), self.node_capacity)
+        counts = np.diff(np.append(starts, len(children)))
+        bounds = np.column_stack((
+            np.minimum.reduceat(children[:, 0], starts), np.minimum.reduceat(children[:, 1], starts),
+            np.maximum.reduceat(children[:, 2], starts), np.maximum.reduceat(children[:, 3], starts),
+        ))
+        order = self._tile_order(bounds)
+        self.bounds.append(bounds[order])
+        self.child_start.append(starts[order])
+        self.child_count.append(counts[order])
+
+    def query(self, boxes):
+        # (query index, item index) pairs whose boxes overlap, walking all queries down the tree level by level
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        top = len(self.bounds) - 1
+        query_ids = np.repeat(np.arange(len(boxes)), len(self.bounds[top]))
+        node_ids = np.tile(np.arange(len(self.bounds[top])), len(boxes))
+        for level in range(top, -1, -1):
+            hit = boxes_overlap(boxes[query_ids], self.bounds[level][node_ids])
+            query_ids, node_ids = query_ids[hit], node_ids[hit]
+            if level:
+                counts = self.child_count[level][node_ids]
+                query_ids = np.repeat(query_ids, counts)
+                node_ids = expand_ranges(self.child_start[level][node_ids], counts)
+        return query_ids, self.order[node_ids]
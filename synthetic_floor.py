@@ -0,0 +1,121 @@
+# synthetic CAD floor plans for benchmarking the cleaning and pathway stages without ArcGIS or the SAIT drawings
+# rooms are laid out on an irregular grid, walls are drawn piece by piece on the cleaning layers with
+# door openings (jambs and open leaves), glazed exterior walls, columns and deliberate sub-0.2 m gaps
+
+import math
+
+import numpy as np
+
+WALL_LAYER = 'A-Wall'
+GLAZING_LAYER = 'A-Glaz'
+DOOR_LAYER = 'A-Door'
+JAMB_LAYER = 'A-Door-Jamb'
+COLUMN_LAYER = 'S-Cols'
+
+def _pieces_to_segments(fixed, start, end, horizontal):
+    # wall pieces are stored along their axis, horizontal pieces have a fixed y
+    return np.where(
+        horizontal[:, None],
+        np.column_stack((start, fixed, end, fixed)),
+        np.column_stack((fixed, start, fixed, end))
+    )
+
+def generate_floor(n_rooms, room_size=(3.0, 6.0), door_fraction=0.5, door_width=0.9, jamb_length=0.1,
+                   gap_fraction=0.3, max_gap=0.15, glazing_fraction=0.3, column_fraction=0.1, column_size=0.4, seed=0):
+    # returns a dict with
+    #   segments (n, 4), layers (n,) and line_ids (n,): the CAD linework, one line per segment
+    #   doors (m, 4): the door openings from jamb to jamb
+    #   rooms (k, 4): room boxes [xmin, ymin, xmax, ymax] before any gaps or openings
+    rng = np.random.default_rng(seed)
+    cols = math.ceil(math.sqrt(n_rooms))
+    rows = math.ceil(n_rooms / cols)
+    xs = np.concatenate(([0.0], np.cumsum(rng.uniform(*room_size, cols))))
+    ys = np.concatenate(([0.0], np.cumsum(rng.uniform(*room_size, rows))))
+
+    # one wall piece per room edge, shared edges are drawn once
+    h_row, h_col = np.meshgrid(np.arange(rows + 1), np.arange(cols), indexing='ij')
+    v_col, v_row = np.meshgrid(np.arange(cols + 1), np.arange(rows), indexing='ij')
+    h_row, h_col, v_col, v_row = h_row.ravel(), h_col.ravel(), v_col.ravel(), v_row.ravel()
+    fixed = np.concatenate((ys[h_row], xs[v_col]))
+    start = np.concatenate((xs[h_col], ys[v_row]))
+    end = np.concatenate((xs[h_col + 1], ys[v_row + 1]))
+    horizontal = np.concatenate((np.ones(len(h_row), dtype=bool), np.zeros(len(v_col), dtype=bool)))
+    exterior = np.concatenate(((h_row == 0) | (h_row == rows), (v_col == 0) | (v_col == cols)))
+
+    # small gaps at the start of some pieces, these are what the gap repair has to close
+    gapped = rng.random(len(fixed)) < gap_fraction
+    start = start + np.where(gapped, rng.uniform(0.005, max_gap, len(fixed)), 0.0)
+
+    # interior pieces long enough for a door get an opening, split into a left and right wall piece
+    has_door = ~exterior & (rng.random(len(fixed)) < door_fraction) & (end - start > door_width + 0.4)
+    opening_center = rng.uniform(start + 0.2 + door_width / 2, end - 0.2 - door_width / 2)
+    opening_start = opening_center - door_width / 2
+    opening_end = opening_center + door_width / 2
+
+    wall_fixed = np.concatenate((fixed[~has_door], fixed[has_door], fixed[has_door]))
+    wall_start = np.concatenate((start[~has_door], start[has_door], opening_end[has_door]))
+    wall_end = np.concatenate((end[~has_door], opening_start[has_door], end[has_door]))
+    wall_horizontal = np.concatenate((horizontal[~has_door], horizontal[has_door], horizontal[has_door]))
+    wall_exterior = np.concatenate((exterior[~has_door], exterior[has_door], exterior[has_door]))
+    walls = _pieces_to_segments(wall_fixed, wall_start, wall_end, wall_horizontal)
+    wall_layers = np.where(wall_exterior & (rng.random(len(walls)) < glazing_fraction), GLAZING_LAYER, WALL_LAYER)
+
+    # jambs across the wall at both sides of the opening, the leaf drawn open at 90 degrees from one jamb
+    door_fixed = fixed[has_door]
+    door_horizontal = horizontal[has_door]
+    doors = _pieces_to_segments(door_fixed, opening_start[has_door], opening_end[has_door], door_horizontal)
+    jambs = []
+    for side in (opening_start[has_door], opening_end[has_door]):
+        jambs.append(_pieces_to_segments(side, door_fixed - jamb_length / 2, door_fixed + jamb_length / 2, ~door_horizontal))
+    jambs = np.concatenate(jambs)
+    leaves = _pieces_to_segments(opening_start[has_door], door_fixed, door_fixed + door_width, ~door_horizontal)
+
+    # square columns at some wall intersections
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    with_column = rng.random(grid_x.size) < column_fraction
+    cx, cy = grid_x.ravel()[with_column], grid_y.ravel()[with_column]
+    half = column_size / 2
+    corners = [(-half, -half), (half, -half), (half, half), (-half, half), (-half, -half)]
+    columns = np.concatenate([
+        np.column_stack((cx + corners[i][0], cy + corners[i][1], cx + corners[i + 1][0], cy + corners[i + 1][1]))
+        for i in range(4)
+    ])
+
+    segments = np.concatenate((walls, jambs, leaves, columns))
+    layers = np.concatenate((
+        wall_layers,
+        np.full(len(jambs), JAMB_LAYER),
+        np.full(len(leaves), DOOR_LAYER),
+        np.full(len(columns), COLUMN_LAYER),
+    ))
+    room_col, room_row = np.meshgrid(np.arange(cols), np.arange(rows))
+    rooms = np.column_stack((xs[room_col.ravel()], ys[room_row.ravel()], xs[room_col.ravel() + 1], ys[room_row.ravel() + 1]))
+    return {
+        'segments': segments,
+        'layers': layers,
+        'line_ids': np.arange(len(segments)),
+        'doors': doors,
+        'rooms': rooms,
+    }
+
+def write_dxf(floor, path, other_layers=('A-Furn', 'E-Lite', 'I-Ceil'), other_per_line=3):
+    # the floor's linework as an ASCII DXF of LINE entities, with other_per_line lines on layers the
+    # cleaning stage drops for every kept line, like the furniture, lighting and ceiling layers of a base drawing
+    rng = np.random.default_rng(0)
+    with open(path, 'w') as f:
+        f.write('0\nSECTION\n2\nENTITIES\n')
+        handle = 0
+        for segment, layer in zip(floor['segments'].tolist(), floor['layers'].tolist()):
+            for line_layer, (x0, y0, x1, y1) in [(layer, segment)] + [
+                (other_layers[i % len(other_layers)], segment + rng.normal(0, 0.5, 4)) for i in range(other_per_line)
+            ]:
+                handle += 1
+                f.write(f'0\nLINE\n5\n{handle:X}\n100\nAcDbEntity\n8\n{line_layer}\n100\nAcDbLine\n'
+                        f'10\n{x0}\n20\n{y0}\n30\n0.0\n11\n{x1}\n21\n{y1}\n31\n0.0\n')
+        f.write('0\nENDSEC\n0\nEOF\n')
+
+def floor_vertices(floor):
+    # exploded line vertices and their line ids, as read from the dissolved lines in clean_cad
+    segments = floor['segments']
+    xy = segments.reshape(-1, 2)
+    return np.repeat(floor['line_ids'], 2), xy
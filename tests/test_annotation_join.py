@@ -0,0 +1,40 @@
+import numpy as np
+
+import annotation_join
+import unit_filter
+
+SQUARE = [(0, 0), (10, 0), (10, 10), (0, 10)]
+RING = [[(0, 0), (4, 0), (4, 4), (0, 4)], [(1, 1), (3, 1), (3, 3), (1, 3)]]
+
+
+def overlap(polygon, boxes):
+    xy, ring_offsets, ring_polygon = unit_filter.pack_polygons([polygon])
+    boxes = np.array(boxes, dtype=float)
+    return annotation_join.overlap_areas(boxes, np.arange(len(boxes)), np.zeros(len(boxes), dtype=np.int64),
+                                         xy, ring_offsets, ring_polygon)
+
+
+def test_boxes_touching_edges_count_once():
+    boxes = [[0, 0, 10, 10], [2, 2, 10, 8], [0, 2, 5, 8], [-5, -5, 0, 5], [10, 0, 15, 5], [5, 5, 15, 15], [-5, -5, 15, 15]]
+    expected = [100, 48, 30, 0, 0, 25, 100]
+    np.testing.assert_allclose(overlap([SQUARE], boxes), expected)
+    np.testing.assert_allclose(overlap([SQUARE[::-1]], boxes), expected)
+
+
+def test_holes_are_subtracted_however_they_are_wound():
+    boxes = [[0, 0, 2, 2], [1.5, 1.5, 2.5, 2.5], [1, 1, 3, 3], [0, 0, 4, 4]]
+    for hole in (RING[1], RING[1][::-1]):
+        np.testing.assert_allclose(overlap([RING[0], hole], boxes), [3, 0, 0, 12])
+
+
+def test_join_picks_largest_overlap():
+    units = [[SQUARE], [[(10, 0), (20, 0), (20, 10), (10, 10)]]]
+    xy, ring_offsets, ring_polygon = unit_filter.pack_polygons(units)
+    # flush against the shared wall, mostly in the second unit, and a box in both halves alike
+    boxes = np.array([[9, 4, 14, 6], [0, 0, 10, 10], [9, 4, 11, 6], [30, 30, 31, 31]], dtype=float)
+    joined = annotation_join.join_annotations(boxes, xy, ring_offsets, ring_polygon, 2)
+    assert joined['unit'].tolist() == [1, 0, 0, -1]
+    np.testing.assert_allclose(joined['overlap'], [8, 100, 2, 0])
+    np.testing.assert_allclose(joined['share'], [0.8, 1, 0.5, 0])
+    assert joined['ambiguous'].tolist() == [False, False, True, False]
+    assert joined['unit_count'].tolist() == [2, 1]
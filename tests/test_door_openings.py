@@ -0,0 +1,47 @@
+import numpy as np
+
+import door_openings
+import unit_filter
+
+
+def square(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+def test_merge_and_subtract_intervals():
+    merged = door_openings.merge_intervals(np.array([1, 0, 0, 0]), np.array([0.1, 0.5, 0.1, 0.3]), np.array([0.2, 0.6, 0.3, 0.4]))
+    assert merged[0].tolist() == [0, 0, 1]
+    np.testing.assert_allclose(merged[1], [0.1, 0.5, 0.1])
+    np.testing.assert_allclose(merged[2], [0.4, 0.6, 0.2])
+    piece_edge, t0, t1 = door_openings.subtract_intervals(2, *merged)
+    assert piece_edge.tolist() == [0, 0, 0, 1, 1]
+    np.testing.assert_allclose(t0, [0, 0.4, 0.6, 0, 0.2])
+    np.testing.assert_allclose(t1, [0.1, 0.5, 1, 0.1, 1])
+
+
+def test_covered_intervals_within_tolerance():
+    edges = np.array([[0, 0, 4, 0], [4, 0, 4, 3]], dtype=float)
+    # along the first edge, 0.03 off it, and across it
+    doors = np.array([[1, 0.03, 2, 0.03], [3, 0, 3.8, 0.2], [4, 1, 4, 2]], dtype=float)
+    edge_ids, t0, t1 = door_openings.covered_intervals(edges, doors)
+    assert edge_ids.tolist() == [0, 1]
+    np.testing.assert_allclose(t0, [0.25, 1 / 3])
+    np.testing.assert_allclose(t1, [0.5, 2 / 3])
+
+
+def test_cut_openings_of_two_rooms():
+    xy, ring_offsets, ring_polygon = unit_filter.pack_polygons([[square(0, 0, 4, 3)], [square(4, 0, 8, 3)]])
+    # an outside door, one in the shared wall and two overlapping ones merged into one opening
+    doors = [[1, 0, 2, 0], [4, 1, 4, 2], [3, 3, 3.5, 3], [3.4, 3, 3.8, 3]]
+    paths = door_openings.cut_openings(xy, ring_offsets, ring_polygon, doors)
+    assert paths == [
+        [[[3.0, 3.0], [0.0, 3.0], [0.0, 0.0], [1.0, 0.0]], [[2.0, 0.0], [4.0, 0.0], [4.0, 1.0]], [[4.0, 2.0], [4.0, 3.0], [3.8, 3.0]]],
+        [[[4.0, 1.0], [4.0, 0.0], [8.0, 0.0], [8.0, 3.0], [4.0, 3.0], [4.0, 2.0]]],
+    ]
+
+
+def test_room_without_doors_is_one_closed_path():
+    xy, ring_offsets, ring_polygon = unit_filter.pack_polygons([[square(0, 0, 4, 3)]])
+    (path,), = door_openings.cut_openings(xy, ring_offsets, ring_polygon, np.empty((0, 4)))
+    assert path[0] == path[-1]
+    assert len(path) == 5
@@ -0,0 +1,25 @@
+import numpy as np
+
+import gap_repair
+
+
+def test_orthogonal_gaps_get_one_segment_others_two_legs():
+    from_xy = [(0, 0), (0, 0), (5, 5)]
+    near_xy = [(0.1, 0), (0.1, 0.05), (5, 4.85)]
+    extra = gap_repair.repair_gaps(from_xy, near_xy)
+    np.testing.assert_allclose(extra, [[0, 0, 0.1, 0], [0, 0, 0.1, 0], [0.1, 0, 0.1, 0.05], [5, 5, 5, 4.85]])
+
+
+def test_only_gaps_inside_the_window_are_repaired():
+    from_xy = np.zeros((4, 2))
+    near_xy = [(0.0005, 0), (0.2, 0), (0.5, 0), (0, 0.15)]
+    np.testing.assert_allclose(gap_repair.repair_gaps(from_xy, near_xy), [[0, 0, 0, 0.15]])
+
+
+def test_angles_and_xy_table():
+    angles = gap_repair.near_angles(np.zeros((4, 2)), np.array([(1, 0), (0, 1), (-1, 0), (1, 1)]))
+    np.testing.assert_allclose(angles, [0, 90, 180, 45])
+    assert gap_repair.is_orthogonal(angles).tolist() == [True, True, True, False]
+    table = gap_repair.to_xy_table([[0, 1, 2, 3]])
+    assert table.dtype.names == ('FROM_X', 'FROM_Y', 'NEAR_X', 'NEAR_Y')
+    assert table[0].tolist() == (0, 1, 2, 3)
@@ -0,0 +1,87 @@
+import json
+
+import indoors_loader
+
+SQUARE = [(0, 0), (10, 0), (10, 10), (0, 10)]
+ANNEX = [(20, 0), (30, 0), (30, 10), (20, 10)]
+# wound like the exterior, still a hole by nesting
+HOLE = [(2, 2), (4, 2), (4, 4), (2, 4)]
+
+
+def make_records(CAD_prefix, names=('101', '102')):
+    units = [[[(x, 0), (x + 5, 0), (x + 5, 5), (x, 5)]] for x in range(0, 5 * len(names), 5)]
+    return indoors_loader.floor_records(
+        CAD_prefix, [[SQUARE], [ANNEX]], units, list(names), ['Office'] * len(names),
+        [[[(0, 0), (10, 0)]], [[(0, 5), (10, 5)]]]
+    )
+
+
+def test_floor_records_ids_and_elevation():
+    for CAD_prefix, number in (('N01', 1), ('N02', 2), ('N03', 3)):
+        records = make_records(CAD_prefix)
+        level = records['Levels'][0]
+        assert level['FACILITY_ID'] == 'SAIT.N'
+        assert level['LEVEL_ID'] == f'SAIT.N.L{number}'
+        assert level['NAME'] == f'L{number}'
+        assert level['VERTICAL_ORDER'] == number - 1
+        assert level['ELEVATION_RELATIVE'] == (number - 1) * 5
+        assert all(unit['LEVEL_ID'] == level['LEVEL_ID'] for unit in records['Units'])
+        assert all(detail['z'] == (number - 1) * 5 for detail in records['Details'])
+
+
+def test_facility_only_on_first_floor():
+    assert [facility['FACILITY_ID'] for facility in make_records('N01')['Facilities']] == ['SAIT.N']
+    assert make_records('N02')['Facilities'] == []
+
+
+def test_load_floor_round_trip(tmp_path):
+    writer = indoors_loader.FileIndoorsWriter(str(tmp_path))
+    indoors_loader.load_floor(writer, make_records('N02'))
+
+    units = writer.read('Units')
+    assert [unit['NAME'] for unit in units] == ['101', '102']
+    assert units[1]['rings'] == [[[5.0, 0.0], [10.0, 0.0], [10.0, 5.0], [5.0, 5.0]]]
+    assert all(unit['z'] == 5.0 and unit['LEVEL_ID'] == 'SAIT.N.L2' for unit in units)
+    details = writer.read('Details')
+    assert [detail['paths'] for detail in details] == [[[[0.0, 0.0], [10.0, 0.0]]], [[[0.0, 5.0], [10.0, 5.0]]]]
+    assert writer.read('Facilities') == []
+
+
+def test_reload_replaces_only_the_floor(tmp_path):
+    writer = indoors_loader.FileIndoorsWriter(str(tmp_path))
+    indoors_loader.load_floor(writer, make_records('N01'))
+    indoors_loader.load_floor(writer, make_records('N02', ('201', '202', '203')))
+    indoors_loader.load_floor(writer, make_records('N01'))
+    indoors_loader.load_floor(writer, make_records('N01', ('105',)))
+
+    units = writer.read('Units')
+    assert sorted(unit['NAME'] for unit in units if unit['LEVEL_ID'] == 'SAIT.N.L1') == ['105']
+    assert sorted(unit['NAME'] for unit in units if unit['LEVEL_ID'] == 'SAIT.N.L2') == ['201', '202', '203']
+    assert sorted(level['LEVEL_ID'] for level in writer.read('Levels')) == ['SAIT.N.L1', 'SAIT.N.L2']
+    assert len(writer.read('Details')) == 4
+    assert len(writer.read('Facilities')) == 1
+
+
+def test_several_exterior_rings_make_a_multipolygon(tmp_path):
+    writer = indoors_loader.FileIndoorsWriter(str(tmp_path))
+    records = make_records('N01')
+    records['Units'][0]['rings'] = [SQUARE, HOLE]
+    indoors_loader.load_floor(writer, records)
+
+    with open(writer.path('Levels')) as f:
+        level_geometry = json.load(f)['features'][0]['geometry']
+    assert level_geometry['type'] == 'MultiPolygon'
+    assert [len(polygon) for polygon in level_geometry['coordinates']] == [1, 1]
+    with open(writer.path('Units')) as f:
+        unit_geometry = json.load(f)['features'][0]['geometry']
+    assert unit_geometry['type'] == 'Polygon'
+    assert len(unit_geometry['coordinates']) == 2
+    assert len(writer.read('Levels')[0]['rings']) == 2
+
+
+def test_group_rings_nesting():
+    island = [(2.5, 2.5), (3.5, 2.5), (3.5, 3.5), (2.5, 3.5)]
+    polygons = indoors_loader.group_rings([HOLE, SQUARE, ANNEX, island])
+    assert [[ring[0].tolist() for ring in polygon] for polygon in polygons] == [
+        [[0.0, 0.0], [2.0, 2.0]], [[20.0, 0.0]], [[2.5, 2.5]]
+    ]
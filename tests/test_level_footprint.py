@@ -0,0 +1,37 @@
+import numpy as np
+
+import level_footprint
+import unit_filter
+
+
+def square(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+def areas(footprint):
+    return unit_filter.polygon_metrics(*unit_filter.pack_polygons(footprint), len(footprint))['area']
+
+
+def test_gaps_up_to_the_distance_are_closed():
+    footprint = level_footprint.level_footprint([[square(0, 0, 4, 3)], [square(4.04, 0, 8, 3)]])
+    assert [len(polygon) for polygon in footprint] == [1]
+    np.testing.assert_allclose(areas(footprint), [24])
+
+
+def test_wider_gaps_stay_open():
+    footprint = level_footprint.level_footprint([[square(0, 0, 4, 3)], [square(4.1, 0, 8, 3)]])
+    np.testing.assert_allclose(sorted(areas(footprint)), [11.7, 12])
+
+
+def test_courtyard_is_kept_as_a_hole():
+    rooms = [[square(0, 0, 10, 2)], [square(0, 8, 10, 10)], [square(0, 2, 2, 8)], [square(8, 2, 10, 8)]]
+    footprint = level_footprint.level_footprint(rooms)
+    assert [len(polygon) for polygon in footprint] == [2]
+    np.testing.assert_allclose(areas(footprint), [64])
+    paths = level_footprint.outline_paths(footprint)
+    assert [len(rings) for rings in paths] == [2]
+    assert all((ring[0] == ring[-1]).all() for ring in paths[0])
+
+
+def test_no_polygons():
+    assert level_footprint.level_footprint([]) == []
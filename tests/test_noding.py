@@ -0,0 +1,39 @@
+import numpy as np
+
+import noding
+import polygonize
+
+# 4 x 3 room whose left wall, on another layer, stops 0.1 short of the corner
+ROOM = np.array([[0, 0, 4, 0], [4, 0, 4, 3], [4, 3, 0, 3], [0, 3, 0, 0.1]], dtype=float)
+
+
+def test_crossing_lines_are_split_and_duplicates_dropped():
+    segments = np.array([[0, 0, 2, 0], [1, -1, 1, 1], [2, 0, 0, 0]], dtype=float)
+    pieces, source = noding.node_segments(segments)
+    np.testing.assert_allclose(pieces, [[0, 0, 1, 0], [1, 0, 2, 0], [1, -1, 1, 0], [1, 0, 1, 1]])
+    assert source.tolist() == [0, 0, 1, 1]
+
+
+def test_line_ids_follow_layer_runs():
+    segments = np.array([[0, 0, 1, 0], [1, 0, 2, 0], [2, 0, 3, 0], [1, 0, 1, 1]], dtype=float)
+    # three walls meet at (1, 0), so the run ends there; the glazing starts another one
+    line_ids = noding.connected_line_ids(segments, np.array(['A-Wall', 'A-Wall', 'A-Glaz', 'A-Wall']))
+    assert len(set(line_ids.tolist())) == 4
+    line_ids = noding.connected_line_ids(segments[:3], np.array(['A-Wall', 'A-Wall', 'A-Glaz']))
+    assert line_ids[0] == line_ids[1] != line_ids[2]
+
+
+def test_gap_to_another_line_is_closed():
+    merged = noding.clean_linework(ROOM, np.array(['A-Wall'] * 3 + ['A-Glaz']))
+    faces = polygonize.polygonize(merged)
+    assert faces['n_polygons'] == 1
+    np.testing.assert_allclose(faces['area'], [12])
+    np.testing.assert_allclose(faces['perimeter'], [14])
+
+
+def test_gaps_within_one_line_or_too_wide_stay_open():
+    # the gap repair only snaps to lines of other runs, like the Near table against the other dissolved lines
+    assert polygonize.polygonize(noding.clean_linework(ROOM, np.array(['A-Wall'] * 4)))['n_polygons'] == 0
+    wide = ROOM.copy()
+    wide[3, 3] = 0.3
+    assert polygonize.polygonize(noding.clean_linework(wide, np.array(['A-Wall'] * 3 + ['A-Glaz'])))['n_polygons'] == 0
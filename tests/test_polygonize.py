@@ -0,0 +1,38 @@
+import numpy as np
+
+import noding
+import polygonize
+
+
+def box(x0, y0, x1, y1):
+    return [[x0, y0, x1, y0], [x1, y0, x1, y1], [x1, y1, x0, y1], [x0, y1, x0, y0]]
+
+
+def faces_of(segments):
+    return polygonize.polygonize(noding.node_segments(np.array(segments, dtype=float))[0])
+
+
+def test_partition_wall_splits_the_room_and_dangles_are_dropped():
+    faces = faces_of(box(0, 0, 4, 3) + [[2, 0, 2, 3], [4, 1.5, 6, 1.5]])
+    assert faces['n_polygons'] == 2
+    np.testing.assert_allclose(faces['area'], [6, 6])
+    np.testing.assert_allclose(faces['perimeter'], [10, 10])
+
+
+def test_separate_outline_becomes_a_hole():
+    faces = faces_of(box(0, 0, 10, 10) + box(2, 2, 4, 4))
+    assert faces['n_polygons'] == 2
+    assert faces['ring_polygon'].tolist() == [0, 0, 1]
+    np.testing.assert_allclose(faces['area'], [96, 4])
+    np.testing.assert_allclose(faces['perimeter'], [48, 8])
+    rings = list(polygonize.iter_polygons(faces))
+    assert [len(polygon) for polygon in rings] == [2, 1]
+    exterior, hole = rings[0]
+    cross = lambda ring: np.sum(ring[:, 0] * np.roll(ring[:, 1], -1) - np.roll(ring[:, 0], -1) * ring[:, 1])
+    assert cross(exterior) > 0 > cross(hole)
+
+
+def test_selected_polygons():
+    faces = faces_of(box(0, 0, 4, 3) + [[2, 0, 2, 3]])
+    (ring,), = polygonize.iter_polygons(faces, [1])
+    assert ring[:, 0].min() == 2 and ring[:, 0].max() == 4
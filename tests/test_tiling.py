@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import noding
+import polygonize
+import synthetic_floor
+import tiling
+import unit_filter
+
+
+def whole_floor_units(floor):
+    faces = polygonize.polygonize(noding.clean_linework(floor['segments'], floor['layers']))
+    keep, _ = unit_filter.classify_units(faces['xy'], faces['ring_offsets'], faces['ring_polygon'], faces['n_polygons'])
+    return faces, keep
+
+
+def kept_units(faces, keep):
+    # area and centroid of every kept unit, in a canonical order
+    metrics = unit_filter.polygon_metrics(faces['xy'], faces['ring_offsets'], faces['ring_polygon'], faces['n_polygons'])
+    kept = np.flatnonzero(keep)
+    return sorted(zip(*(np.round(values, 6).tolist() for values in (metrics['area'][kept], *metrics['centroid'][kept].T))))
+
+
+def test_rooms_without_doors_are_the_units():
+    floor = synthetic_floor.generate_floor(30, door_fraction=0, column_fraction=0, seed=1)
+    faces, keep = whole_floor_units(floor)
+    rooms = floor['rooms']
+    # the repaired gaps shift a corner by up to the gap width
+    room_areas = (rooms[:, 2] - rooms[:, 0]) * (rooms[:, 3] - rooms[:, 1])
+    assert keep.sum() == len(rooms)
+    np.testing.assert_allclose(sorted(faces['area'][keep]), sorted(room_areas), atol=0.05)
+
+
+@pytest.mark.parametrize('tile_size', [8.0, 15.0, 25.0])
+@pytest.mark.parametrize('options', [{'door_fraction': 0, 'column_fraction': 0, 'seed': 1}, {'seed': 3}])
+def test_tiled_units_match_the_whole_floor(tile_size, options):
+    floor = synthetic_floor.generate_floor(60, **options)
+    faces, keep = whole_floor_units(floor)
+    tile_faces, tile_keep = tiling.tiled_units(floor['segments'], floor['layers'], tile_size, workers=2)
+    assert tile_faces['n_polygons'] == faces['n_polygons']
+    assert kept_units(tile_faces, tile_keep) == kept_units(faces, keep)
+
+
+def test_tile_boxes_cover_the_bounds():
+    boxes, origin = tiling.tile_boxes([5, 0, 30, 10], 10)
+    np.testing.assert_allclose(boxes, [[5, 0, 15, 10], [15, 0, 25, 10], [25, 0, 35, 10]])
+    assert origin.tolist() == [5, 0]
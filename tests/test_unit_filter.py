@@ -0,0 +1,44 @@
+import numpy as np
+
+import unit_filter
+
+
+def square(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+L_SHAPE = [(0, 0), (6, 0), (6, 1), (1, 1), (1, 6), (0, 6)]
+POLYGONS = [
+    [square(0, 0, 4, 3)],
+    # below the minimum area
+    [square(0, 0, 1, 1)],
+    # narrower than the minimum extent
+    [square(0, 0, 10, 0.5)],
+    # centroid outside and too small to be kept anyway
+    [L_SHAPE],
+    # hole wound against the exterior, as polygonize packs them
+    [square(0, 0, 10, 10), square(2, 2, 4, 4)[::-1]],
+]
+
+
+def test_metrics():
+    metrics = unit_filter.polygon_metrics(*unit_filter.pack_polygons(POLYGONS), len(POLYGONS))
+    np.testing.assert_allclose(metrics['area'], [12, 1, 5, 11, 96])
+    np.testing.assert_allclose(metrics['perimeter'], [14, 4, 21, 24, 48])
+    np.testing.assert_allclose(metrics['x_extent'], [4, 1, 10, 6, 10])
+    np.testing.assert_allclose(metrics['centroid'][[0, 2, 3]], [[2, 1.5], [5, 0.25], [41 / 22, 41 / 22]])
+    np.testing.assert_allclose(metrics['centroid'][4], [61 / 12, 61 / 12])
+
+
+def test_classify_units():
+    keep, metrics = unit_filter.classify_units(*unit_filter.pack_polygons(POLYGONS), len(POLYGONS))
+    assert keep.tolist() == [True, False, False, False, True]
+    assert metrics['contains_centroid'].tolist() == [True, True, True, False, True]
+
+
+def test_large_room_kept_without_its_centroid():
+    # a 60 m2 L shaped room whose centroid is in the notch
+    large_l = [(0, 0), (20, 0), (20, 2), (2, 2), (2, 13), (0, 13)]
+    keep, metrics = unit_filter.classify_units(*unit_filter.pack_polygons([[large_l]]))
+    assert not metrics['contains_centroid'][0]
+    assert keep.tolist() == [True]
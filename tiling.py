@@ -0,0 +1,181 @@
+# spatially tiled unit cleaning for very large floors, pure numpy
+# the linework is cut into square tiles with an overlapping margin, every tile is noded, gap repaired, polygonized
+# and classified on its own (side by side on a thread pool), so the noding pairs, near tables and half-edge arrays
+# only ever hold the tiles being worked on
+# a face is taken by the tile owning the lower left corner of its bounds, and only when it lies within that tile's
+# margin; the decision depends on the face alone, so tiles agree on it without seeing each other's results.
+# faces reaching past the margin are resolved at the seams: every tile passes on its cleaned lines inside its own
+# core except those between two taken faces, and these are polygonized once more for the faces left over
+
+import concurrent.futures
+
+import numpy as np
+
+import gap_repair
+import level_footprint
+import noding
+import polygonize
+import spatial_index
+import unit_filter
+
+# overlap around every tile, faces smaller than this are resolved inside a tile
+TILE_MARGIN = 10.0
+# lines near the outer cut miss their gap repair and intersection partners beyond it, faces keep this far away
+CUT_GUARD = 2 * gap_repair.GAP_MAX_DIST
+SNAP_TOLERANCE = polygonize.SNAP_TOLERANCE
+
+def tile_boxes(bounds, tile_size):
+    # (k, 4) core boxes of a grid of tile_size squares covering the bounds, and the grid origin
+    xmin, ymin, xmax, ymax = bounds
+    cols = max(1, int(np.ceil((xmax - xmin) / tile_size)))
+    rows = max(1, int(np.ceil((ymax - ymin) / tile_size)))
+    col, row = np.meshgrid(np.arange(cols), np.arange(rows), indexing='ij')
+    x0 = xmin + col.ravel() * tile_size
+    y0 = ymin + row.ravel() * tile_size
+    return np.column_stack((x0, y0, x0 + tile_size, y0 + tile_size)), np.array([xmin, ymin])
+
+def clip_segments(segments, box):
+    # parts of the segments inside the box (Liang-Barsky) and the row every part came from
+    segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+    a, b = segments[:, :2], segments[:, 2:]
+    d = b - a
+    t0, t1 = np.zeros(len(segments)), np.ones(len(segments))
+    for axis, low, high in ((0, box[0], box[2]), (1, box[1], box[3])):
+        parallel = d[:, axis] == 0
+        inside = (a[:, axis] >= low) & (a[:, axis] <= high)
+        step = np.where(parallel, 1.0, d[:, axis])
+        ta, tb = (low - a[:, axis]) / step, (high - a[:, axis]) / step
+        t0 = np.maximum(t0, np.where(parallel, np.where(inside, 0.0, np.inf), np.minimum(ta, tb)))
+        t1 = np.minimum(t1, np.where(parallel, np.where(inside, 1.0, -np.inf), np.maximum(ta, tb)))
+    keep = np.flatnonzero(t1 > t0)
+    t0, t1 = t0[keep, None], t1[keep, None]
+    # end points that are not cut stay bit for bit the same
+    start = np.where(t0 == 0.0, a[keep], a[keep] + t0 * d[keep])
+    end = np.where(t1 == 1.0, b[keep], a[keep] + t1 * d[keep])
+    return np.hstack((start, end)), keep
+
+def face_bounds(faces, tolerance=SNAP_TOLERANCE):
+    # bounds of every face in snap cells, the same in every tile that traces the face
+    # (a node lies in the same cell whichever of its points became the node)
+    xy, ring_offsets, ring_polygon = faces['xy'], faces['ring_offsets'], faces['ring_polygon']
+    cells = np.round(xy / tolerance)
+    vertex_polygon = np.repeat(ring_polygon, np.diff(ring_offsets))
+    bounds = np.full((faces['n_polygons'], 4), [np.inf, np.inf, -np.inf, -np.inf])
+    for column, reduce, coordinate in ((0, np.minimum, 0), (1, np.minimum, 1), (2, np.maximum, 0), (3, np.maximum, 1)):
+        reduce.at(bounds[:, column], vertex_polygon, cells[:, coordinate])
+    return bounds * tolerance
+
+def within(bounds, box):
+    return (bounds[:, 0] >= box[0]) & (bounds[:, 1] >= box[1]) & (bounds[:, 2] <= box[2]) & (bounds[:, 3] <= box[3])
+
+def select_polygons(polygons, indices):
+    # packed polygons of the selected indices, renumbered from 0 in the given order
+    xy, ring_offsets, ring_polygon = polygons['xy'], polygons['ring_offsets'], polygons['ring_polygon']
+    first_ring = np.searchsorted(ring_polygon, np.arange(polygons['n_polygons'] + 1), 'left')
+    ring_counts = first_ring[indices + 1] - first_ring[indices]
+    rings = spatial_index.expand_ranges(first_ring[indices], ring_counts)
+    ring_sizes = np.diff(ring_offsets)[rings]
+    return {
+        'xy': xy[spatial_index.expand_ranges(ring_offsets[rings], ring_sizes)],
+        'ring_offsets': np.concatenate(([0], np.cumsum(ring_sizes))).astype(np.int64),
+        'ring_polygon': np.repeat(np.arange(len(indices)), ring_counts),
+        'n_polygons': len(indices),
+        'area': polygons['area'][indices],
+        'perimeter': polygons['perimeter'][indices],
+    }
+
+def concat_polygons(parts):
+    # packed polygons of all parts one after the other
+    ring_shift = np.cumsum([0] + [len(part['xy']) for part in parts])
+    polygon_shift = np.cumsum([0] + [part['n_polygons'] for part in parts])
+    return {
+        'xy': np.concatenate([part['xy'] for part in parts] + [np.empty((0, 2))]),
+        'ring_offsets': np.concatenate([[0]] + [part['ring_offsets'][1:] + shift for part, shift in zip(parts, ring_shift)]).astype(np.int64),
+        'ring_polygon': np.concatenate([part['ring_polygon'] + shift for part, shift in zip(parts, polygon_shift)] + [np.empty(0, dtype=np.int64)]).astype(np.int64),
+        'n_polygons': int(polygon_shift[-1]),
+        'area': np.concatenate([part['area'] for part in parts] + [np.empty(0)]),
+        'perimeter': np.concatenate([part['perimeter'] for part in parts] + [np.empty(0)]),
+    }
+
+def inside_any(points, polygons, indices):
+    # whether every point lies inside one of the selected polygons
+    inside = np.zeros(len(points), dtype=bool)
+    if len(points) and len(indices):
+        selected = select_polygons(polygons, indices)
+        point_ids, _ = level_footprint.containing_polygons(
+            points, selected['xy'], selected['ring_offsets'], selected['ring_polygon'], selected['n_polygons'])
+        inside[point_ids] = True
+    return inside
+
+class TileGrid:
+    # core boxes of tile_size squares over the linework, each processed with the margin around it
+
+    def __init__(self, segments, tile_size, margin=TILE_MARGIN, guard=CUT_GUARD):
+        self.segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+        self.tile_size = float(tile_size)
+        self.margin = float(margin)
+        self.guard = float(guard)
+        bounds = spatial_index.segment_bounds(self.segments)
+        self.cores, self.origin = tile_boxes(
+            np.concatenate((bounds[:, :2].min(axis=0), bounds[:, 2:].max(axis=0))), self.tile_size)
+        self.tree = spatial_index.STRTree(bounds)
+
+    def owner(self, corner):
+        # core box of the tile owning each lower left corner
+        x0 = self.origin + np.floor((corner - self.origin) / self.tile_size) * self.tile_size
+        return np.hstack((x0, x0 + self.tile_size))
+
+    def taken(self, bounds):
+        # faces lying within the margin of the tile owning them, minus the guard at the cut
+        reach = self.margin - self.guard
+        owner = self.owner(bounds[:, :2]) + [-reach, -reach, reach, reach]
+        return (bounds[:, 0] >= owner[:, 0]) & (bounds[:, 1] >= owner[:, 1]) & (bounds[:, 2] <= owner[:, 2]) & (bounds[:, 3] <= owner[:, 3])
+
+    def process(self, tile, layers, tolerance=SNAP_TOLERANCE):
+        # the faces taken by one tile with their keep flags, and its cleaned lines left for the seams
+        core = self.cores[tile]
+        halo = core + [-self.margin, -self.margin, self.margin, self.margin]
+        _, rows = self.tree.query(halo[None])
+        clipped, source = clip_segments(self.segments[rows], halo)
+        empty = select_polygons(polygonize.polygonize(np.empty((0, 4))), np.empty(0, dtype=np.int64))
+        if not len(clipped):
+            return empty, np.empty(0, dtype=bool), np.empty((0, 4))
+        cleaned = noding.clean_linework(clipped, np.asarray(layers)[rows[source]], tolerance)
+        faces = polygonize.polygonize(cleaned, tolerance)
+        keep, _ = unit_filter.classify_units(faces['xy'], faces['ring_offsets'], faces['ring_polygon'], faces['n_polygons'])
+
+        # faces this tile traces in full, and which of them the tiles owning them take
+        bounds = face_bounds(faces, tolerance)
+        reach = self.margin - self.guard
+        seen = within(bounds, core + [-reach, -reach, reach, reach])
+        taken = seen & self.taken(bounds)
+        own = taken & np.all(self.owner(bounds[:, :2]) == core, axis=1)
+
+        # lines of the core with a taken face on both sides are inside the taken area and drop out
+        seam_lines, _ = clip_segments(cleaned, core)
+        a, b = seam_lines[:, :2], seam_lines[:, 2:]
+        taken_ids = np.flatnonzero(taken)
+        left = inside_any(level_footprint.left_points(a, b, tolerance / 2), faces, taken_ids)
+        right = inside_any(level_footprint.left_points(b, a, tolerance / 2), faces, taken_ids)
+        own_ids = np.flatnonzero(own)
+        return select_polygons(faces, own_ids), keep[own_ids], seam_lines[~(left & right)]
+
+def tiled_units(segments, layers, tile_size, margin=TILE_MARGIN, workers=None, tolerance=SNAP_TOLERANCE):
+    # the native create_unit linework, polygon and filter stages tile by tile; returns packed faces and keep flags
+    # like polygonize and classify_units over the whole floor
+    segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+    if not len(segments):
+        return select_polygons(polygonize.polygonize(segments), np.empty(0, dtype=np.int64)), np.empty(0, dtype=bool)
+    grid = TileGrid(segments, tile_size, margin)
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(lambda tile: grid.process(tile, layers, tolerance), range(len(grid.cores))))
+    tile_faces = concat_polygons([faces for faces, _, _ in results])
+    tile_keep = np.concatenate([keep for _, keep, _ in results])
+
+    # faces past the margin: traced from the seam lines, the areas of the taken faces come out as extra faces
+    seam = polygonize.polygonize(np.concatenate([lines for _, _, lines in results]), tolerance)
+    points = level_footprint.face_points(seam, tolerance) if seam['n_polygons'] else np.empty((0, 2))
+    left_over = np.flatnonzero(~inside_any(points, tile_faces, np.arange(tile_faces['n_polygons'])))
+    seam_faces = select_polygons(seam, left_over)
+    seam_keep, _ = unit_filter.classify_units(seam_faces['xy'], seam_faces['ring_offsets'], seam_faces['ring_polygon'], seam_faces['n_polygons'])
+    return concat_polygons([tile_faces, seam_faces]), np.concatenate((tile_keep, seam_keep))
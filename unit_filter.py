@@ -0,0 +1,115 @@
+# single pass polygon metrics and unit classification over packed coordinate arrays, pure numpy
+# replaces the metric UpdateCursor, Unfiltered_Units export, FeatureToPoint and the layer selections in create_unit
+
+import numpy as np
+
+# thresholds of the unit filter in create_unit
+MIN_AREA = 1.8
+MIN_EXTENT = 0.8
+MIN_AREA_LENGTH_RATIO = 0.2
+# polygons that do not contain their own centroid are kept only if they are large and compact enough
+LARGE_AREA = 20.0
+LARGE_AREA_LENGTH_RATIO = 0.3
+
+def pack_polygons(polygons):
+    # polygons: list of polygons, each a list of rings, each ring a sequence of (x, y) (closed or not)
+    # returns xy (n, 2), ring_offsets (r + 1,) into xy and ring_polygon (r,) polygon index of every ring
+    rings, ring_polygon = [], []
+    for polygon_index, polygon in enumerate(polygons):
+        for ring in polygon:
+            ring = np.asarray(ring, dtype=float).reshape(-1, 2)
+            if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+                ring = ring[:-1]
+            rings.append(ring)
+            ring_polygon.append(polygon_index)
+    ring_sizes = [len(ring) for ring in rings]
+    xy = np.concatenate(rings) if rings else np.empty((0, 2))
+    ring_offsets = np.concatenate(([0], np.cumsum(ring_sizes))).astype(np.int64)
+    return xy, ring_offsets, np.asarray(ring_polygon, dtype=np.int64)
+
+def ring_edges(xy, ring_offsets):
+    # start and end point of every ring edge, including the closing edge, and the ring of each edge
+    ring_sizes = np.diff(ring_offsets)
+    ring_of_vertex = np.repeat(np.arange(len(ring_sizes)), ring_sizes)
+    next_vertex = np.arange(len(xy)) + 1
+    last = ring_offsets[1:] - 1
+    next_vertex[last[ring_sizes > 0]] = ring_offsets[:-1][ring_sizes > 0]
+    return xy, xy[next_vertex], ring_of_vertex
+
+def polygon_metrics(xy, ring_offsets, ring_polygon, n_polygons=None):
+    # area (holes subtracted), perimeter (all rings), extent width/height, area/length ratio and centroid
+    n_polygons = int(ring_polygon.max()) + 1 if n_polygons is None and len(ring_polygon) else (n_polygons or 0)
+    a, b, edge_ring = ring_edges(xy, ring_offsets)
+    edge_polygon = ring_polygon[edge_ring]
+    n_rings = len(ring_polygon)
+
+    cross = a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1]
+    ring_signed_area = np.bincount(edge_ring, cross, minlength=n_rings) / 2
+    ring_moment_x = np.bincount(edge_ring, (a[:, 0] + b[:, 0]) * cross, minlength=n_rings) / 6
+    ring_moment_y = np.bincount(edge_ring, (a[:, 1] + b[:, 1]) * cross, minlength=n_rings) / 6
+
+    # the largest ring of a polygon is its exterior, rings wound the other way are holes
+    exterior_sign = np.zeros(n_polygons)
+    largest = np.zeros(n_polygons)
+    np.maximum.at(largest, ring_polygon, np.abs(ring_signed_area))
+    is_largest = np.abs(ring_signed_area) == largest[ring_polygon]
+    exterior_sign[ring_polygon[is_largest]] = np.sign(ring_signed_area[is_largest])
+    ring_sign = np.where(np.sign(ring_signed_area) == exterior_sign[ring_polygon], 1.0, -1.0)
+    ring_orientation = np.where(ring_signed_area < 0, -1.0, 1.0)
+
+    area = np.bincount(ring_polygon, ring_sign * np.abs(ring_signed_area), minlength=n_polygons)
+    moment_x = np.bincount(ring_polygon, ring_sign * ring_orientation * ring_moment_x, minlength=n_polygons)
+    moment_y = np.bincount(ring_polygon, ring_sign * ring_orientation * ring_moment_y, minlength=n_polygons)
+    safe_area = np.where(area != 0, area, 1.0)
+    centroid = np.column_stack((moment_x / safe_area, moment_y / safe_area))
+
+    edge_length = np.hypot(*(b - a).T)
+    perimeter = np.bincount(edge_polygon, edge_length, minlength=n_polygons)
+
+    xmin = np.full(n_polygons, np.inf)
+    ymin = np.full(n_polygons, np.inf)
+    xmax = np.full(n_polygons, -np.inf)
+    ymax = np.full(n_polygons, -np.inf)
+    vertex_polygon = edge_polygon
+    np.minimum.at(xmin, vertex_polygon, xy[:, 0])
+    np.minimum.at(ymin, vertex_polygon, xy[:, 1])
+    np.maximum.at(xmax, vertex_polygon, xy[:, 0])
+    np.maximum.at(ymax, vertex_polygon, xy[:, 1])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        area_length_ratio = np.where(perimeter > 0, area / perimeter, np.nan)
+    return {
+        'area': area,
+        'perimeter': perimeter,
+        'x_extent': xmax - xmin,
+        'y_extent': ymax - ymin,
+        'area_length_ratio': area_length_ratio,
+        'centroid': centroid,
+    }
+
+def points_in_polygons(points, xy, ring_offsets, ring_polygon, n_polygons):
+    # even-odd test of points[i] against polygon i, holes count as outside
+    a, b, edge_ring = ring_edges(xy, ring_offsets)
+    edge_polygon = ring_polygon[edge_ring]
+    p = points[edge_polygon]
+    straddles = (a[:, 1] > p[:, 1]) != (b[:, 1] > p[:, 1])
+    dy = np.where(straddles, b[:, 1] - a[:, 1], 1.0)
+    x_cross = a[:, 0] + (p[:, 1] - a[:, 1]) * (b[:, 0] - a[:, 0]) / dy
+    crossings = straddles & (p[:, 0] < x_cross)
+    return np.bincount(edge_polygon, crossings, minlength=n_polygons) % 2 == 1
+
+def classify_units(xy, ring_offsets, ring_polygon, n_polygons=None):
+    # keep mask of the final units plus the metrics it was computed from
+    n_polygons = int(ring_polygon.max()) + 1 if n_polygons is None and len(ring_polygon) else (n_polygons or 0)
+    metrics = polygon_metrics(xy, ring_offsets, ring_polygon, n_polygons)
+    contains_centroid = points_in_polygons(metrics['centroid'], xy, ring_offsets, ring_polygon, n_polygons)
+    area, ratio = metrics['area'], np.nan_to_num(metrics['area_length_ratio'])
+    candidate = (
+        (area > MIN_AREA)
+        & (metrics['x_extent'] > MIN_EXTENT)
+        & (metrics['y_extent'] > MIN_EXTENT)
+        & (ratio > MIN_AREA_LENGTH_RATIO)
+    )
+    keep = candidate & (contains_centroid | ((area > LARGE_AREA) & (ratio > LARGE_AREA_LENGTH_RATIO)))
+    metrics['contains_centroid'] = contains_centroid
+    return keep, metrics
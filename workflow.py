@@ -0,0 +1,75 @@
+# named pipeline steps with declared inputs and outputs, run as a DAG in dependency order
+# a step runs after the steps producing its inputs are done; a failed step marks everything downstream
+# of it as skipped instead of letting it run against missing inputs, independent branches carry on
+
+import time
+
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+class Step:
+    # func() takes no arguments and raises on failure; inputs nobody in the workflow produces must already exist
+
+    def __init__(self, name, func, inputs=(), outputs=(), message=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.message = message or name
+
+def dependencies(steps):
+    # step name -> names of the steps producing its inputs
+    producers = {}
+    for step in steps:
+        for output in step.outputs:
+            if output in producers:
+                raise ValueError(f'{output} is produced by both {producers[output]} and {step.name}')
+            producers[output] = step.name
+    return {step.name: sorted({producers[name] for name in step.inputs if name in producers}) for step in steps}
+
+def topological_order(steps):
+    # steps ordered so every step comes after the steps it depends on, stable for independent steps
+    depends = dependencies(steps)
+    ordered, placed = [], set()
+    remaining = list(steps)
+    while remaining:
+        ready = [step for step in remaining if all(name in placed for name in depends[step.name])]
+        if not ready:
+            raise ValueError('steps depend on each other in a cycle: ' + ', '.join(step.name for step in remaining))
+        ordered.extend(ready)
+        placed.update(step.name for step in ready)
+        remaining = [step for step in remaining if step.name not in placed]
+    return ordered
+
+def run_steps(steps, on_start=None, on_error=None, on_skip=None):
+    # run the steps one after the other in dependency order on the calling thread, geoprocessing tools are not
+    # thread safe; returns {step name: {'status': done | failed | skipped, 'duration': s}}
+    # on_start(step), on_error(step, exception) and on_skip(step, failed_dependencies) report progress
+    depends = dependencies(steps)
+    results = {}
+    for step in topological_order(steps):
+        failed = [name for name in depends[step.name] if results[name]['status'] != DONE]
+        if failed:
+            results[step.name] = {'status': SKIPPED, 'duration': 0.0}
+            if on_skip:
+                on_skip(step, failed)
+            continue
+        if on_start:
+            on_start(step)
+        error, duration = _timed(step.func)
+        results[step.name] = {'status': FAILED if error else DONE, 'duration': duration}
+        if error and on_error:
+            on_error(step, error)
+    return results
+
+def _timed(func):
+    started = time.perf_counter()
+    try:
+        func()
+        return None, time.perf_counter() - started
+    except Exception as e:
+        return e, time.perf_counter() - started
+
+def failed_steps(results):
+    return [name for name, result in results.items() if result['status'] != DONE]